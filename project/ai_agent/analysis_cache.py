@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ttl_cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def input_fingerprint(inputs: Dict[str, Any]) -> str:
+    """SHA-256 of the canonical JSON of an analysis's inputs; key order does not matter"""
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    AI contribution analyses by the fingerprint of their inputs.
+
+    The fingerprint is taken over freshly collected inputs on every
+    analysis, so a write that changes any input changes the fingerprint and
+    the old analysis is never served for it. Lookups go to an in-process
+    LRU first and then to the stored analyses through `load`, which lets
+    every worker process reuse an analysis any of them produced.
+    """
+
+    def __init__(self, load: Callable[[str, str, str], Optional[str]], ttl: float = 3600.0,
+                 max_entries: int = 1000):
+        """
+        Args:
+            load: Function (group_id, assignment_id, fingerprint) returning the AI analysis
+                text stored for that fingerprint, or None
+            ttl: Seconds an analysis is kept in process
+            max_entries: Analyses kept in process before LRU eviction, 0 disables the cache
+                including the stored-analysis lookup
+        """
+        self.load = load
+        self.enabled = max_entries > 0
+        self._analyses = TTLCache(ttl=ttl, max_entries=max(max_entries, 1))
+        self._lock = threading.Lock()
+        self.stored_hits = 0
+        self.bypassed = 0
+        self.load_errors = 0
+
+    @staticmethod
+    def _key(group_id, assignment_id, fingerprint: str) -> Tuple[str, str, str]:
+        return str(group_id), str(assignment_id), fingerprint
+
+    def get(self, group_id, assignment_id, fingerprint: str, refresh: bool = False) -> Tuple[Optional[str], Optional[str]]:
+        """
+        The analysis text for a fingerprint and where it came from.
+
+        Returns:
+            Tuple of (text, "memory" or "database"), or (None, None) on a miss
+            or when refresh is set
+        """
+        if not self.enabled:
+            return None, None
+        if refresh:
+            with self._lock:
+                self.bypassed += 1
+            return None, None
+        key = self._key(group_id, assignment_id, fingerprint)
+        text = self._analyses.get(key)
+        if text is not MISSING:
+            return text, "memory"
+        try:
+            text = self.load(*key)
+        except Exception as e:
+            # A failed lookup only costs a fresh analysis
+            logger.exception("Error loading stored analysis %s: %s", fingerprint, e)
+            with self._lock:
+                self.load_errors += 1
+            return None, None
+        if text is None:
+            return None, None
+        self._analyses.set(key, text)
+        with self._lock:
+            self.stored_hits += 1
+        return text, "database"
+
+    def set(self, group_id, assignment_id, fingerprint: str, text: str) -> None:
+        if self.enabled:
+            self._analyses.set(self._key(group_id, assignment_id, fingerprint), text)
+
+    def clear(self) -> None:
+        self._analyses.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._analyses.stats()
+        with self._lock:
+            stats.update({"enabled": self.enabled, "stored_hits": self.stored_hits,
+                          "bypassed": self.bypassed, "load_errors": self.load_errors})
+        return stats
@@ -0,0 +1,60 @@
+"""
+Analyze every group of a course for one assignment.
+
+Calls the peer review service's cohort endpoint and prints its events as
+they arrive, one JSON object per line with --json, otherwise as a
+progress line per group.
+
+Usage:
+    python analyze_cohort.py COMP9900 1
+    python analyze_cohort.py COMP9900 1 --url http://localhost:5003 --json > results.jsonl
+"""
+import argparse
+import json
+import sys
+
+import httpx
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Contribution analysis of every group of a course")
+    parser.add_argument("course_code")
+    parser.add_argument("assignment_id")
+    parser.add_argument("--url", default="http://localhost:5003", help="Peer review service")
+    parser.add_argument("--json", action="store_true", help="Print the raw events as JSON lines")
+    args = parser.parse_args()
+
+    failed = 0
+    body = {"course_code": args.course_code, "assignment_id": args.assignment_id}
+    # No read timeout: the AI analyses of a large cohort take minutes
+    with httpx.stream("POST", f"{args.url}/api/peer-reviews/analyze/cohort", json=body,
+                      timeout=httpx.Timeout(10.0, read=None)) as response:
+        if response.status_code != 200:
+            response.read()
+            sys.exit(f"Error {response.status_code}: {response.text}")
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if args.json:
+                print(line, flush=True)
+            elif event["event"] == "started":
+                print(f"Analyzing {event['groups']} groups of {event['course_code']} "
+                      f"(data loaded in {event['prefetch_ms']} ms)", flush=True)
+            elif event["event"] == "group":
+                scores = event["data"]["analysis"]["average_scores"]
+                print(f"[{event['done']}/{event['total']}] group {event['group_id']}: {scores}", flush=True)
+            elif event["event"] == "group_failed":
+                print(f"[{event['done']}/{event['total']}] group {event['group_id']} failed: {event['error']}",
+                      flush=True)
+            elif event["event"] == "error":
+                print(f"Error: {event['message']}", flush=True)
+            elif event["event"] == "finished":
+                print(f"Done: {event['succeeded']} succeeded, {event['failed']} failed "
+                      f"in {event['total_ms'] / 1000:.1f}s", flush=True)
+            failed += event["event"] in ("group_failed", "error")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import asyncio
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Sentinel put on the queue to stop one worker
+_STOP = object()
+
+
+def _spawn_thread(target: Callable, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+class AssistantJobQueue:
+    """
+    Bounded job queue drained by a fixed pool of background workers.
+
+    Used to run @assistant replies outside the HTTP request: the route
+    submits a job and returns, a worker calls `handler(job)` later.
+    Workers are started on the first submit.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], None], workers: int = 4,
+                 max_queue: int = 100, spawn: Optional[Callable] = None):
+        """
+        Args:
+            handler: Function called with each submitted job
+            workers: Number of jobs processed concurrently
+            max_queue: Number of jobs allowed to wait before submit() rejects new ones
+            spawn: Function (target, *args) that starts a background task,
+                e.g. socketio.start_background_task. Defaults to a daemon thread
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self._spawn = spawn or _spawn_thread
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopping = False
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.workers):
+            self._spawn(self._worker)
+
+    def submit(self, job: Dict[str, Any]) -> bool:
+        """
+        Queue a job for a background worker.
+
+        Returns:
+            True if the job was queued, False if the queue is full or shutting down
+        """
+        if self._stopping:
+            with self._lock:
+                self._rejected += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                self._queue.task_done()
+                return
+            with self._lock:
+                self._in_flight += 1
+            started = time.monotonic()
+            succeeded = False
+            try:
+                self.handler(job)
+                succeeded = True
+            except Exception as e:
+                print(f"Error processing assistant job: {str(e)}")
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._total_seconds += time.monotonic() - started
+                    if succeeded:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+                self._queue.task_done()
+
+    def join(self) -> None:
+        """Block until every queued job has been processed"""
+        self._queue.join()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting jobs and stop the workers once the queue is drained.
+
+        Args:
+            wait: Block until the already queued jobs have been processed
+        """
+        self._stopping = True
+        if not self._started:
+            return
+        for _ in range(self.workers):
+            # Blocking put: the stop markers queue up behind the pending jobs
+            self._queue.put(_STOP)
+        if wait:
+            self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue depth, in-flight jobs and counters"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_job_seconds": round(self._total_seconds / finished, 3) if finished else 0.0,
+            }
+
+
+class AsyncAssistantJobQueue:
+    """
+    AssistantJobQueue for an asyncio event loop.
+
+    `handler` is a coroutine function; `workers` jobs run concurrently as
+    tasks on the running loop, so their I/O waits overlap without a thread
+    per job. Workers are started on the first submit.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], Awaitable[None]], workers: int = 4,
+                 max_queue: int = 100):
+        """
+        Args:
+            handler: Coroutine function called with each submitted job
+            workers: Number of jobs processed concurrently
+            max_queue: Number of jobs allowed to wait before submit() rejects new ones
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._queue is None:
+            # Created here so the queue belongs to the loop that serves requests
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self._queue
+
+    def submit(self, job: Dict[str, Any]) -> bool:
+        """
+        Queue a job for a worker task. Must be called on the event loop.
+
+        Returns:
+            True if the job was queued, False if the queue is full or shutting down
+        """
+        if self._stopping:
+            self._rejected += 1
+            return False
+        try:
+            self._ensure_started().put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self._rejected += 1
+            return False
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            if job is _STOP:
+                self._queue.task_done()
+                return
+            self._in_flight += 1
+            started = time.monotonic()
+            succeeded = False
+            try:
+                await self.handler(job)
+                succeeded = True
+            except Exception as e:
+                print(f"Error processing assistant job: {str(e)}")
+                traceback.print_exc()
+            finally:
+                self._in_flight -= 1
+                self._total_seconds += time.monotonic() - started
+                if succeeded:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every queued job has been processed"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop accepting jobs and stop the workers once the queue is drained.
+
+        Args:
+            wait: Wait until the already queued jobs have been processed
+        """
+        self._stopping = True
+        if self._queue is None:
+            return
+        for _ in range(self.workers):
+            await self._queue.put(_STOP)
+        if wait:
+            await asyncio.gather(*self._tasks)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue depth, in-flight jobs and counters"""
+        finished = self._completed + self._failed
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "avg_job_seconds": round(self._total_seconds / finished, 3) if finished else 0.0,
+        }
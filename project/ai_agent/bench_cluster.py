@@ -0,0 +1,130 @@
+"""
+Benchmark Socket.IO broadcast throughput against the number of worker processes.
+
+For each worker count, starts a cluster (local broker + workers), connects
+--clients Socket.IO clients spread over the workers and joined to one room,
+and has every client send messages through the `send_message` event for
+--duration seconds. Reports broadcast deliveries per second. Run the client
+side on its own cores (or another host) so it is not the bottleneck.
+
+The send_message path does not touch the database, but channel_service.py
+still needs SUPABASE_URL/SUPABASE_KEY/OPENAI_API_KEY set; placeholders
+are filled in when they are missing.
+
+Usage:
+    python bench_cluster.py --workers 1,2,4 --clients 64 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+
+from run_cluster import start_workers, stop_workers
+from socketio_backend import UnixSocketBroker
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Worker on port {port} did not start")
+
+
+def client_process(ports, clients: int, duration: float, interval: float, start_at: float, results) -> None:
+    """Connect `clients` clients round-robin over `ports`, send for `duration` seconds, count deliveries"""
+    import socketio
+
+    received = [0]
+    sent = 0
+    connections = []
+    for i in range(clients):
+        sio = socketio.Client(reconnection=False)
+
+        def on_new_message(data):
+            received[0] += 1
+
+        sio.on("new_message", on_new_message)
+        sio.connect(f"http://127.0.0.1:{ports[i % len(ports)]}", transports=["websocket"])
+        sio.emit("join", {"channel_id": "bench"})
+        connections.append(sio)
+
+    time.sleep(max(0.0, start_at - time.time()))
+    end_at = start_at + duration
+    while time.time() < end_at:
+        for sio in connections:
+            sio.emit("send_message", {"channel_id": "bench", "message": {"id": sent, "sender_zid": "bench", "content": "x"}})
+            sent += 1
+        if interval:
+            time.sleep(interval)
+    # Let in-flight broadcasts arrive
+    time.sleep(1.0)
+    results.put((sent, received[0]))
+    for sio in connections:
+        sio.disconnect()
+
+
+def run(workers: int, clients: int, client_procs: int, duration: float, interval: float,
+        base_port: int, socket_path: str):
+    broker = UnixSocketBroker(socket_path).start()
+    processes = start_workers(workers, base_port, f"unix://{socket_path}", {
+        "CHANNEL_SERVICE_DEBUG": "false",
+        # The benchmark clients are not the browser frontend
+        "ALLOWED_ORIGINS": "*",
+    })
+    try:
+        ports = [base_port + i for i in range(workers)]
+        for port in ports:
+            wait_for_port(port)
+
+        results = multiprocessing.Queue()
+        start_at = time.time() + 2 + clients * 0.05
+        per_proc = max(1, clients // client_procs)
+        procs = [
+            multiprocessing.Process(target=client_process, args=(ports, per_proc, duration, interval, start_at, results))
+            for _ in range(client_procs)
+        ]
+        for proc in procs:
+            proc.start()
+        totals = [results.get(timeout=duration + 120) for _ in procs]
+        for proc in procs:
+            proc.join()
+        sent = sum(t[0] for t in totals)
+        received = sum(t[1] for t in totals)
+        return sent, received
+    finally:
+        stop_workers(processes)
+        broker.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO broadcast throughput vs. worker count")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to test")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--client-procs", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=0.01,
+                        help="Pause in seconds after each round of sends; 0 sends as fast as possible")
+    parser.add_argument("--base-port", type=int, default=5202)
+    parser.add_argument("--socket", default="/tmp/avocado-channel-bench.sock")
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'sent/s':>10} {'delivered/s':>12} {'delivery %':>11}")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        sent, received = run(workers, args.clients, args.client_procs, args.duration, args.interval,
+                             args.base_port, args.socket)
+        clients = max(1, args.clients // args.client_procs) * args.client_procs
+        expected = sent * clients
+        ratio = 100.0 * received / expected if expected else 0.0
+        print(f"{workers:>8} {sent / args.duration:>10.0f} {received / args.duration:>12.0f} {ratio:>10.1f}%")
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    main()
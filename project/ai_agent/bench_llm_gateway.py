@@ -0,0 +1,59 @@
+"""
+Load-test the LLM gateway offline with the stub provider.
+
+Starts --threads callers that send chat completions through one LLMGateway
+for --duration seconds. --batch-share of the callers use the batch priority
+class, the rest are interactive. The stub answers every call after
+--latency-ms, so the run measures the gateway's admission, rate limiting and
+priority handling, not a model. Prints calls per second and the gateway
+statistics of each priority class.
+
+Usage:
+    python bench_llm_gateway.py --threads 32 --concurrency 8 --rpm 6000 --duration 10
+"""
+import argparse
+import json
+import threading
+import time
+
+from llm_gateway import BATCH, INTERACTIVE, LLMGateway, StubProvider
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the LLM gateway")
+    parser.add_argument("--threads", type=int, default=32, help="Concurrent callers")
+    parser.add_argument("--batch-share", type=float, default=0.5, help="Share of callers in the batch class")
+    parser.add_argument("--concurrency", type=int, default=8, help="Gateway max concurrency")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute (0 = no limit)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute (0 = no limit)")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Stub latency per call")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    gateway = LLMGateway(StubProvider(latency_ms=args.latency_ms), max_concurrency=args.concurrency,
+                         rpm=args.rpm, tpm=args.tpm)
+    messages = [{"role": "user", "content": "When is the assignment due?"}]
+    deadline = time.monotonic() + args.duration
+    batch_threads = int(args.threads * args.batch_share)
+
+    def caller(priority: str) -> None:
+        while time.monotonic() < deadline:
+            gateway.complete(messages, priority=priority, max_tokens=100)
+
+    threads = [threading.Thread(target=caller, args=(BATCH if i < batch_threads else INTERACTIVE,))
+               for i in range(args.threads)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    stats = gateway.stats()
+    total = sum(c["requests"] for c in stats["classes"].values())
+    print(f"{total} calls in {elapsed:.1f}s = {total / elapsed:.1f} calls/s")
+    print(json.dumps(stats["classes"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _spawn_thread(target: Callable, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+class CoalescingBroadcaster:
+    """
+    Batches the messages published to a room within a short window.
+
+    The first message published to a room opens a window of `window` seconds.
+    Every message published to that room before the window closes is sent
+    with it as one `emit(key, messages)` call. A batch that reaches `max_batch`
+    messages is sent at once.
+    """
+
+    def __init__(self, emit: Callable[[Any, List[dict]], None], window: float = 0.03,
+                 max_batch: int = 100, spawn: Optional[Callable] = None):
+        """
+        Args:
+            emit: Function (key, messages) that sends one batch to a room
+            window: Seconds messages are collected before a batch is sent
+            max_batch: Number of messages that sends a batch before its window ends
+            spawn: Function (target, *args) that starts a background task.
+                Defaults to a daemon thread
+        """
+        self.emit = emit
+        self.window = window
+        self.max_batch = max_batch
+        self._spawn = spawn or _spawn_thread
+        self._pending: Dict[Any, List[dict]] = {}
+        # (deadline, key, batch); the window is the same for every room, so deadlines are already in order
+        self._deadlines: "deque[tuple]" = deque()
+        self._condition = threading.Condition()
+        self._started = False
+        self._closed = False
+        self._batches = 0
+        self._messages = 0
+
+    def publish(self, key, message: dict) -> None:
+        """Queue a message for the next batch of a room"""
+        full_batch = None
+        with self._condition:
+            if not self._started:
+                self._started = True
+                self._spawn(self._run)
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = []
+                self._pending[key] = batch
+                self._deadlines.append((time.monotonic() + self.window, key, batch))
+                self._condition.notify()
+            batch.append(message)
+            if len(batch) >= self.max_batch:
+                full_batch = self._pending.pop(key)
+        if full_batch:
+            self._send(key, full_batch)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._deadlines and not self._closed:
+                    self._condition.wait()
+                if not self._deadlines:
+                    return
+                deadline, key, batch = self._deadlines[0]
+                delay = deadline - time.monotonic()
+                if delay > 0 and not self._closed:
+                    self._condition.wait(delay)
+                    continue
+                self._deadlines.popleft()
+                # A batch sent because it was full leaves its deadline behind; the
+                # room's next batch has a deadline of its own and must wait for it
+                if self._pending.get(key) is not batch:
+                    continue
+                del self._pending[key]
+            if batch:
+                self._send(key, batch)
+
+    def _send(self, key, batch: List[dict]) -> None:
+        try:
+            self.emit(key, batch)
+        except Exception as e:
+            print(f"Error broadcasting message batch: {str(e)}")
+            traceback.print_exc()
+        with self._condition:
+            self._batches += 1
+            self._messages += len(batch)
+
+    def flush(self) -> None:
+        """Send every pending batch now"""
+        with self._condition:
+            pending = self._pending
+            self._pending = {}
+            self._deadlines.clear()
+        for key, batch in pending.items():
+            self._send(key, batch)
+
+    def close(self) -> None:
+        """Send what is pending and stop the background task"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "window_ms": round(self.window * 1000),
+                "pending_rooms": len(self._pending),
+                "batches": self._batches,
+                "messages": self._messages,
+                "avg_batch_size": round(self._messages / self._batches, 2) if self._batches else 0.0,
+            }
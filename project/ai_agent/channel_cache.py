@@ -0,0 +1,103 @@
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable
+
+from ttl_cache import MISSING, TTLCache
+
+
+class ChannelCache:
+    """
+    In-process cache of channel existence and channel member sets.
+
+    Values are loaded through the given loaders on a miss and kept for `ttl`
+    seconds. The endpoints that change channels or memberships keep the cache
+    in step through invalidate_channel(), add_member() and remove_member().
+    Only existing channels are cached, so a channel created through another
+    process is found at once; member sets of other processes can be up to
+    `ttl` seconds old unless their changes are broadcast to this one.
+    """
+
+    def __init__(self, channel_loader: Callable[[str], bool],
+                 members_loader: Callable[[str], Iterable[str]],
+                 ttl: float = 60.0, max_channels: int = 1000):
+        """
+        Args:
+            channel_loader: Function returning whether a channel exists
+            members_loader: Function returning the member zids of a channel
+            ttl: Seconds a cached value stays valid
+            max_channels: Number of channels kept in each cache before LRU eviction
+        """
+        self.channel_loader = channel_loader
+        self.members_loader = members_loader
+        self._channels = TTLCache(ttl=ttl, max_entries=max_channels)
+        self._members = TTLCache(ttl=ttl, max_entries=max_channels)
+
+    def _key(self, channel_id) -> str:
+        return str(channel_id)
+
+    def channel_exists(self, channel_id) -> bool:
+        key = self._key(channel_id)
+        if self._channels.get(key) is not MISSING:
+            return True
+        exists = bool(self.channel_loader(key))
+        if exists:
+            self._channels.set(key, True)
+        return exists
+
+    def get_members(self, channel_id) -> FrozenSet[str]:
+        key = self._key(channel_id)
+        return self._members.get_or_load(key, lambda: frozenset(self.members_loader(key)))
+
+    def is_member(self, channel_id, zid: str) -> bool:
+        return zid in self.get_members(channel_id)
+
+    def add_member(self, channel_id, zid: str) -> None:
+        """Write-through after a member was added"""
+        self._members.update(self._key(channel_id), lambda members: members | {zid})
+
+    def remove_member(self, channel_id, zid: str) -> None:
+        """Write-through after a member was removed"""
+        self._members.update(self._key(channel_id), lambda members: members - {zid})
+
+    def invalidate_channel(self, channel_id) -> None:
+        """Forget everything cached about a channel, e.g. after it was created or deleted"""
+        key = self._key(channel_id)
+        self._channels.invalidate(key)
+        self._members.invalidate(key)
+
+    def clear(self) -> None:
+        self._channels.clear()
+        self._members.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": self._channels.stats(),
+            "members": self._members.stats(),
+        }
+
+
+class AsyncChannelCache(ChannelCache):
+    """ChannelCache whose loaders are coroutines, for the ASGI build of the service"""
+
+    def __init__(self, channel_loader: Callable[[str], Awaitable[bool]],
+                 members_loader: Callable[[str], Awaitable[Iterable[str]]],
+                 ttl: float = 60.0, max_channels: int = 1000):
+        super().__init__(channel_loader, members_loader, ttl=ttl, max_channels=max_channels)
+
+    async def channel_exists(self, channel_id) -> bool:
+        key = self._key(channel_id)
+        if self._channels.get(key) is not MISSING:
+            return True
+        exists = bool(await self.channel_loader(key))
+        if exists:
+            self._channels.set(key, True)
+        return exists
+
+    async def get_members(self, channel_id) -> FrozenSet[str]:
+        key = self._key(channel_id)
+
+        async def load() -> FrozenSet[str]:
+            return frozenset(await self.members_loader(key))
+
+        return await self._members.get_or_load_async(key, load)
+
+    async def is_member(self, channel_id, zid: str) -> bool:
+        return zid in await self.get_members(channel_id)
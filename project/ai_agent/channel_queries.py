@@ -0,0 +1,479 @@
+import base64
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletionMessageParam
+
+from prompt_builder import Prompt, PromptBuilder
+from write_behind import is_provisional_id
+
+# Message history pagination settings
+MAX_MESSAGE_PAGE_SIZE = 200
+MAX_CHANNEL_PAGE_SIZE = 200
+
+# Number of recent channel messages sent to the AI assistant as context
+ASSISTANT_CONTEXT_SIZE = 5
+ASSISTANT_SYSTEM_PROMPT = "I am a project assistant AI, helping the team with project tasks. I will provide concise and professional answers."
+ASSISTANT_COMPLETION_OPTIONS = {"model": "gpt-3.5-turbo", "max_tokens": 1000, "temperature": 0.7}
+# Default token budget of an assistant prompt
+ASSISTANT_PROMPT_TOKENS = 1500
+# Sender of assistant replies; clients cannot send messages as it
+ASSISTANT_SENDER_ZID = "AI_ASSISTANT"
+ASSISTANT_ERROR_REPLY = "I apologize, but I cannot process this request at the moment. Please try again later."
+
+# Rolling channel summaries (see channel_summary.py)
+SUMMARY_SYSTEM_PROMPT = ("You keep a running summary of a student project team's chat channel. "
+                         "Record decisions, open questions, task assignments and deadlines. "
+                         "Be concise and factual.")
+SUMMARY_COMPLETION_OPTIONS = {"model": "gpt-3.5-turbo", "max_tokens": 300, "temperature": 0.2}
+SUMMARY_PROMPT_TOKENS = 6000
+
+# Longest message content accepted by the send endpoint
+MAX_MESSAGE_LENGTH = 10000
+
+CHANNEL_COLUMNS = 'id, name, created_by, created_at, is_private'
+MESSAGE_COLUMNS = "id, content, sent_at, sender_zid, is_ai_response"
+CONTEXT_MESSAGE_COLUMNS = "id, channel_id, content, sent_at, sender_zid, is_ai_response"
+SUMMARY_COLUMNS = "summary, last_message_id, last_sent_at, message_count"
+
+
+def encode_message_cursor(message: dict) -> str:
+    """Build an opaque cursor from the (sent_at, id) key of a message"""
+    raw = json.dumps({"sent_at": message.get("sent_at"), "id": message.get("id")})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_message_cursor(cursor: str) -> dict:
+    """
+    Decode a cursor produced by encode_message_cursor, raising ValueError if it is malformed.
+
+    The cursor comes from the client and its key ends up in a PostgREST
+    filter string, so id must be an integer and sent_at an ISO timestamp.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, dict):
+        raise ValueError("Invalid cursor")
+    sent_at, message_id = key.get("sent_at"), key.get("id")
+    if not isinstance(message_id, int) or isinstance(message_id, bool):
+        raise ValueError("Invalid cursor")
+    if not isinstance(sent_at, str):
+        raise ValueError("Invalid cursor")
+    try:
+        datetime.fromisoformat(sent_at.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    return {"sent_at": sent_at, "id": message_id}
+
+
+def is_relayable_message(message) -> bool:
+    """
+    Whether a message sent over the socket by a client may be relayed to its room.
+
+    It needs a stored or provisional id, a sender and text content, and may
+    not claim to come from the assistant.
+    """
+    if not isinstance(message, dict):
+        return False
+    message_id = message.get("id")
+    if not (isinstance(message_id, int) and not isinstance(message_id, bool)) and not is_provisional_id(message_id):
+        return False
+    sender_zid = message.get("sender_zid")
+    if not isinstance(sender_zid, str) or not sender_zid or sender_zid == ASSISTANT_SENDER_ZID:
+        return False
+    return isinstance(message.get("content"), str)
+
+
+def keyset_filter(key: dict, op: str) -> str:
+    """PostgREST or() filter selecting rows strictly before (lt) or after (gt) a (sent_at, id) key"""
+    sent_at = key["sent_at"]
+    message_id = key["id"]
+    return f'sent_at.{op}."{sent_at}",and(sent_at.eq."{sent_at}",id.{op}.{message_id})'
+
+
+def is_timestamp(value: str) -> bool:
+    """Tell a since timestamp apart from a message ID"""
+    if "T" not in value and ":" not in value:
+        return False
+    try:
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return True
+    except ValueError:
+        return False
+
+
+def message_etag(channel_id, version: str, query_string: bytes) -> str:
+    """ETag of a message history response: changes with the channel version and the query"""
+    raw = f"{channel_id}:{version}:".encode("utf-8") + query_string
+    return hashlib.sha1(raw).hexdigest()
+
+
+class ChannelListRequest:
+    """
+    Parameters, query and response of GET /api/channels.
+
+    Shared by both builds; the queries are built on a sync or async Supabase
+    client, and only their execution differs.
+    """
+
+    def __init__(self, args):
+        """
+        Args:
+            args: Query parameters of the request
+
+        Raises:
+            ValueError: limit or offset is not an integer (the client-facing message)
+        """
+        self.zid = args.get('zid')
+        self.channel_id = args.get('channelId')
+        self.updated_since = args.get('updated_since')
+        limit_param = args.get('limit')
+        offset_param = args.get('offset')
+        try:
+            limit = int(limit_param) if limit_param else None
+            offset = int(offset_param) if offset_param else 0
+        except ValueError:
+            raise ValueError("limit and offset must be integers")
+        self.limit = max(1, min(limit, MAX_CHANNEL_PAGE_SIZE)) if limit is not None else None
+        self.offset = max(0, offset)
+        # Clients pass this back as updated_since on their next refresh
+        self.synced_at = datetime.now(timezone.utc).isoformat()
+
+    def query(self, client):
+        """The channels query"""
+        if self.zid:
+            # Embed the user's membership rows with an inner join, so only their
+            # channels come back and no second query or long in_() list is needed
+            query = client.table('channels').select(f'{CHANNEL_COLUMNS}, channel_members!inner(zid)')\
+                .eq('channel_members.zid', self.zid)
+        else:
+            query = client.table('channels').select(CHANNEL_COLUMNS)
+        # If a specific channel ID is provided, get the channel
+        if self.channel_id:
+            query = query.eq('id', self.channel_id)
+        # Incremental refresh: channels changed (or joined) since the last sync
+        if self.updated_since:
+            query = query.gte('updated_at', self.updated_since)
+        if self.limit is not None:
+            # Fetch one extra row to know whether another page exists
+            query = query.order('created_at').order('id').range(self.offset, self.offset + self.limit)
+        return query
+
+    def removals_query(self, client):
+        """Query of the channels the user left, or that were deleted, since the last sync; None without updated_since"""
+        if not self.updated_since:
+            return None
+        removals = client.table('channel_removals').select('channel_id').gte('removed_at', self.updated_since)
+        removals = removals.eq('zid', self.zid) if self.zid else removals.is_('zid', 'null')
+        if self.channel_id:
+            removals = removals.eq('channel_id', self.channel_id)
+        return removals
+
+    def response(self, channels: Optional[list], removals: Optional[list] = None) -> Dict[str, Any]:
+        """Response body from the rows of the channels and removals queries"""
+        channels = channels or []
+        for channel in channels:
+            channel.pop('channel_members', None)
+
+        if self.limit is None and not self.updated_since:
+            return {"status": "success", "data": channels}
+
+        result = {"status": "success", "data": channels, "synced_at": self.synced_at}
+        if self.updated_since:
+            result["removed"] = sorted({row['channel_id'] for row in removals or []})
+        if self.limit is not None:
+            result["data"] = channels[:self.limit]
+            result["pagination"] = {"limit": self.limit, "offset": self.offset, "has_more": len(channels) > self.limit}
+        return result
+
+
+class MessagePageRequest:
+    """
+    Parameters, queries and response of GET /api/channels/<id>/messages.
+
+    Shared by both builds; the queries are built on a sync or async Supabase
+    client, and only their execution differs.
+    """
+
+    def __init__(self, channel_id, args, default_limit: int):
+        """
+        Args:
+            channel_id: Channel whose messages are listed
+            args: Query parameters of the request
+            default_limit: Page size when the request has no limit
+
+        Raises:
+            ValueError: A parameter is invalid (the client-facing message)
+        """
+        self.channel_id = channel_id
+        limit_param = args.get('limit')
+        before = args.get('before')
+        after = args.get('after')
+        since = args.get('since')
+        if sum(1 for value in (before, after, since) if value) > 1:
+            raise ValueError("Use only one of before, after or since")
+
+        # Without pagination parameters, keep returning the full history for older clients
+        self.paginated = bool(limit_param or before or after or since)
+        try:
+            limit = int(limit_param) if limit_param else default_limit
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        self.limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+        self.cursor_key = decode_message_cursor(before or after) if (before or after) else None
+
+        # Delta sync: since is either a timestamp or the ID of the last message the client has
+        self.since_timestamp = None
+        self.since_id = None
+        if since:
+            if is_timestamp(since):
+                self.since_timestamp = since
+            elif since.isdigit():
+                self.since_id = since
+            else:
+                # e.g. a provisional write-behind ID, which is not in the table yet
+                raise ValueError("since must be a message ID or an ISO timestamp")
+
+        # "after" and "since" page forward in time; everything else pages backwards from the newest message
+        self.forward = bool(after or since)
+
+    def since_query(self, client):
+        """Query of the (sent_at, id) key of the since message; None unless since is a message ID"""
+        if self.since_id is None:
+            return None
+        return client.table("channel_messages")\
+            .select("id, sent_at")\
+            .eq("channel_id", self.channel_id)\
+            .eq("id", self.since_id)
+
+    def resolve_since(self, rows: Optional[list]) -> None:
+        """Continue after the since message found by since_query(); ValueError if it does not exist"""
+        if not rows:
+            raise ValueError("Unknown since message")
+        self.cursor_key = rows[0]
+
+    def query(self, client):
+        """The messages query, ordered by the database on (sent_at, id)"""
+        descending = not self.forward
+        query = client.table("channel_messages")\
+            .select(MESSAGE_COLUMNS)\
+            .eq("channel_id", self.channel_id)
+        if self.cursor_key:
+            query = query.or_(keyset_filter(self.cursor_key, "gt" if self.forward else "lt"))
+        elif self.since_timestamp:
+            # gte: messages sharing the timestamp are sent again rather than skipped
+            query = query.gte("sent_at", self.since_timestamp)
+        query = query.order("sent_at", desc=descending).order("id", desc=descending)
+        if self.paginated:
+            # Fetch one extra row to know whether another page exists
+            query = query.limit(self.limit + 1)
+        return query
+
+    def response(self, rows: Optional[list]) -> Dict[str, Any]:
+        """Response body from the rows of the messages query"""
+        messages = rows or []
+        has_more = self.paginated and len(messages) > self.limit
+        if self.paginated:
+            messages = messages[:self.limit]
+        if not self.forward:
+            # Always hand the client messages in chronological order
+            messages.reverse()
+
+        # Ensure that all messages have the is_ai_response field
+        for message in messages:
+            if 'is_ai_response' not in message:
+                message['is_ai_response'] = False
+
+        if not self.paginated:
+            return {"status": "success", "data": messages}
+
+        next_cursor = None
+        if has_more and messages:
+            # Older pages continue from the oldest message, newer pages from the newest
+            next_cursor = encode_message_cursor(messages[-1] if self.forward else messages[0])
+        return {
+            "status": "success",
+            "data": messages,
+            "pagination": {
+                "limit": self.limit,
+                "has_more": has_more,
+                "next_cursor": next_cursor
+            }
+        }
+
+
+def parse_new_message(data: Optional[dict]) -> Tuple[str, str]:
+    """
+    Sender and content of a POST /api/channels/<id>/messages body.
+
+    Raises:
+        ValueError: The body is missing or invalid (the client-facing message)
+    """
+    if not data:
+        raise ValueError("No data provided")
+    sender_zid = data.get('sender_zid')
+    content = data.get('content')
+    if not sender_zid or not content:
+        raise ValueError("Sender ID and message content are required")
+    if len(content) > MAX_MESSAGE_LENGTH:
+        raise ValueError("Message content too long")
+    return sender_zid, content
+
+
+def is_assistant_question(content: str) -> bool:
+    """Whether a message asks the AI assistant"""
+    return "@assistant" in content.lower()
+
+
+def message_row(channel_id, sender_zid: str, content: str, is_ai_response: bool = False) -> Dict[str, Any]:
+    """channel_messages row of a message sent now"""
+    return {
+        "channel_id": channel_id,
+        "sender_zid": sender_zid,
+        "content": content,
+        "sent_at": datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        "is_ai_response": is_ai_response
+    }
+
+
+def assistant_question_response(user_message: Optional[dict], queued: bool) -> Tuple[Dict[str, Any], int]:
+    """Response body and status of an @assistant message whose reply is queued (or rejected)"""
+    return {
+        "status": "success",
+        "data": {
+            "user_message": user_message,
+            "ai_message": None,
+            "ai_status": "queued" if queued else "rejected"
+        }
+    }, 202 if queued else 200
+
+
+class ChannelMessageState:
+    """
+    Per-process message state of the channels: recent messages kept as
+    assistant context, the room event log replayed to rejoining clients,
+    and each channel's last-message version used as its ETag.
+
+    Both builds record their own broadcasts here, and apply_remote_emit()
+    records the broadcasts of other worker processes the same way.
+    """
+
+    def __init__(self, recent_messages, room_events, channel_versions):
+        self.recent_messages = recent_messages
+        self.room_events = room_events
+        self.channel_versions = channel_versions
+
+    def note_message(self, channel_id, message: dict) -> None:
+        """Record a new message in the recent-message buffer and room log, and bump the channel version"""
+        self.recent_messages.append(channel_id, message)
+        self.room_events.record(channel_id, message)
+        if message.get("id") is not None:
+            self.channel_versions.set(str(channel_id), str(message["id"]))
+
+    def note_committed(self, channel_id, provisional_id: str, stored: dict) -> None:
+        """Swap a provisional message for its stored version"""
+        self.recent_messages.replace(channel_id, provisional_id, stored)
+        self.room_events.replace(channel_id, provisional_id, stored)
+        self.channel_versions.set(str(channel_id), str(stored.get("id")))
+
+    def forget_failed(self, channel_id, provisional_id: str) -> None:
+        """Drop a message that was never stored"""
+        self.recent_messages.remove(channel_id, provisional_id)
+        self.room_events.remove(channel_id, provisional_id)
+
+    def evict(self, channel_id) -> None:
+        """Drop everything kept about a channel"""
+        self.recent_messages.evict(channel_id)
+        self.channel_versions.invalidate(str(channel_id))
+        self.room_events.evict(channel_id)
+
+    def apply_remote_emit(self, event, data, room) -> None:
+        """Record a message event that another worker broadcast to a channel room"""
+        if not isinstance(room, str) or not room.startswith("channel_"):
+            return
+        channel_id = room[len("channel_"):]
+        if event == 'new_message' and isinstance(data, dict):
+            # Messages relayed from clients are not recorded anywhere
+            if not data.get('relayed'):
+                self.note_message(channel_id, data)
+        elif event == 'messages_batch':
+            for message in data.get('messages', []):
+                if not message.get('relayed'):
+                    self.note_message(channel_id, message)
+        elif event == 'message_committed':
+            self.note_committed(channel_id, data['provisional_id'], data['message'])
+        elif event == 'message_failed':
+            self.forget_failed(channel_id, data['provisional_id'])
+
+
+def build_assistant_prompt(content: str, channel_context: Optional[list] = None,
+                           summary: Optional[str] = None,
+                           token_budget: int = ASSISTANT_PROMPT_TOKENS) -> Prompt:
+    """
+    Prompt for an @assistant question, the channel summary and the recent channel messages.
+
+    Within token_budget, the oldest context messages are dropped first, then
+    the summary is shortened; the system prompt and question are always sent
+    (a very long question is shortened).
+    """
+    # Remove @assistant tag
+    actual_question = content.replace("@assistant", "").strip()
+
+    builder = PromptBuilder(token_budget, model=ASSISTANT_COMPLETION_OPTIONS["model"])
+    builder.add(ASSISTANT_SYSTEM_PROMPT, role="system", required=True, name="system")
+    if summary:
+        builder.add(f"Summary of the earlier discussion in this channel:\n{summary}", role="system",
+                    priority=1, truncatable=True, min_tokens=50, name="summary")
+
+    # Add channel context if available; all of one priority, so the oldest go first
+    for msg in channel_context or []:
+        role = "user" if msg.get("sender_zid") != ASSISTANT_SENDER_ZID else "assistant"
+        builder.add(msg.get("content", ""), role=role, priority=2, name=f"context {msg.get('id')}")
+
+    # Add the user's current issue
+    builder.add(actual_question, required=True, truncatable=True, min_tokens=100, name="question")
+    return builder.build()
+
+
+def build_assistant_messages(content: str, channel_context: Optional[list] = None,
+                             summary: Optional[str] = None,
+                             token_budget: int = ASSISTANT_PROMPT_TOKENS) -> List[ChatCompletionMessageParam]:
+    """Chat completion messages of build_assistant_prompt()"""
+    return build_assistant_prompt(content, channel_context, summary, token_budget).messages  # type: ignore
+
+
+def build_summary_messages(previous_summary: Optional[str], new_messages: list) -> List[ChatCompletionMessageParam]:
+    """
+    Chat completion messages that fold new channel messages into the previous summary.
+
+    Within SUMMARY_PROMPT_TOKENS, the oldest new messages are dropped first,
+    then the previous summary is shortened.
+    """
+    builder = PromptBuilder(SUMMARY_PROMPT_TOKENS, model=SUMMARY_COMPLETION_OPTIONS["model"])
+    builder.add(SUMMARY_SYSTEM_PROMPT, role="system", required=True, name="system")
+    builder.add(f"Current summary:\n{previous_summary or '(none yet)'}", required=True, truncatable=True,
+                min_tokens=100, priority=1, name="previous summary")
+    builder.add("New messages:", required=True, join=True)
+    for msg in new_messages:
+        builder.add(f"{msg.get('sender_zid')}: {msg.get('content', '')}", priority=2, join=True,
+                    name=f"message {msg.get('id')}")
+    builder.add("Write the updated summary of the whole discussion.", required=True, join=True)
+    return builder.build().messages  # type: ignore
+
+
+def channel_error_response(error_msg: str) -> Tuple[str, int]:
+    """Client-facing message and HTTP status for a failed channel insert"""
+    lowered = error_msg.lower()
+    if "duplicate key" in lowered:
+        return "Channel name already exists", 409
+    elif "foreign key" in lowered:
+        return "Invalid creator ID", 400
+    elif "not-null" in lowered or "null value" in lowered:
+        return "Missing required fields", 400
+    elif "column" in lowered and "not exist" in lowered:
+        return "Data table structure mismatch", 400
+    return "Failed to create channel", 500
@@ -3,26 +3,53 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-from supabase.client import create_client, Client
+from supabase.client import Client
 import traceback
-from datetime import datetime
+import atexit
+import uuid
+from datetime import datetime, timezone
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from openai import OpenAI
-from openai.types.chat import ChatCompletionMessageParam
-from typing import Optional, List
+from typing import Callable, Optional
+from message_buffer import RecentMessageBuffer
+from assistant_worker import AssistantJobQueue
+from write_behind import MessageWriteBehind
+from channel_cache import ChannelCache
+from ttl_cache import TTLCache
+from response_cache import AssistantResponseCache
+from event_log import RoomEventLog
+from broadcast import CoalescingBroadcaster
+from socketio_backend import create_client_manager
+from http_pool import create_supabase_client, pool_stats
+from llm_gateway import BATCH, INTERACTIVE, get_gateway
+from channel_summary import ChannelSummaries
+from channel_queries import (
+    ASSISTANT_COMPLETION_OPTIONS, ASSISTANT_CONTEXT_SIZE, ASSISTANT_ERROR_REPLY, ASSISTANT_PROMPT_TOKENS,
+    ASSISTANT_SENDER_ZID, CONTEXT_MESSAGE_COLUMNS, SUMMARY_COLUMNS, SUMMARY_COMPLETION_OPTIONS,
+    ChannelListRequest, ChannelMessageState, MessagePageRequest, assistant_question_response,
+    build_assistant_prompt, build_summary_messages, channel_error_response, encode_message_cursor,
+    is_assistant_question, is_relayable_message, keyset_filter, message_etag, message_row, parse_new_message,
+)
 
 # 1. First load the environment variables
 load_dotenv()
 
 # 2. Initialize Flask and CORS
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000", "supports_credentials": True}})
+# Comma-separated list of frontend origins, or "*"
+ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000")
+allowed_origins = "*" if ALLOWED_ORIGINS == "*" else [origin.strip() for origin in ALLOWED_ORIGINS.split(",")]
+CORS(app, resources={r"/api/*": {"origins": allowed_origins, "supports_credentials": True}})
 
 # 3. Initialize Socket.IO (allow front-end cross-domain access)
-socketio = SocketIO(app, cors_allowed_origins="http://localhost:3000")
+# With SOCKETIO_MESSAGE_QUEUE set, room broadcasts are shared between worker processes
+client_manager = create_client_manager(os.getenv("SOCKETIO_MESSAGE_QUEUE"))
+socketio_options = {"client_manager": client_manager} if client_manager else {}
+# SOCKETIO_ASYNC_MODE forces threading/gevent/eventlet; by default it matches the server in use
+socketio = SocketIO(app, cors_allowed_origins=allowed_origins, async_mode=os.getenv("SOCKETIO_ASYNC_MODE") or None,
+                    **socketio_options)
 
-# 4. Initializing OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 4. OpenAI calls go through the process-wide LLM gateway (concurrency, rate limits, metrics)
+llm = get_gateway()
 
 # 5. Initialization of Supabase
 supabase_url = os.getenv("SUPABASE_URL")
@@ -35,7 +62,7 @@ if not supabase_url or not supabase_key:
     print(f"SUPABASE_ANON_KEY present: {bool(supabase_key)}")
     raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY environment variables must be set")
 
-supabase: Client = create_client(supabase_url, supabase_key)
+supabase: Client = create_supabase_client(supabase_url, supabase_key)
 
 # Add test connection code
 try:
@@ -48,40 +75,333 @@ except Exception as e:
     print(f"Error message: {str(e)}")
     traceback.print_exc()
 
-async def process_ai_assistant_message(content: str, channel_context: Optional[list] = None) -> Optional[str]:
+# Message history pagination settings
+DEFAULT_MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+
+# Cache of channel existence and member sets, kept in step by the channel and member endpoints
+def load_channel_exists(channel_id: str) -> bool:
+    response = supabase.table("channels").select("id").eq("id", channel_id).execute()
+    return bool(response.data)
+
+def load_channel_members(channel_id: str) -> list:
+    response = supabase.table("channel_members").select("zid").eq("channel_id", channel_id).execute()
+    return [row["zid"] for row in response.data or []]
+
+channel_cache = ChannelCache(
+    load_channel_exists,
+    load_channel_members,
+    ttl=float(os.getenv("CHANNEL_CACHE_TTL", "60")),
+    max_channels=int(os.getenv("CHANNEL_CACHE_SIZE", "1000"))
+)
+
+# Stream assistant replies token by token as ai_message_chunk events
+ASSISTANT_STREAMING = os.getenv("ASSISTANT_STREAMING", "true").lower() == "true"
+
+# Replies to repeated @assistant questions, served without calling OpenAI
+assistant_cache = AssistantResponseCache(
+    ttl=float(os.getenv("ASSISTANT_CACHE_TTL", "900")),
+    max_entries=int(os.getenv("ASSISTANT_CACHE_SIZE", "1000")),
+    bypass_prefix=os.getenv("ASSISTANT_CACHE_BYPASS_PREFIX", "!fresh")
+)
+
+# Recent messages kept in memory per channel, used as AI assistant context
+RECENT_MESSAGE_BUFFER_SIZE = int(os.getenv("RECENT_MESSAGE_BUFFER_SIZE", "20"))
+RECENT_MESSAGE_MAX_CHANNELS = int(os.getenv("RECENT_MESSAGE_MAX_CHANNELS", "500"))
+
+def load_recent_messages(channel_id: str, limit: int) -> list:
+    """Backfill the latest messages of a channel from the database, oldest first"""
+    response = supabase.table("channel_messages")\
+        .select(CONTEXT_MESSAGE_COLUMNS)\
+        .eq("channel_id", channel_id)\
+        .order("sent_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(limit)\
+        .execute()
+    return list(reversed(response.data or []))
+
+recent_messages = RecentMessageBuffer(
+    size=RECENT_MESSAGE_BUFFER_SIZE,
+    max_channels=RECENT_MESSAGE_MAX_CHANNELS,
+    loader=load_recent_messages
+)
+
+# Rolling per-channel summary of older discussion, refreshed every CHANNEL_SUMMARY_EVERY stored messages
+CHANNEL_SUMMARY_EVERY = int(os.getenv("CHANNEL_SUMMARY_EVERY", "20"))
+CHANNEL_SUMMARY_BATCH = int(os.getenv("CHANNEL_SUMMARY_BATCH", "200"))
+# Token budget of an assistant prompt (system prompt, summary, recent messages and question)
+ASSISTANT_PROMPT_TOKENS = int(os.getenv("ASSISTANT_PROMPT_TOKENS", str(ASSISTANT_PROMPT_TOKENS)))
+
+def load_channel_summary(channel_id: str) -> Optional[dict]:
+    response = supabase.table("channel_summaries").select(SUMMARY_COLUMNS).eq("channel_id", channel_id).execute()
+    return response.data[0] if response.data else None
+
+def save_channel_summary(channel_id: str, row: dict) -> None:
+    supabase.table("channel_summaries").upsert({
+        "channel_id": channel_id,
+        **row,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }).execute()
+
+def load_messages_after(channel_id: str, row: dict) -> list:
+    """Messages after the last summarised one, oldest first; the latest batch for a new summary"""
+    query = supabase.table("channel_messages").select(CONTEXT_MESSAGE_COLUMNS).eq("channel_id", channel_id)
+    if not row.get("last_sent_at"):
+        response = query.order("sent_at", desc=True).order("id", desc=True).limit(CHANNEL_SUMMARY_BATCH).execute()
+        return list(reversed(response.data or []))
+    key = {"sent_at": row["last_sent_at"], "id": row["last_message_id"]}
+    response = query.or_(keyset_filter(key, "gt")).order("sent_at").order("id").limit(CHANNEL_SUMMARY_BATCH).execute()
+    return response.data or []
+
+def summarize_channel(previous_summary: Optional[str], new_messages: list) -> str:
+    return llm.complete(build_summary_messages(previous_summary, new_messages), priority=BATCH,
+                        **SUMMARY_COMPLETION_OPTIONS)
+
+channel_summaries = None
+if CHANNEL_SUMMARY_EVERY > 0:
+    channel_summaries = ChannelSummaries(
+        load_channel_summary,
+        save_channel_summary,
+        load_messages_after,
+        summarize_channel,
+        refresh_every=CHANNEL_SUMMARY_EVERY,
+        max_channels=RECENT_MESSAGE_MAX_CHANNELS,
+        spawn=socketio.start_background_task
+    )
+
+# Messages broadcast to each room, replayed to clients that rejoin with last_seen_id
+room_events = RoomEventLog(
+    size=int(os.getenv("ROOM_EVENT_LOG_SIZE", "200")),
+    max_rooms=int(os.getenv("ROOM_EVENT_LOG_MAX_ROOMS", "1000"))
+)
+
+# Last-message version of each channel, used as the ETag of its message history
+channel_versions = TTLCache(
+    ttl=float(os.getenv("CHANNEL_VERSION_TTL", "30")),
+    max_entries=int(os.getenv("CHANNEL_CACHE_SIZE", "1000"))
+)
+
+# Recent messages, room log and version of each channel, kept in step with every broadcast
+message_state = ChannelMessageState(recent_messages, room_events, channel_versions)
+note_channel_message = message_state.note_message
+note_committed_message = message_state.note_committed
+forget_failed_message = message_state.forget_failed
+
+# Optional write-behind buffer that group-commits channel_messages inserts
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "50"))
+MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "50"))
+MESSAGE_WRITE_ATTEMPTS = int(os.getenv("MESSAGE_WRITE_ATTEMPTS", "5"))
+MESSAGE_RETRY_DELAY_MS = int(os.getenv("MESSAGE_RETRY_DELAY_MS", "500"))
+
+def insert_message_rows(rows: list) -> list:
+    """Insert a batch of channel messages in one round trip"""
+    return supabase.table("channel_messages").insert(rows).execute().data
+
+def reconcile_message_id(provisional_id: str, stored: dict) -> None:
+    """Tell clients the real ID of a message that was broadcast with a provisional one"""
+    channel_id = stored.get("channel_id")
+    note_committed_message(channel_id, provisional_id, stored)
+    socketio.emit('message_committed', {
+        "channel_id": channel_id,
+        "provisional_id": provisional_id,
+        "message": stored
+    }, room=f"channel_{channel_id}")
+
+def report_dropped_message(provisional_id: str, row: dict) -> None:
+    """Tell clients that a message broadcast with a provisional ID could not be stored"""
+    channel_id = row.get("channel_id")
+    forget_failed_message(channel_id, provisional_id)
+    socketio.emit('message_failed', {
+        "channel_id": channel_id,
+        "provisional_id": provisional_id
+    }, room=f"channel_{channel_id}")
+
+message_writer = None
+if MESSAGE_WRITE_BEHIND:
+    message_writer = MessageWriteBehind(
+        insert_message_rows,
+        on_commit=reconcile_message_id,
+        on_drop=report_dropped_message,
+        max_batch=MESSAGE_BATCH_SIZE,
+        flush_interval=MESSAGE_FLUSH_INTERVAL_MS / 1000,
+        max_attempts=MESSAGE_WRITE_ATTEMPTS,
+        retry_delay=MESSAGE_RETRY_DELAY_MS / 1000,
+        spawn=socketio.start_background_task
+    )
+    # Pending messages are written before the process exits
+    atexit.register(message_writer.close)
+
+def store_message(message_data: dict) -> Optional[dict]:
+    """Persist a channel message, through the write-behind buffer when it is enabled"""
+    if message_writer:
+        return message_writer.add(message_data)
+    response = supabase.table("channel_messages").insert(message_data).execute()
+    return response.data[0] if response.data else None
+
+def load_channel_version(channel_id: str) -> str:
+    response = supabase.table("channel_messages")\
+        .select("id")\
+        .eq("channel_id", channel_id)\
+        .order("sent_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(1)\
+        .execute()
+    return str(response.data[0]["id"]) if response.data else "0"
+
+def get_channel_version(channel_id) -> str:
+    key = str(channel_id)
+    return channel_versions.get_or_load(key, lambda: load_channel_version(key))
+
+def channel_etag(channel_id, query_string: bytes) -> str:
+    """ETag of a message history response: changes with the channel version and the query"""
+    return message_etag(channel_id, get_channel_version(channel_id), query_string)
+
+# Opt-in coalescing: messages within the window go out as one messages_batch event per room
+BROADCAST_COALESCE_MS = int(os.getenv("BROADCAST_COALESCE_MS", "0"))
+
+def emit_message_batch(channel_id, messages: list) -> None:
+    socketio.emit('messages_batch', {"channel_id": channel_id, "messages": messages}, room=f"channel_{channel_id}")
+
+broadcaster = None
+if BROADCAST_COALESCE_MS > 0:
+    broadcaster = CoalescingBroadcaster(
+        emit_message_batch,
+        window=BROADCAST_COALESCE_MS / 1000,
+        max_batch=int(os.getenv("BROADCAST_MAX_BATCH", "100")),
+        spawn=socketio.start_background_task
+    )
+    atexit.register(broadcaster.close)
+
+def emit_to_room(channel_id, message: dict) -> None:
+    """Send a message to the channel room, batched when coalescing is enabled"""
+    if broadcaster:
+        broadcaster.publish(str(channel_id), message)
+    else:
+        socketio.emit('new_message', message, room=f"channel_{channel_id}")
+
+# Room without clients, used to tell the other worker processes about channel changes
+CLUSTER_ROOM = "_cluster"
+
+def publish_channel_change(channel_id, deleted: bool = False) -> None:
+    """Let other worker processes drop what they cached about a channel"""
+    if client_manager:
+        socketio.emit('channel_changed', {"channel_id": channel_id, "deleted": deleted}, room=CLUSTER_ROOM)
+
+def forget_channel(channel_id) -> None:
+    """Drop all per-process state of a deleted channel"""
+    message_state.evict(channel_id)
+    channel_cache.invalidate_channel(channel_id)
+    assistant_cache.evict_channel(channel_id)
+    if channel_summaries:
+        channel_summaries.evict(channel_id)
+
+def broadcast_new_message(channel_id, message: dict) -> None:
+    """Push a stored message to the channel room and remember it for assistant context"""
+    note_channel_message(channel_id, message)
+    if channel_summaries:
+        channel_summaries.note_message(channel_id)
+    emit_to_room(channel_id, message)
+
+def with_etag(response, etag: str):
+    """Attach an ETag and make clients revalidate it on every request"""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def process_ai_assistant_message(content: str, channel_context: Optional[list] = None,
+                                 on_chunk: Optional[Callable[[str], None]] = None,
+                                 channel_id=None, summary: Optional[str] = None) -> Optional[str]:
+    """
+    Ask the AI assistant a question.
+
+    If on_chunk is given, the completion is streamed and on_chunk is called with
+    each piece of text as it arrives. The full reply is returned either way.
+    With a channel_id, repeated questions are answered from assistant_cache.
+    The prompt is the summary (if any) plus the newest context messages that
+    fit in ASSISTANT_PROMPT_TOKENS.
+    """
     try:
-        # Remove @assistant tag
-        actual_question = content.replace("@assistant", "").strip()
-        
-        # Build system message
-        messages: List[ChatCompletionMessageParam] = [
-            {"role": "system", "content": "I am a project assistant AI, helping the team with project tasks. I will provide concise and professional answers."},
-        ]
-        
-        # Add channel context if available
-        if channel_context:
-            for msg in channel_context[-5:]:
-                role = "user" if msg.get("sender_zid") != "AI_ASSISTANT" else "assistant"
-                content = msg.get("content", "")
-                context_message = {"role": role, "content": content}
-                messages.append(context_message)  # type: ignore
-        
-        # Add the user's current issue
-        messages.append({"role": "user", "content": actual_question})
-        
-        # Calling the OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.7,
-        )
-        
-        return response.choices[0].message.content
+        content, bypass = assistant_cache.strip_bypass(content)
+        cache_key = None
+        if channel_id is not None and not bypass:
+            cache_key = assistant_cache.key(channel_id, content, channel_context)
+            cached = assistant_cache.get(cache_key)
+            if cached is not None:
+                if on_chunk is not None:
+                    on_chunk(cached)
+                return cached
+        
+        prompt = build_assistant_prompt(content, channel_context, summary=summary, token_budget=ASSISTANT_PROMPT_TOKENS)
+        if prompt.dropped or prompt.truncated:
+            print(f"Assistant prompt trimmed to {prompt.tokens}/{prompt.budget} tokens "
+                  f"(dropped {len(prompt.dropped)}, truncated {prompt.truncated})")
+        messages = prompt.messages
+        
+        # Calling the OpenAI API; chat replies go ahead of batch analysis
+        if on_chunk is None:
+            reply = llm.complete(messages, priority=INTERACTIVE, **ASSISTANT_COMPLETION_OPTIONS)
+            if cache_key is not None:
+                assistant_cache.set(cache_key, reply)
+            return reply
+        
+        # Streaming mode: forward tokens as they arrive and return the joined text
+        parts = []
+        for delta in llm.stream(messages, priority=INTERACTIVE, **ASSISTANT_COMPLETION_OPTIONS):
+            parts.append(delta)
+            on_chunk(delta)
+        reply = "".join(parts)
+        if cache_key is not None:
+            assistant_cache.set(cache_key, reply)
+        return reply
     except Exception as e:
         print(f"Error processing AI assistant message: {str(e)}")
         traceback.print_exc()
-        return "I apologize, but I cannot process this request at the moment. Please try again later."
+        return ASSISTANT_ERROR_REPLY
+
+def run_assistant_job(job: dict) -> None:
+    """Generate, store and broadcast the AI reply for a queued @assistant message"""
+    channel_id = job["channel_id"]
+    
+    on_chunk = None
+    stream_id = None
+    if ASSISTANT_STREAMING:
+        # Clients render ai_message_chunk events under stream_id until the final new_message arrives
+        stream_id = str(uuid.uuid4())
+        room = f"channel_{channel_id}"
+        chunk_index = 0
+        
+        def emit_chunk(delta: str) -> None:
+            nonlocal chunk_index
+            socketio.emit('ai_message_chunk', {
+                "channel_id": channel_id,
+                "stream_id": stream_id,
+                "index": chunk_index,
+                "delta": delta
+            }, room=room)
+            chunk_index += 1
+        
+        on_chunk = emit_chunk
+    
+    summary = channel_summaries.get(channel_id) if channel_summaries else None
+    ai_response = process_ai_assistant_message(job["content"], job.get("context"), on_chunk=on_chunk,
+                                               channel_id=channel_id, summary=summary)
+    
+    # Save AI's reply message
+    ai_message = store_message(message_row(channel_id, ASSISTANT_SENDER_ZID, ai_response, is_ai_response=True))
+    
+    # Broadcast AI replies to all clients on the channel
+    if ai_message:
+        if stream_id:
+            ai_message = {**ai_message, "stream_id": stream_id}
+        broadcast_new_message(channel_id, ai_message)
+
+# Background workers for @assistant replies
+assistant_jobs = AssistantJobQueue(
+    run_assistant_job,
+    workers=int(os.getenv("ASSISTANT_WORKERS", "4")),
+    max_queue=int(os.getenv("ASSISTANT_QUEUE_SIZE", "100")),
+    spawn=socketio.start_background_task
+)
 
 # Socket.IO Event Handling
 @socketio.on('connect')
@@ -99,6 +419,30 @@ def handle_join(data):
         room = f"channel_{channel_id}"
         join_room(room)
         print(f"Client {request.sid} joined room: {room}")
+        
+        # A reconnecting client sends the last message it saw; replay what it missed
+        last_seen_id = data.get('last_seen_id')
+        if last_seen_id is not None:
+            replay_missed_messages(channel_id, last_seen_id)
+
+def replay_missed_messages(channel_id, last_seen_id) -> None:
+    """Send the messages broadcast after last_seen_id to the joining socket only"""
+    missed = room_events.since(channel_id, last_seen_id)
+    if missed is None:
+        try:
+            up_to_date = str(last_seen_id) == get_channel_version(channel_id)
+        except Exception as e:
+            print(f"Error checking channel version: {str(e)}")
+            up_to_date = False
+        if not up_to_date:
+            # The gap is older than the log; the client has to refetch over HTTP
+            emit('resync_required', {"channel_id": channel_id, "last_seen_id": last_seen_id})
+            print(f"Client {request.sid} must resync channel {channel_id}")
+        return
+    
+    for message in missed:
+        emit('new_message', message)
+    print(f"Replayed {len(missed)} messages to client {request.sid} for channel {channel_id}")
 
 @socketio.on('leave')
 def handle_leave(data):
@@ -116,46 +460,48 @@ def handle_message(data):
         room = f"channel_{channel_id}"
         # Add error handling and logging
         try:
-            emit('new_message', message, to=room)
+            if not is_relayable_message(message):
+                print(f"Rejected malformed message from client {request.sid} for room: {room}")
+                return
+            # Only relayed: the message is not recorded as assistant context or
+            # in the replay log, and other workers skip it too
+            message = {**message, "relayed": True}
+            if broadcaster:
+                broadcaster.publish(str(channel_id), message)
+            else:
+                emit('new_message', message, to=room)
             print(f"Message broadcasted to room: {room}")
         except Exception as e:
             print(f"Error broadcasting message: {str(e)}")
 
+# Broadcasts made by other worker processes (only with SOCKETIO_MESSAGE_QUEUE)
+def handle_remote_emit(event, data, room) -> None:
+    """Keep this process's caches in step with broadcasts from other workers"""
+    if event == 'channel_changed':
+        if data.get('deleted'):
+            forget_channel(data['channel_id'])
+        else:
+            channel_cache.invalidate_channel(data['channel_id'])
+        return
+    message_state.apply_remote_emit(event, data, room)
+
+if client_manager:
+    client_manager.on_remote_emit = handle_remote_emit
+
 # API Routing: Get all channels or get a specific channel by ID
 @app.route('/api/channels', methods=['GET'])
 def get_channels():
-    zid = request.args.get('zid')
-    channel_id = request.args.get('channelId')
+    try:
+        listing = ChannelListRequest(request.args)
+    except ValueError as e:
+        return jsonify({"status": "fail", "message": str(e)}), 400
     
     try:
-        print(f"Getting channel list, channelId: {channel_id}, zid: {zid}")
-        
-        # Modify the query to include the is_private field
-        query = supabase.table('channels').select('id, name, created_by, created_at, is_private')
-        
-        # If a specific channel ID is provided, get the channel
-        if channel_id:
-            query = query.eq('id', channel_id)
-        
-        # If a user ID is provided, you can get the channels that the user can access
-        # Filtering based on the channel_members table is implemented here
-        if zid:
-            # Get all channel IDs of the user
-            member_channels = supabase.table('channel_members')\
-                .select('channel_id')\
-                .eq('zid', zid)\
-                .execute()
-            
-            if member_channels.data:
-                channel_ids = [item['channel_id'] for item in member_channels.data]
-                query = query.in_('id', channel_ids)
-            else:
-                # Returns an empty list if the user is not on any channel
-                return jsonify({"status": "success", "data": []})
-        
-        response = query.execute()
-        print(f"Query result: {response.data}")
-        return jsonify({"status": "success", "data": response.data})
+        print(f"Getting channel list, channelId: {listing.channel_id}, zid: {listing.zid}")
+        removals = listing.removals_query(supabase)
+        removed = removals.execute().data if removals is not None else None
+        response = listing.query(supabase).execute()
+        return jsonify(listing.response(response.data, removed))
     except Exception as e:
         print(f"Error getting channel list: {str(e)}")
         traceback.print_exc()
@@ -191,6 +537,8 @@ def create_channel():
         # When a channel is successfully created, the creator is automatically added as a channel member
         if response.data:
             new_channel_id = response.data[0]['id']
+            channel_cache.invalidate_channel(new_channel_id)
+            publish_channel_change(new_channel_id)
             try:
                 member_data = {
                     "channel_id": new_channel_id,
@@ -198,6 +546,8 @@ def create_channel():
                 }
                 member_response = supabase.table("channel_members").insert(member_data).execute()
                 print(f"Added creator as channel member: {member_response.data}")
+                channel_cache.invalidate_channel(new_channel_id)
+                publish_channel_change(new_channel_id)
             except Exception as member_error:
                 print(f"Error adding creator as channel member: {str(member_error)}")
                 # Here we don't interrupt the channel creation process because adding a member fails
@@ -209,51 +559,44 @@ def create_channel():
         traceback.print_exc()
         
         # Provide more specific error messages
-        if "duplicate key" in error_msg.lower():
-            return jsonify({"status": "fail", "message": "Channel name already exists", "error": error_msg}), 409
-        elif "foreign key" in error_msg.lower():
-            return jsonify({"status": "fail", "message": "Invalid creator ID", "error": error_msg}), 400
-        elif "not-null" in error_msg.lower() or "null value" in error_msg.lower():
-            return jsonify({"status": "fail", "message": "Missing required fields", "error": error_msg}), 400
-        elif "column" in error_msg.lower() and "not exist" in error_msg.lower():
-            return jsonify({"status": "fail", "message": "Data table structure mismatch", "error": error_msg}), 400
-        else:
-            return jsonify({"status": "fail", "message": "Failed to create channel", "error": error_msg}), 500
+        message, status = channel_error_response(error_msg)
+        return jsonify({"status": "fail", "message": message, "error": error_msg}), status
 
 # API Routing: Getting Channel-Specific Messages
 @app.route('/api/channels/<string:channel_id>/messages', methods=['GET'])
 def get_channel_messages(channel_id):
     try:
-        # Get channel information
-        channel_response = supabase.table("channels").select("*").eq("id", channel_id).execute()
-        if not channel_response.data:
+        # Check the channel exists
+        if not channel_cache.channel_exists(channel_id):
             return jsonify({"status": "fail", "message": "Channel does not exist"}), 404
         
-        # Get channel information
         try:
-            # Avoid using sorting parameters that can lead to errors
-            messages_response = supabase.table("channel_messages")\
-                .select("id, content, sent_at, sender_zid, is_ai_response")\
-                .eq("channel_id", channel_id)\
-                .execute()
-                
-            # If you need to sort, you can do it in Python
-            if messages_response.data:
-                messages_response.data.sort(key=lambda x: x.get('sent_at', '') or '')
+            page = MessagePageRequest(channel_id, request.args, DEFAULT_MESSAGE_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({"status": "fail", "message": str(e)}), 400
+
+        # Conditional GET: the ETag changes whenever a message is added to the channel
+        etag = channel_etag(channel_id, request.query_string)
+        if request.if_none_match.contains(etag):
+            return with_etag(app.response_class(status=304), etag)
+
+        since_query = page.since_query(supabase)
+        if since_query is not None:
+            try:
+                page.resolve_since(since_query.execute().data)
+            except ValueError as e:
+                return jsonify({"status": "fail", "message": str(e)}), 400
+
+        try:
+            messages_response = page.query(supabase).execute()
         except Exception as e:
             print(f"Error getting messages: {str(e)}")
             traceback.print_exc()
             return jsonify({"status": "fail", "message": "Error processing messages"}), 500
-        
-        print(f"Channel messages result: {messages_response.data}")
-        
-        # Ensure that all messages have the is_ai_response field
-        if messages_response.data:
-            for message in messages_response.data:
-                if 'is_ai_response' not in message:
-                    message['is_ai_response'] = False
-        
-        return jsonify({"status": "success", "data": messages_response.data})
+
+        body = page.response(messages_response.data)
+        print(f"Channel messages result: {len(body['data'])} messages")
+        return with_etag(jsonify(body), etag)
     except Exception as e:
         error_msg = str(e)
         print(f"Error getting channel messages: {error_msg}")
@@ -262,99 +605,44 @@ def get_channel_messages(channel_id):
 
 # API Routing: Send a message on a specific channel
 @app.route('/api/channels/<string:channel_id>/messages', methods=['POST'])
-async def send_channel_message(channel_id):
-    data = request.json
-    if not data:
-        return jsonify({"status": "fail", "message": "No data provided"}), 400
-    
-    sender_zid = data.get('sender_zid')
-    content = data.get('content')
-    
-    if not sender_zid or not content:
-        return jsonify({"status": "fail", "message": "Sender ID and message content are required"}), 400
-    
-    # Add content length validation
-    if len(content) > 10000:  # Setting reasonable length limits
-        return jsonify({"status": "fail", "message": "Message content too long"}), 400
+def send_channel_message(channel_id):
+    try:
+        sender_zid, content = parse_new_message(request.json)
+    except ValueError as e:
+        return jsonify({"status": "fail", "message": str(e)}), 400
     
     try:
         # First check if the channel exists
-        channel_check = supabase.table("channels").select("id").eq("id", channel_id).execute()
-        if not channel_check.data:
+        if not channel_cache.channel_exists(channel_id):
             return jsonify({"status": "fail", "message": "Channel does not exist"}), 404
         
         # Check if the sender is a channel member
-        member_check = supabase.table("channel_members")\
-            .select("channel_id")\
-            .eq("channel_id", channel_id)\
-            .eq("zid", sender_zid)\
-            .execute()
-            
-        if not member_check.data:
+        if not channel_cache.is_member(channel_id, sender_zid):
             return jsonify({"status": "fail", "message": "Only channel members can send messages"}), 403
         
         # Processing AI assistant messages
-        if "@assistant" in content.lower():
+        if is_assistant_question(content):
             try:
-                # Get context message
-                try:
-                    context_response = supabase.table("channel_messages")\
-                        .select("content, sender_zid")\
-                        .eq("channel_id", channel_id)\
-                        .limit(5)\
-                        .execute()
-                        
-                    # If you need to reverse the order, you can do it in Python
-                    if context_response.data:
-                        context_response.data.sort(key=lambda x: x.get('sent_at', ''), reverse=True)
-                except Exception as e:
-                    print(f"Error getting context: {str(e)}")
-                    context_response = None
+                # Get context from the in-memory buffer (backfilled from the database on first use)
+                # With summaries the whole buffer is passed and trimmed to the prompt token budget
+                context = recent_messages.get(channel_id, None if channel_summaries else ASSISTANT_CONTEXT_SIZE)
                 
-                context = context_response.data if context_response and hasattr(context_response, 'data') else []
+                # Save the user's original message and broadcast it to all clients on the channel
+                user_message = store_message(message_row(channel_id, sender_zid, content))
+                if user_message:
+                    broadcast_new_message(channel_id, user_message)
                 
-                # Save the user's original message
-                # Timestamp at the time the message was sent
-                current_time = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                user_message_data = {
+                # Hand the AI reply to a background worker; it is pushed as a new_message event when ready
+                queued = assistant_jobs.submit({
                     "channel_id": channel_id,
-                    "sender_zid": sender_zid,
                     "content": content,
-                    "sent_at": current_time,
-                    "is_ai_response": False
-                }
-                user_response = supabase.table("channel_messages").insert(user_message_data).execute()  # 添加这行
-                # Broadcast user messages to all clients on the channel
-                if user_response.data:
-                    room = f"channel_{channel_id}"
-                    socketio.emit('new_message', user_response.data[0], room=room)
-                
-                # Getting AI responses asynchronously
-                ai_response = await process_ai_assistant_message(content, context)
-                
-                # Save AI's reply message
-                # Timestamp of AI reply message
-                ai_message_data = {
-                    "channel_id": channel_id,
-                    "sender_zid": "AI_ASSISTANT",
-                    "content": ai_response,
-                    "sent_at": datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),  # edit the format
-                    "is_ai_response": True
-                }
-                ai_response_db = supabase.table("channel_messages").insert(ai_message_data).execute()
-                
-                # Broadcast AI replies to all clients on the channel
-                if ai_response_db.data:
-                    room = f"channel_{channel_id}"
-                    socketio.emit('new_message', ai_response_db.data[0], room=room)
-                
-                return jsonify({
-                    "status": "success", 
-                    "data": {
-                        "user_message": user_response.data[0],
-                        "ai_message": ai_response_db.data[0]
-                    }
+                    "context": context
                 })
+                if not queued:
+                    print(f"Assistant queue full, reply skipped for channel {channel_id}")
+                
+                body, status = assistant_question_response(user_message, queued)
+                return jsonify(body), status
             except Exception as e:
                 print(f"Error processing AI message: {str(e)}")
                 traceback.print_exc()
@@ -365,24 +653,13 @@ async def send_channel_message(channel_id):
                 }), 500
         
         # Handling General Messages
-        # Timestamps for normal messages
-        current_time = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')  # edit the format
-        message_data = {
-            "channel_id": channel_id,
-            "sender_zid": sender_zid,
-            "content": content,
-            "sent_at": current_time,
-            "is_ai_response": False
-        }
+        message = store_message(message_row(channel_id, sender_zid, content))
         
-        response = supabase.table("channel_messages").insert(message_data).execute()
-        
-        if response.data:
+        if message:
             # Broadcast a new message to all clients on the channel
-            room = f"channel_{channel_id}"
-            socketio.emit('new_message', response.data[0], room=room)
+            broadcast_new_message(channel_id, message)
         
-        return jsonify({"status": "success", "data": response.data})
+        return jsonify({"status": "success", "data": [message] if message else []})
         
     except Exception as e:
         error_msg = str(e)
@@ -423,20 +700,11 @@ def add_channel_member(channel_id):
         print(f"Adding channel member, channel ID: {channel_id}, user ID: {user_id}")
         
         # First check if the channel exists
-        channel_check = supabase.table("channels").select("id").eq("id", channel_id).execute()
-        print(f"Channel check result: {channel_check.data}")
-        
-        if not channel_check.data:
+        if not channel_cache.channel_exists(channel_id):
             return jsonify({"status": "fail", "message": "Channel does not exist"}), 404
         
         # Check if the user is already a channel member
-        check_query = supabase.table("channel_members")\
-            .select("channel_id, zid")\
-            .eq("channel_id", channel_id)\
-            .eq("zid", user_id)\
-            .execute()
-            
-        if check_query.data:
+        if channel_cache.is_member(channel_id, user_id):
             return jsonify({"status": "fail", "message": "User is already a channel member"}), 409
         
         # Add new member - use the correct field name: zid instead of user_id
@@ -448,6 +716,8 @@ def add_channel_member(channel_id):
         print(f"Member data to be inserted: {member_data}")
         response = supabase.table("channel_members").insert(member_data).execute()
         print(f"Add channel member result: {response.data}")
+        channel_cache.add_member(channel_id, user_id)
+        publish_channel_change(channel_id)
         return jsonify({"status": "success", "data": response.data})
     except Exception as e:
         error_msg = str(e)
@@ -462,13 +732,7 @@ def remove_channel_member(channel_id, zid):
         print(f"Removing channel member, channel ID: {channel_id}, member ID: {zid}")
         
         # Check if the member exists
-        check_query = supabase.table("channel_members")\
-            .select("channel_id, zid")\
-            .eq("channel_id", channel_id)\
-            .eq("zid", zid)\
-            .execute()
-            
-        if not check_query.data:
+        if not channel_cache.is_member(channel_id, zid):
             return jsonify({"status": "fail", "message": "User is not a channel member"}), 404
         
         # Delete member
@@ -479,6 +743,8 @@ def remove_channel_member(channel_id, zid):
             .execute()
             
         print(f"Remove channel member result: {response.data}")
+        channel_cache.remove_member(channel_id, zid)
+        publish_channel_change(channel_id)
         return jsonify({"status": "success", "message": "Successfully removed channel member"})
     except Exception as e:
         error_msg = str(e)
@@ -496,6 +762,10 @@ def delete_channel(channel_id):
         if not creator_check:
             return jsonify({"status": "fail", "message": "Only channel creator can delete the channel"}), 403
         
+        # Write out buffered messages first so none are inserted after the delete
+        if message_writer:
+            message_writer.flush()
+        
         # First delete all relevant messages
         supabase.table("channel_messages").delete().eq("channel_id", channel_id).execute()
         
@@ -504,6 +774,8 @@ def delete_channel(channel_id):
         
         # Finally delete the channel itself
         response = supabase.table("channels").delete().eq("id", channel_id).execute()
+        forget_channel(channel_id)
+        publish_channel_change(channel_id, deleted=True)
         
         if not response.data:
             return jsonify({"status": "fail", "message": "Channel not found"}), 404
@@ -515,6 +787,30 @@ def delete_channel(channel_id):
         traceback.print_exc()
         return jsonify({"status": "fail", "message": "Failed to delete channel", "error": error_msg}), 500
 
+# API Routing: Cache, buffer and worker statistics
+@app.route('/api/service/stats', methods=['GET'])
+def get_service_stats():
+    return jsonify({
+        "status": "success",
+        "data": {
+            "channel_cache": channel_cache.stats(),
+            "recent_messages": recent_messages.stats(),
+            "room_events": room_events.stats(),
+            "assistant_jobs": assistant_jobs.stats(),
+            "assistant_cache": assistant_cache.stats(),
+            "channel_summaries": channel_summaries.stats() if channel_summaries else None,
+            "message_writer": message_writer.stats() if message_writer else None,
+            "broadcaster": broadcaster.stats() if broadcaster else None,
+            "http_pool": pool_stats(),
+            "llm_gateway": llm.stats()
+        }
+    })
+
+# API Routing: Assistant worker status
+@app.route('/api/assistant/status', methods=['GET'])
+def get_assistant_status():
+    return jsonify({"status": "success", "data": assistant_jobs.stats()})
+
 # Generic Functions for Handling Database Errors
 def handle_database_error(e):
     error_message = str(e)
@@ -525,18 +821,27 @@ def handle_database_error(e):
     return jsonify({"status": "fail", "message": "Database operation failed"}), 500
 
 # Modify the startup code
-if __name__ == '__main__':
+def run_dev_server(port: int = 5002) -> None:
+    """Run on the Werkzeug development server (see serve.py for production)"""
     import logging
+    import signal
+    import sys
     logging.basicConfig(level=logging.DEBUG)
     
     print("Starting channel service...")
-    print(f"Server will run on http://127.0.0.1:5002")
+    print(f"Server will run on http://127.0.0.1:{port}")
     print("Use Ctrl+C to stop the server")
     
+    # Exit normally on SIGTERM (docker stop) so atexit handlers flush buffered messages
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     socketio.run(
         app,
-        debug=True,
-        port=5002,
+        debug=os.getenv("CHANNEL_SERVICE_DEBUG", "true").lower() == "true",
+        port=port,
         host='0.0.0.0',
         allow_unsafe_werkzeug=True
-    )
\ No newline at end of file
+    )
+
+if __name__ == '__main__':
+    run_dev_server(int(os.getenv("PORT", "5002")))
@@ -0,0 +1,717 @@
+"""
+ASGI build of the channel service.
+
+Serves the same REST routes and Socket.IO events as channel_service.py, but
+on an asyncio event loop: Supabase is queried through the async client, so
+concurrent requests overlap their I/O waits instead of holding a thread
+each. The AI assistant goes through the same LLM gateway, prompt builder
+and channel summaries as the WSGI build.
+
+Run with:
+    python serve.py channel-asgi
+"""
+import asyncio
+import os
+import traceback
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+import socketio
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from supabase import AsyncClient
+
+from assistant_worker import AsyncAssistantJobQueue
+from channel_cache import AsyncChannelCache
+from channel_queries import (
+    ASSISTANT_COMPLETION_OPTIONS, ASSISTANT_CONTEXT_SIZE, ASSISTANT_ERROR_REPLY, ASSISTANT_PROMPT_TOKENS,
+    ASSISTANT_SENDER_ZID, CONTEXT_MESSAGE_COLUMNS, SUMMARY_COLUMNS, SUMMARY_COMPLETION_OPTIONS,
+    ChannelListRequest, ChannelMessageState, MessagePageRequest, assistant_question_response,
+    build_assistant_prompt, build_summary_messages, channel_error_response, is_assistant_question,
+    is_relayable_message, keyset_filter, message_etag, message_row, parse_new_message,
+)
+from channel_summary import AsyncChannelSummaries
+from event_log import RoomEventLog
+from http_pool import create_async_supabase_client, pool_stats
+from llm_gateway import BATCH, INTERACTIVE, get_gateway
+from message_buffer import RecentMessageBuffer
+from response_cache import AssistantResponseCache
+from socketio_backend import create_async_client_manager
+from ttl_cache import TTLCache
+
+load_dotenv()
+
+# Comma-separated list of frontend origins, or "*"
+ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000")
+allowed_origins = "*" if ALLOWED_ORIGINS == "*" else [origin.strip() for origin in ALLOWED_ORIGINS.split(",")]
+
+supabase_url = os.getenv("SUPABASE_URL")
+supabase_key = os.getenv("SUPABASE_KEY")
+if not supabase_url or not supabase_key:
+    raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY environment variables must be set")
+
+# Created on startup, on the event loop that serves the requests
+supabase: Optional[AsyncClient] = None
+
+# Every LLM call of the process shares one gateway (rate limits, priorities, retries)
+llm = get_gateway()
+
+# With SOCKETIO_MESSAGE_QUEUE set, room broadcasts are shared between worker processes
+client_manager = create_async_client_manager(os.getenv("SOCKETIO_MESSAGE_QUEUE"))
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=allowed_origins, client_manager=client_manager)
+
+DEFAULT_MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+ASSISTANT_STREAMING = os.getenv("ASSISTANT_STREAMING", "true").lower() == "true"
+
+# Replies to repeated @assistant questions, served without calling OpenAI
+assistant_cache = AssistantResponseCache(
+    ttl=float(os.getenv("ASSISTANT_CACHE_TTL", "900")),
+    max_entries=int(os.getenv("ASSISTANT_CACHE_SIZE", "1000")),
+    bypass_prefix=os.getenv("ASSISTANT_CACHE_BYPASS_PREFIX", "!fresh")
+)
+
+# Cache of channel existence and member sets, kept in step by the channel and member endpoints
+async def load_channel_exists(channel_id: str) -> bool:
+    response = await supabase.table("channels").select("id").eq("id", channel_id).execute()
+    return bool(response.data)
+
+async def load_channel_members(channel_id: str) -> list:
+    response = await supabase.table("channel_members").select("zid").eq("channel_id", channel_id).execute()
+    return [row["zid"] for row in response.data or []]
+
+channel_cache = AsyncChannelCache(
+    load_channel_exists,
+    load_channel_members,
+    ttl=float(os.getenv("CHANNEL_CACHE_TTL", "60")),
+    max_channels=int(os.getenv("CHANNEL_CACHE_SIZE", "1000"))
+)
+
+# Recent messages kept in memory per channel, used as AI assistant context
+recent_messages = RecentMessageBuffer(
+    size=int(os.getenv("RECENT_MESSAGE_BUFFER_SIZE", "20")),
+    max_channels=int(os.getenv("RECENT_MESSAGE_MAX_CHANNELS", "500"))
+)
+
+async def get_recent_messages(channel_id, limit: Optional[int]) -> list:
+    """Latest messages of a channel, backfilled from the database on first use"""
+    cached = recent_messages.cached(channel_id, limit)
+    if cached is not None:
+        return cached
+    try:
+        response = await supabase.table("channel_messages")\
+            .select(CONTEXT_MESSAGE_COLUMNS)\
+            .eq("channel_id", str(channel_id))\
+            .order("sent_at", desc=True)\
+            .order("id", desc=True)\
+            .limit(recent_messages.size)\
+            .execute()
+    except Exception as e:
+        print(f"Error backfilling recent messages for channel {channel_id}: {str(e)}")
+        traceback.print_exc()
+        return []
+    return recent_messages.seed(channel_id, list(reversed(response.data or [])), limit)
+
+# Rolling per-channel summary of older discussion, refreshed every CHANNEL_SUMMARY_EVERY stored messages
+CHANNEL_SUMMARY_EVERY = int(os.getenv("CHANNEL_SUMMARY_EVERY", "20"))
+CHANNEL_SUMMARY_BATCH = int(os.getenv("CHANNEL_SUMMARY_BATCH", "200"))
+# Token budget of an assistant prompt (system prompt, summary, recent messages and question)
+ASSISTANT_PROMPT_TOKENS = int(os.getenv("ASSISTANT_PROMPT_TOKENS", str(ASSISTANT_PROMPT_TOKENS)))
+
+async def load_channel_summary(channel_id: str) -> Optional[dict]:
+    response = await supabase.table("channel_summaries").select(SUMMARY_COLUMNS).eq("channel_id", channel_id).execute()
+    return response.data[0] if response.data else None
+
+async def save_channel_summary(channel_id: str, row: dict) -> None:
+    await supabase.table("channel_summaries").upsert({
+        "channel_id": channel_id,
+        **row,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }).execute()
+
+async def load_messages_after(channel_id: str, row: dict) -> list:
+    """Messages after the last summarised one, oldest first; the latest batch for a new summary"""
+    query = supabase.table("channel_messages").select(CONTEXT_MESSAGE_COLUMNS).eq("channel_id", channel_id)
+    if not row.get("last_sent_at"):
+        response = await query.order("sent_at", desc=True).order("id", desc=True).limit(CHANNEL_SUMMARY_BATCH).execute()
+        return list(reversed(response.data or []))
+    key = {"sent_at": row["last_sent_at"], "id": row["last_message_id"]}
+    response = await query.or_(keyset_filter(key, "gt")).order("sent_at").order("id").limit(CHANNEL_SUMMARY_BATCH).execute()
+    return response.data or []
+
+async def summarize_channel(previous_summary: Optional[str], new_messages: list) -> str:
+    return await llm.complete_async(build_summary_messages(previous_summary, new_messages), priority=BATCH,
+                                    **SUMMARY_COMPLETION_OPTIONS)
+
+channel_summaries = None
+if CHANNEL_SUMMARY_EVERY > 0:
+    channel_summaries = AsyncChannelSummaries(
+        load_channel_summary,
+        save_channel_summary,
+        load_messages_after,
+        summarize_channel,
+        refresh_every=CHANNEL_SUMMARY_EVERY,
+        max_channels=int(os.getenv("RECENT_MESSAGE_MAX_CHANNELS", "500"))
+    )
+
+# Messages broadcast to each room, replayed to clients that rejoin with last_seen_id
+room_events = RoomEventLog(
+    size=int(os.getenv("ROOM_EVENT_LOG_SIZE", "200")),
+    max_rooms=int(os.getenv("ROOM_EVENT_LOG_MAX_ROOMS", "1000"))
+)
+
+# Last-message version of each channel, used as the ETag of its message history
+channel_versions = TTLCache(
+    ttl=float(os.getenv("CHANNEL_VERSION_TTL", "30")),
+    max_entries=int(os.getenv("CHANNEL_CACHE_SIZE", "1000"))
+)
+
+async def load_channel_version(channel_id: str) -> str:
+    response = await supabase.table("channel_messages")\
+        .select("id")\
+        .eq("channel_id", channel_id)\
+        .order("sent_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(1)\
+        .execute()
+    return str(response.data[0]["id"]) if response.data else "0"
+
+async def get_channel_version(channel_id) -> str:
+    key = str(channel_id)
+    return await channel_versions.get_or_load_async(key, lambda: load_channel_version(key))
+
+async def store_message(message_data: dict) -> Optional[dict]:
+    response = await supabase.table("channel_messages").insert(message_data).execute()
+    return response.data[0] if response.data else None
+
+# Recent messages, room log and version of each channel, kept in step with every broadcast
+message_state = ChannelMessageState(recent_messages, room_events, channel_versions)
+note_channel_message = message_state.note_message
+
+async def broadcast_new_message(channel_id, message: dict) -> None:
+    """Push a stored message to the channel room and remember it for assistant context"""
+    note_channel_message(channel_id, message)
+    if channel_summaries:
+        channel_summaries.note_message(channel_id)
+    await sio.emit('new_message', message, room=f"channel_{channel_id}")
+
+# Room without clients, used to tell the other worker processes about channel changes
+CLUSTER_ROOM = "_cluster"
+
+async def publish_channel_change(channel_id, deleted: bool = False) -> None:
+    """Let other worker processes drop what they cached about a channel"""
+    if client_manager:
+        await sio.emit('channel_changed', {"channel_id": channel_id, "deleted": deleted}, room=CLUSTER_ROOM)
+
+def forget_channel(channel_id) -> None:
+    """Drop all per-process state of a deleted channel"""
+    message_state.evict(channel_id)
+    channel_cache.invalidate_channel(channel_id)
+    assistant_cache.evict_channel(channel_id)
+    if channel_summaries:
+        channel_summaries.evict(channel_id)
+
+async def process_ai_assistant_message(content: str, channel_context: Optional[list] = None,
+                                       on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+                                       channel_id=None, summary: Optional[str] = None) -> Optional[str]:
+    """
+    Ask the AI assistant a question.
+
+    If on_chunk is given, the completion is streamed and awaited with each
+    piece of text as it arrives. The full reply is returned either way.
+    With a channel_id, repeated questions are answered from assistant_cache.
+    The prompt is the summary (if any) plus the newest context messages that
+    fit in ASSISTANT_PROMPT_TOKENS.
+    """
+    try:
+        content, bypass = assistant_cache.strip_bypass(content)
+        cache_key = None
+        if channel_id is not None and not bypass:
+            cache_key = assistant_cache.key(channel_id, content, channel_context)
+            cached = assistant_cache.get(cache_key)
+            if cached is not None:
+                if on_chunk is not None:
+                    await on_chunk(cached)
+                return cached
+
+        prompt = build_assistant_prompt(content, channel_context, summary=summary, token_budget=ASSISTANT_PROMPT_TOKENS)
+        if prompt.dropped or prompt.truncated:
+            print(f"Assistant prompt trimmed to {prompt.tokens}/{prompt.budget} tokens "
+                  f"(dropped {len(prompt.dropped)}, truncated {prompt.truncated})")
+        messages = prompt.messages
+
+        # Chat replies go ahead of batch work in the gateway
+        if on_chunk is None:
+            reply = await llm.complete_async(messages, priority=INTERACTIVE, **ASSISTANT_COMPLETION_OPTIONS)
+            if cache_key is not None:
+                assistant_cache.set(cache_key, reply)
+            return reply
+
+        parts = []
+        async for delta in llm.stream_async(messages, priority=INTERACTIVE, **ASSISTANT_COMPLETION_OPTIONS):
+            parts.append(delta)
+            await on_chunk(delta)
+        reply = "".join(parts)
+        if cache_key is not None:
+            assistant_cache.set(cache_key, reply)
+        return reply
+    except Exception as e:
+        print(f"Error processing AI assistant message: {str(e)}")
+        traceback.print_exc()
+        return ASSISTANT_ERROR_REPLY
+
+async def run_assistant_job(job: dict) -> None:
+    """Generate, store and broadcast the AI reply for a queued @assistant message"""
+    channel_id = job["channel_id"]
+
+    on_chunk = None
+    stream_id = None
+    if ASSISTANT_STREAMING:
+        # Clients render ai_message_chunk events under stream_id until the final new_message arrives
+        stream_id = str(uuid.uuid4())
+        room = f"channel_{channel_id}"
+        chunk_index = 0
+
+        async def emit_chunk(delta: str) -> None:
+            nonlocal chunk_index
+            await sio.emit('ai_message_chunk', {
+                "channel_id": channel_id,
+                "stream_id": stream_id,
+                "index": chunk_index,
+                "delta": delta
+            }, room=room)
+            chunk_index += 1
+
+        on_chunk = emit_chunk
+
+    summary = await channel_summaries.get(channel_id) if channel_summaries else None
+    ai_response = await process_ai_assistant_message(job["content"], job.get("context"), on_chunk=on_chunk,
+                                                     channel_id=channel_id, summary=summary)
+
+    ai_message = await store_message(message_row(channel_id, ASSISTANT_SENDER_ZID, ai_response, is_ai_response=True))
+    if ai_message:
+        if stream_id:
+            ai_message = {**ai_message, "stream_id": stream_id}
+        await broadcast_new_message(channel_id, ai_message)
+
+# Concurrent @assistant replies, as tasks on the event loop
+assistant_jobs = AsyncAssistantJobQueue(
+    run_assistant_job,
+    workers=int(os.getenv("ASSISTANT_WORKERS", "4")),
+    max_queue=int(os.getenv("ASSISTANT_QUEUE_SIZE", "100"))
+)
+
+# Socket.IO Event Handling
+@sio.on('connect')
+async def handle_connect(sid, environ, auth=None):
+    print(f"Client connected: {sid}")
+
+@sio.on('disconnect')
+async def handle_disconnect(sid, reason=None):
+    print(f"Client disconnected: {sid}")
+
+@sio.on('join')
+async def handle_join(sid, data):
+    channel_id = data.get('channel_id')
+    if channel_id:
+        room = f"channel_{channel_id}"
+        await sio.enter_room(sid, room)
+        print(f"Client {sid} joined room: {room}")
+
+        # A reconnecting client sends the last message it saw; replay what it missed
+        last_seen_id = data.get('last_seen_id')
+        if last_seen_id is not None:
+            await replay_missed_messages(sid, channel_id, last_seen_id)
+
+async def replay_missed_messages(sid, channel_id, last_seen_id) -> None:
+    """Send the messages broadcast after last_seen_id to the joining socket only"""
+    missed = room_events.since(channel_id, last_seen_id)
+    if missed is None:
+        try:
+            up_to_date = str(last_seen_id) == await get_channel_version(channel_id)
+        except Exception as e:
+            print(f"Error checking channel version: {str(e)}")
+            up_to_date = False
+        if not up_to_date:
+            # The gap is older than the log; the client has to refetch over HTTP
+            await sio.emit('resync_required', {"channel_id": channel_id, "last_seen_id": last_seen_id}, to=sid)
+        return
+
+    for message in missed:
+        await sio.emit('new_message', message, to=sid)
+
+@sio.on('leave')
+async def handle_leave(sid, data):
+    channel_id = data.get('channel_id')
+    if channel_id:
+        room = f"channel_{channel_id}"
+        await sio.leave_room(sid, room)
+        print(f"Client {sid} left room: {room}")
+
+@sio.on('send_message')
+async def handle_message(sid, data):
+    channel_id = data.get('channel_id')
+    message = data.get('message')
+    if channel_id and message:
+        room = f"channel_{channel_id}"
+        if not is_relayable_message(message):
+            print(f"Rejected malformed message from client {sid} for room: {room}")
+            return
+        try:
+            # Only relayed: the message is not recorded as assistant context or
+            # in the replay log, and other workers skip it too
+            await sio.emit('new_message', {**message, "relayed": True}, room=room)
+        except Exception as e:
+            print(f"Error broadcasting message: {str(e)}")
+
+# Broadcasts made by other worker processes (only with SOCKETIO_MESSAGE_QUEUE)
+def handle_remote_emit(event, data, room) -> None:
+    """Keep this process's caches in step with broadcasts from other workers"""
+    if event == 'channel_changed':
+        if data.get('deleted'):
+            forget_channel(data['channel_id'])
+        else:
+            channel_cache.invalidate_channel(data['channel_id'])
+        return
+    # Committed messages also bump the channel version, so ETags stay right in mixed deployments
+    message_state.apply_remote_emit(event, data, room)
+
+if client_manager:
+    client_manager.on_remote_emit = handle_remote_emit
+
+def fail(message: str, status: int, error: Optional[str] = None) -> JSONResponse:
+    body = {"status": "fail", "message": message}
+    if error is not None:
+        body["error"] = error
+    return JSONResponse(body, status_code=status)
+
+async def read_json(request: Request) -> Optional[dict]:
+    """Request body as JSON, or None when it is missing or malformed"""
+    try:
+        data = await request.json()
+    except Exception:
+        return None
+    return data or None
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header matches the ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/").strip('"') == etag for tag in tags)
+
+def with_etag(response: Response, etag: str) -> Response:
+    """Attach an ETag and make clients revalidate it on every request"""
+    response.headers["ETag"] = f'"{etag}"'
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# API Routing: Get all channels or get a specific channel by ID
+async def get_channels(request: Request):
+    try:
+        listing = ChannelListRequest(request.query_params)
+    except ValueError as e:
+        return fail(str(e), 400)
+
+    try:
+        removals = listing.removals_query(supabase)
+        removed = (await removals.execute()).data if removals is not None else None
+        response = await listing.query(supabase).execute()
+        return JSONResponse(listing.response(response.data, removed))
+    except Exception as e:
+        print(f"Error getting channel list: {str(e)}")
+        traceback.print_exc()
+        return fail("Failed to get channel list", 500, str(e))
+
+# API Routing: Create New Channel
+async def create_channel(request: Request):
+    data = await read_json(request)
+    if not data:
+        return fail("No data provided", 400)
+    try:
+        name = data.get('name')
+        created_by = data.get('created_by')
+        is_private = data.get('is_private', False)
+
+        if not name or not created_by:
+            return fail("Channel name and creator ID are required", 400)
+
+        channel_data = {
+            "name": name,
+            "created_by": created_by,
+            "is_private": is_private,
+            "created_at": datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        response = await supabase.table("channels").insert(channel_data).execute()
+
+        # When a channel is successfully created, the creator is automatically added as a channel member
+        if response.data:
+            new_channel_id = response.data[0]['id']
+            channel_cache.invalidate_channel(new_channel_id)
+            try:
+                await supabase.table("channel_members").insert({
+                    "channel_id": new_channel_id,
+                    "zid": created_by
+                }).execute()
+            except Exception as member_error:
+                print(f"Error adding creator as channel member: {str(member_error)}")
+            channel_cache.invalidate_channel(new_channel_id)
+            await publish_channel_change(new_channel_id)
+
+        return JSONResponse({"status": "success", "data": response.data})
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error creating channel: {error_msg}")
+        traceback.print_exc()
+        message, status = channel_error_response(error_msg)
+        return fail(message, status, error_msg)
+
+# API Routing: Getting Channel-Specific Messages
+async def get_channel_messages(request: Request):
+    channel_id = request.path_params['channel_id']
+    try:
+        if not await channel_cache.channel_exists(channel_id):
+            return fail("Channel does not exist", 404)
+
+        try:
+            page = MessagePageRequest(channel_id, request.query_params, DEFAULT_MESSAGE_PAGE_SIZE)
+        except ValueError as e:
+            return fail(str(e), 400)
+
+        # Conditional GET: the ETag changes whenever a message is added to the channel
+        etag = message_etag(channel_id, await get_channel_version(channel_id), request.scope.get("query_string", b""))
+        if if_none_match(request, etag):
+            return with_etag(Response(status_code=304), etag)
+
+        since_query = page.since_query(supabase)
+        if since_query is not None:
+            try:
+                page.resolve_since((await since_query.execute()).data)
+            except ValueError as e:
+                return fail(str(e), 400)
+
+        try:
+            messages_response = await page.query(supabase).execute()
+        except Exception as e:
+            print(f"Error getting messages: {str(e)}")
+            traceback.print_exc()
+            return fail("Error processing messages", 500)
+
+        return with_etag(JSONResponse(page.response(messages_response.data)), etag)
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error getting channel messages: {error_msg}")
+        traceback.print_exc()
+        return fail("Failed to get messages", 500, error_msg)
+
+# API Routing: Send a message on a specific channel
+async def send_channel_message(request: Request):
+    channel_id = request.path_params['channel_id']
+    try:
+        sender_zid, content = parse_new_message(await read_json(request))
+    except ValueError as e:
+        return fail(str(e), 400)
+
+    try:
+        # The existence and membership checks hit the cache, so run them together
+        exists, is_member = await asyncio.gather(
+            channel_cache.channel_exists(channel_id),
+            channel_cache.is_member(channel_id, sender_zid)
+        )
+        if not exists:
+            return fail("Channel does not exist", 404)
+        if not is_member:
+            return fail("Only channel members can send messages", 403)
+
+        if is_assistant_question(content):
+            try:
+                # Context is read before the question is stored, as in the WSGI build
+                # With summaries the whole buffer is passed and trimmed to the prompt token budget
+                context = await get_recent_messages(channel_id, None if channel_summaries else ASSISTANT_CONTEXT_SIZE)
+                user_message = await store_message(message_row(channel_id, sender_zid, content))
+                if user_message:
+                    await broadcast_new_message(channel_id, user_message)
+
+                # The reply is generated by a job task and pushed as a new_message event when ready
+                queued = assistant_jobs.submit({
+                    "channel_id": channel_id,
+                    "content": content,
+                    "context": context
+                })
+                if not queued:
+                    print(f"Assistant queue full, reply skipped for channel {channel_id}")
+
+                body, status = assistant_question_response(user_message, queued)
+                return JSONResponse(body, status_code=status)
+            except Exception as e:
+                print(f"Error processing AI message: {str(e)}")
+                traceback.print_exc()
+                return fail("Failed to process AI message", 500, str(e))
+
+        message = await store_message(message_row(channel_id, sender_zid, content))
+        if message:
+            await broadcast_new_message(channel_id, message)
+        return JSONResponse({"status": "success", "data": [message] if message else []})
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error sending message: {error_msg}")
+        traceback.print_exc()
+        return fail("Failed to send message", 500, error_msg)
+
+# API Routing: Get Channel Members
+async def get_channel_members(request: Request):
+    channel_id = request.path_params['channel_id']
+    try:
+        members_response = await supabase.table("channel_members")\
+            .select("channel_id, zid")\
+            .eq("channel_id", channel_id)\
+            .execute()
+        return JSONResponse({"status": "success", "data": members_response.data})
+    except Exception as e:
+        print(f"Error getting channel members: {str(e)}")
+        traceback.print_exc()
+        return fail("Failed to get channel members", 500, str(e))
+
+# API Routing: Adding Users to Channels
+async def add_channel_member(request: Request):
+    channel_id = request.path_params['channel_id']
+    data = await read_json(request)
+    if not data:
+        return fail("No data provided", 400)
+
+    user_id = data.get('user_id')
+    if not user_id:
+        return fail("User ID is required", 400)
+
+    try:
+        if not await channel_cache.channel_exists(channel_id):
+            return fail("Channel does not exist", 404)
+        if await channel_cache.is_member(channel_id, user_id):
+            return fail("User is already a channel member", 409)
+
+        response = await supabase.table("channel_members").insert({
+            "channel_id": channel_id,
+            "zid": user_id
+        }).execute()
+        channel_cache.add_member(channel_id, user_id)
+        await publish_channel_change(channel_id)
+        return JSONResponse({"status": "success", "data": response.data})
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error adding channel member: {error_msg}")
+        traceback.print_exc()
+        return fail("Failed to add channel member", 500, error_msg)
+
+# API Routing: Delete Channel Members
+async def remove_channel_member(request: Request):
+    channel_id = request.path_params['channel_id']
+    zid = request.path_params['zid']
+    try:
+        if not await channel_cache.is_member(channel_id, zid):
+            return fail("User is not a channel member", 404)
+
+        await supabase.table("channel_members")\
+            .delete()\
+            .eq("channel_id", channel_id)\
+            .eq("zid", zid)\
+            .execute()
+        channel_cache.remove_member(channel_id, zid)
+        await publish_channel_change(channel_id)
+        return JSONResponse({"status": "success", "message": "Successfully removed channel member"})
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error removing channel member: {error_msg}")
+        traceback.print_exc()
+        return fail("Failed to remove channel member", 500, error_msg)
+
+# API Routing: Delete Channel
+async def delete_channel(request: Request):
+    channel_id = request.path_params['channel_id']
+    try:
+        await supabase.table("channel_messages").delete().eq("channel_id", channel_id).execute()
+        await supabase.table("channel_members").delete().eq("channel_id", channel_id).execute()
+        response = await supabase.table("channels").delete().eq("id", channel_id).execute()
+        forget_channel(channel_id)
+        await publish_channel_change(channel_id, deleted=True)
+
+        if not response.data:
+            return fail("Channel not found", 404)
+        return JSONResponse({"status": "success", "message": "Channel successfully deleted"})
+    except Exception as e:
+        error_msg = str(e)
+        print(f"Error deleting channel: {error_msg}")
+        traceback.print_exc()
+        return fail("Failed to delete channel", 500, error_msg)
+
+# API Routing: Cache, buffer and worker statistics
+async def get_service_stats(request: Request):
+    return JSONResponse({
+        "status": "success",
+        "data": {
+            "channel_cache": channel_cache.stats(),
+            "recent_messages": recent_messages.stats(),
+            "room_events": room_events.stats(),
+            "assistant_jobs": assistant_jobs.stats(),
+            "assistant_cache": assistant_cache.stats(),
+            "channel_summaries": channel_summaries.stats() if channel_summaries else None,
+            "llm_gateway": llm.stats(),
+            # Write-behind and coalescing are only available in the WSGI build
+            "message_writer": None,
+            "broadcaster": None,
+            "http_pool": pool_stats()
+        }
+    })
+
+# API Routing: Assistant worker status
+async def get_assistant_status(request: Request):
+    return JSONResponse({"status": "success", "data": assistant_jobs.stats()})
+
+@asynccontextmanager
+async def lifespan(app):
+    global supabase
+    if supabase is None:
+        supabase = await create_async_supabase_client(supabase_url, supabase_key)
+    try:
+        await supabase.table('channels').select("id").limit(1).execute()
+        print("✅ Database connection successful!")
+    except Exception as e:
+        print("❌ Database connection failed!")
+        print(f"Error message: {str(e)}")
+    yield
+    # Let replies that are already being generated finish
+    await assistant_jobs.shutdown()
+
+routes = [
+    Route('/api/channels', get_channels, methods=['GET']),
+    Route('/api/channels', create_channel, methods=['POST']),
+    Route('/api/channels/{channel_id}/messages', get_channel_messages, methods=['GET']),
+    Route('/api/channels/{channel_id}/messages', send_channel_message, methods=['POST']),
+    Route('/api/channels/{channel_id}/members', get_channel_members, methods=['GET']),
+    Route('/api/channels/{channel_id}/members', add_channel_member, methods=['POST']),
+    Route('/api/channels/{channel_id}/members/{zid}', remove_channel_member, methods=['DELETE']),
+    Route('/api/channels/{channel_id}', delete_channel, methods=['DELETE']),
+    Route('/api/service/stats', get_service_stats, methods=['GET']),
+    Route('/api/assistant/status', get_assistant_status, methods=['GET']),
+]
+
+api = Starlette(
+    routes=routes,
+    middleware=[Middleware(
+        CORSMiddleware,
+        allow_origins=["*"] if allowed_origins == "*" else allowed_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )],
+    lifespan=lifespan,
+)
+
+# Socket.IO on /socket.io, everything else goes to the REST routes
+app = socketio.ASGIApp(sio, other_asgi_app=api)
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ttl_cache import TTLCache
+
+
+def _spawn_thread(target: Callable, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+class ChannelSummaries:
+    """
+    Rolling summary of the discussion in each channel.
+
+    Every `refresh_every` messages stored in a channel, a background task
+    loads the messages written since the last summary, folds them into the
+    previous summary through `summarize` and persists the result. Questions
+    read the persisted summary (cached for `ttl` seconds), so answering one
+    never waits for a summary to be built.
+    """
+
+    def __init__(self, load_summary: Callable[[str], Optional[dict]],
+                 save_summary: Callable[[str, dict], None],
+                 load_messages_after: Callable[[str, dict], List[dict]],
+                 summarize: Callable[[Optional[str], List[dict]], str],
+                 refresh_every: int = 20, ttl: float = 300.0, max_channels: int = 1000,
+                 spawn: Optional[Callable] = None):
+        """
+        Args:
+            load_summary: Function returning the persisted summary row of a channel, or None
+            save_summary: Function persisting the summary row of a channel
+            load_messages_after: Function (channel_id, row) returning, oldest first, the
+                messages after the row's last_message_id/last_sent_at (all if the row is empty)
+            summarize: Function (previous summary or None, new messages) returning the new summary
+            refresh_every: Messages stored in a channel between refreshes
+            ttl: Seconds a loaded summary is cached
+            max_channels: Number of summaries cached before LRU eviction
+            spawn: Function (target, *args) that starts a background task.
+                Defaults to a daemon thread
+        """
+        self.load_summary = load_summary
+        self.save_summary = save_summary
+        self.load_messages_after = load_messages_after
+        self.summarize = summarize
+        self.refresh_every = refresh_every
+        self._spawn = spawn or _spawn_thread
+        self._rows = TTLCache(ttl=ttl, max_entries=max_channels)
+        self._pending: Dict[str, int] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.failures = 0
+
+    def _key(self, channel_id) -> str:
+        return str(channel_id)
+
+    def get(self, channel_id) -> Optional[str]:
+        """Latest persisted summary of a channel, or None if it has none yet"""
+        key = self._key(channel_id)
+        try:
+            row = self._rows.get_or_load(key, lambda: self.load_summary(key) or {})
+        except Exception as e:
+            print(f"Error loading summary of channel {key}: {str(e)}")
+            return None
+        return row.get("summary") or None
+
+    def note_message(self, channel_id) -> None:
+        """Count a stored message; starts a refresh once `refresh_every` have been counted"""
+        key = self._key(channel_id)
+        with self._lock:
+            pending = self._pending.get(key, 0) + 1
+            if pending < self.refresh_every or key in self._refreshing:
+                self._pending[key] = pending
+                return
+            self._pending[key] = 0
+            self._refreshing.add(key)
+        self._spawn(self._run_refresh, key)
+
+    def _run_refresh(self, key: str) -> None:
+        try:
+            self.refresh(key)
+        except Exception as e:
+            self._refresh_failed(key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_failed(self, key: str, error: Exception) -> None:
+        with self._lock:
+            self.failures += 1
+        print(f"Error refreshing summary of channel {key}: {str(error)}")
+        traceback.print_exc()
+
+    @staticmethod
+    def _folded_row(row: dict, messages: List[dict], summary: str) -> dict:
+        """Summary row after folding `messages` into `row`"""
+        last = messages[-1]
+        return {
+            "summary": summary,
+            "last_message_id": last.get("id"),
+            "last_sent_at": last.get("sent_at"),
+            "message_count": (row.get("message_count") or 0) + len(messages),
+        }
+
+    def refresh(self, channel_id) -> dict:
+        """Fold the messages since the last summary into it and persist the result"""
+        key = self._key(channel_id)
+        # Reload the row: another process may have refreshed it in the meantime
+        row = self.load_summary(key) or {}
+        messages = self.load_messages_after(key, row)
+        if messages:
+            row = self._folded_row(row, messages, self.summarize(row.get("summary"), messages))
+            self.save_summary(key, row)
+            with self._lock:
+                self.refreshes += 1
+        self._rows.set(key, row)
+        return row
+
+    def evict(self, channel_id) -> None:
+        """Forget a channel, e.g. after it was deleted"""
+        key = self._key(channel_id)
+        self._rows.invalidate(key)
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "refresh_every": self.refresh_every,
+                "refreshing": len(self._refreshing),
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "cache": self._rows.stats(),
+            }
+
+
+class AsyncChannelSummaries(ChannelSummaries):
+    """ChannelSummaries whose loaders, saver and summarize are coroutines, for the ASGI build"""
+
+    def __init__(self, load_summary: Callable[[str], Awaitable[Optional[dict]]],
+                 save_summary: Callable[[str, dict], Awaitable[None]],
+                 load_messages_after: Callable[[str, dict], Awaitable[List[dict]]],
+                 summarize: Callable[[Optional[str], List[dict]], Awaitable[str]],
+                 refresh_every: int = 20, ttl: float = 300.0, max_channels: int = 1000):
+        super().__init__(load_summary, save_summary, load_messages_after, summarize,
+                         refresh_every=refresh_every, ttl=ttl, max_channels=max_channels,
+                         spawn=self._spawn_task)
+        # Running refreshes, referenced so they are not garbage collected
+        self._tasks: set = set()
+
+    def _spawn_task(self, target: Callable, *args) -> None:
+        task = asyncio.get_running_loop().create_task(target(*args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def get(self, channel_id) -> Optional[str]:
+        key = self._key(channel_id)
+
+        async def load() -> dict:
+            return await self.load_summary(key) or {}
+
+        try:
+            row = await self._rows.get_or_load_async(key, load)
+        except Exception as e:
+            print(f"Error loading summary of channel {key}: {str(e)}")
+            return None
+        return row.get("summary") or None
+
+    async def _run_refresh(self, key: str) -> None:
+        try:
+            await self.refresh(key)
+        except Exception as e:
+            self._refresh_failed(key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def refresh(self, channel_id) -> dict:
+        key = self._key(channel_id)
+        row = await self.load_summary(key) or {}
+        messages = await self.load_messages_after(key, row)
+        if messages:
+            row = self._folded_row(row, messages, await self.summarize(row.get("summary"), messages))
+            await self.save_summary(key, row)
+            with self._lock:
+                self.refreshes += 1
+        self._rows.set(key, row)
+        return row
@@ -0,0 +1,211 @@
+"""
+Contribution analysis of every group of a course for one assignment.
+
+Instead of one set of queries per group, the rows of all groups are read
+with a few bulk queries (ID lists split into chunks, results paged). The
+per-group statistics are then computed in worker processes and the AI
+analyses run on a bounded thread pool. analyze_cohort yields an event as
+each group finishes, so callers can stream progress.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from contribution_metrics import group_metrics
+
+logger = logging.getLogger(__name__)
+
+# IDs per in_() filter, keeping request URLs short
+IN_CHUNK_SIZE = 200
+# Rows per page; PostgREST caps a response at its max-rows setting (1000 on Supabase)
+PAGE_SIZE = 1000
+
+
+def fetch_rows(supabase, table: str, columns: str, order: Sequence[str], column: Optional[str] = None,
+               values: Optional[List[Any]] = None, filters: Optional[Dict[str, Any]] = None,
+               chunk_size: int = IN_CHUNK_SIZE, page_size: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+    """
+    All rows of a table matching equality filters and, optionally, column IN values.
+
+    Args:
+        supabase: Supabase client
+        table: Table to read
+        columns: Columns to select
+        order: Columns giving the rows a stable order across pages
+        column: Column matched against values
+        values: Values of column; split into chunks of chunk_size
+        filters: Column equality filters
+    """
+    if column is not None and not values:
+        return []
+    chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)] if column else [None]
+    rows: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        offset = 0
+        while True:
+            query = supabase.table(table).select(columns)
+            if chunk is not None:
+                query = query.in_(column, chunk)
+            for name, value in (filters or {}).items():
+                query = query.eq(name, value)
+            for name in order:
+                query = query.order(name)
+            page = query.range(offset, offset + page_size - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+            offset += page_size
+    return rows
+
+
+def prefetch_cohort(supabase, course_code: str, assignment_id: str,
+                    use_aggregates: bool = False) -> List[Dict[str, Any]]:
+    """
+    Rows of every group of a course, read with one bulk query per table.
+
+    With use_aggregates, a group's peer review scores come from its
+    peer_review_aggregates rows instead of its individual reviews.
+
+    Returns:
+        One dictionary per group in the shape group_metrics expects
+    """
+    groups = fetch_rows(supabase, "groups", "id", ["id"], filters={"course_code": course_code})
+    group_ids = [group["id"] for group in groups]
+
+    members = fetch_rows(supabase, "group_members", "group_id,member_zid", ["group_id", "member_zid"],
+                         "group_id", group_ids)
+    if use_aggregates:
+        aggregates = fetch_rows(supabase, "peer_review_aggregates",
+                                "group_id,reviewee_zid,review_count,score_sum,score_sumsq,score_min,score_max",
+                                ["group_id", "reviewee_zid"], "group_id", group_ids,
+                                filters={"assignment_id": assignment_id})
+        reviews = []
+    else:
+        aggregates = []
+        reviews = fetch_rows(supabase, "peer_reviews", "group_id,reviewer_zid,reviewee_zid,score",
+                             ["group_id", "reviewer_zid", "reviewee_zid", "created_at"], "group_id", group_ids,
+                             filters={"assignment_id": assignment_id})
+    meetings = fetch_rows(supabase, "meetings", "id,group_id", ["id"], "group_id", group_ids)
+    attendance = fetch_rows(supabase, "meeting_attendances", "meeting_id,member_zid", ["meeting_id", "member_zid"],
+                            "meeting_id", [meeting["id"] for meeting in meetings])
+    tasks = fetch_rows(supabase, "tasks", "task_id,group_id,description", ["task_id"], "group_id", group_ids,
+                       filters={"assignment_id": assignment_id})
+    assignees = fetch_rows(supabase, "task_assignees", "task_id,zid,is_completed", ["task_id", "zid"],
+                           "task_id", [task["task_id"] for task in tasks])
+    channels = fetch_rows(supabase, "channels", "id,group_id", ["id"], "group_id", group_ids)
+    # Like the single-group analysis, only the first channel of a group counts
+    channel_group: Dict[Any, Any] = {}
+    grouped_channels = set()
+    for channel in channels:
+        if channel["group_id"] not in grouped_channels:
+            grouped_channels.add(channel["group_id"])
+            channel_group[channel["id"]] = channel["group_id"]
+    messages = fetch_rows(supabase, "channel_messages", "id,channel_id,sender_zid", ["id"],
+                          "channel_id", list(channel_group))
+
+    by_group: Dict[Any, Dict[str, Any]] = {
+        group_id: {"group_id": group_id, "members": [], "meeting_ids": [], "attendance": [], "tasks": [],
+                   "assignees": [], "messages": [], "reviews": [],
+                   "aggregates": [] if use_aggregates else None}
+        for group_id in group_ids
+    }
+    for row in members:
+        by_group[row["group_id"]]["members"].append({"zid": row["member_zid"]})
+    for row in reviews:
+        by_group[row["group_id"]]["reviews"].append(row)
+    for row in aggregates:
+        by_group[row["group_id"]]["aggregates"].append(row)
+    meeting_group = {}
+    for row in meetings:
+        meeting_group[row["id"]] = row["group_id"]
+        by_group[row["group_id"]]["meeting_ids"].append(row["id"])
+    for row in attendance:
+        by_group[meeting_group[row["meeting_id"]]]["attendance"].append(row)
+    task_group = {}
+    for row in tasks:
+        task_group[row["task_id"]] = row["group_id"]
+        by_group[row["group_id"]]["tasks"].append(row)
+    for row in assignees:
+        by_group[task_group[row["task_id"]]]["assignees"].append(row)
+    for row in messages:
+        by_group[channel_group[row["channel_id"]]]["messages"].append(row)
+    return list(by_group.values())
+
+
+def fetch_course_reviews(supabase, course_code: str, assignment_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Peer reviews and members of every group of a course, read in bulk.
+
+    Returns:
+        Tuple of (reviews with group_id, reviewer_zid, reviewee_zid and score, {member zid: group_id})
+    """
+    groups = fetch_rows(supabase, "groups", "id", ["id"], filters={"course_code": course_code})
+    group_ids = [group["id"] for group in groups]
+    members = fetch_rows(supabase, "group_members", "group_id,member_zid", ["group_id", "member_zid"],
+                         "group_id", group_ids)
+    reviews = fetch_rows(supabase, "peer_reviews", "group_id,reviewer_zid,reviewee_zid,score",
+                         ["group_id", "reviewer_zid", "reviewee_zid", "created_at"], "group_id", group_ids,
+                         filters={"assignment_id": assignment_id})
+    return reviews, {row["member_zid"]: row["group_id"] for row in members}
+
+
+def analyze_cohort(supabase, course_code: str, assignment_id: str,
+                   complete: Callable[..., Dict[str, Any]], processes: int = 2,
+                   llm_concurrency: int = 4, use_aggregates: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Analyze every group of a course, yielding events as the groups finish.
+
+    Events, each a dictionary with an "event" key:
+        started: {course_code, assignment_id, groups, prefetch_ms}
+        group: {group_id, done, total, data}, data as returned by complete
+        group_failed: {group_id, done, total, error}
+        finished: {succeeded, failed, total_ms}
+
+    Args:
+        supabase: Supabase client
+        course_code: Course whose groups are analyzed
+        assignment_id: Assignment the peer reviews and tasks belong to
+        complete: Function (group_id, assignment_id, attendance, tasks, channel_activity,
+            review_stats) running the AI analysis of a group and saving it
+        processes: Worker processes computing the statistics (0 computes them in a thread)
+        llm_concurrency: Groups whose AI analysis runs at the same time
+        use_aggregates: Read peer_review_aggregates instead of every peer review
+    """
+    started = time.monotonic()
+    groups = prefetch_cohort(supabase, course_code, assignment_id, use_aggregates)
+    total = len(groups)
+    yield {"event": "started", "course_code": course_code, "assignment_id": assignment_id, "groups": total,
+           "prefetch_ms": round((time.monotonic() - started) * 1000, 1)}
+
+    def finish(metrics: Dict[str, Any]) -> Dict[str, Any]:
+        if not metrics["members"]:
+            raise LookupError("No members found in this group")
+        return complete(metrics["group_id"], assignment_id, metrics["attendance"], metrics["tasks"],
+                        metrics["channel_activity"], metrics["review_stats"])
+
+    done = succeeded = 0
+    metric_pool = ProcessPoolExecutor(max_workers=processes) if processes > 0 else ThreadPoolExecutor(max_workers=1)
+    with metric_pool, ThreadPoolExecutor(max_workers=llm_concurrency, thread_name_prefix="cohort-llm") as llm_pool:
+        pending = {metric_pool.submit(group_metrics, rows): ("metrics", rows["group_id"]) for rows in groups}
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step, group_id = pending.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    if not isinstance(e, LookupError):
+                        logger.exception("Error analyzing group %s: %s", group_id, e)
+                    done += 1
+                    yield {"event": "group_failed", "group_id": group_id, "done": done, "total": total,
+                           "error": str(e)}
+                    continue
+                if step == "metrics":
+                    pending[llm_pool.submit(finish, value)] = ("analysis", group_id)
+                else:
+                    done += 1
+                    succeeded += 1
+                    yield {"event": "group", "group_id": group_id, "done": done, "total": total, "data": value}
+    yield {"event": "finished", "succeeded": succeeded, "failed": total - succeeded,
+           "total_ms": round((time.monotonic() - started) * 1000, 1)}
@@ -0,0 +1,141 @@
+"""
+Per-member contribution statistics computed from already loaded rows.
+
+The functions do no I/O, so the same code serves the single-group
+analysis, which loads one group's rows, and the cohort analysis, which
+loads every group's rows in bulk and computes the groups in worker
+processes.
+"""
+import math
+from typing import Any, Dict, List
+
+
+def attendance_stats(members: List[Dict[str, Any]], meeting_ids: List[Any],
+                     attendance_records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Meetings attended, meetings held and attendance rate per member"""
+    attendance_count = {member["zid"]: 0 for member in members}
+    for record in attendance_records:
+        zid = record.get("member_zid")
+        if zid in attendance_count:
+            attendance_count[zid] += 1
+
+    result = {}
+    total = len(meeting_ids)
+    for zid, attended in attendance_count.items():
+        rate = round(attended / total, 2) if total > 0 else 0.0
+        result[zid] = {"attended": attended, "total": total, "attendance_rate": rate}
+    return result
+
+
+def task_stats(members: List[Dict[str, Any]], tasks: List[Dict[str, Any]],
+               assignees: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Tasks assigned and completed, completion rate and average description length per member"""
+    task_descriptions = {task["task_id"]: task.get("description") or "" for task in tasks}
+    stats = {member["zid"]: {"assigned": 0, "completed": 0, "avg_difficulty": 0.0, "completion_rate": 0.0} for member in members}
+    length_sum = {member["zid"]: 0 for member in members}
+
+    for a in assignees:
+        zid = a["zid"]
+        if zid in stats:
+            stats[zid]["assigned"] += 1
+            if a.get("is_completed"):
+                stats[zid]["completed"] += 1
+            length_sum[zid] += len(task_descriptions.get(a["task_id"], ""))
+
+    for zid, stat in stats.items():
+        if stat["assigned"] > 0:
+            stat["avg_difficulty"] = round(length_sum[zid] / stat["assigned"], 2)
+            stat["completion_rate"] = round(stat["completed"] / stat["assigned"], 2)
+    return stats
+
+
+def channel_stats(members: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Messages sent in the group channel per member"""
+    result = {member["zid"]: {"message_count": 0} for member in members}
+    for msg in messages:
+        zid = msg.get("sender_zid")
+        if zid in result:
+            result[zid]["message_count"] += 1
+    return result
+
+
+def aggregate_reviews(reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Running aggregates per reviewee, in the shape of peer_review_aggregates rows.
+
+    Returns:
+        One row per reviewed member with reviewee_zid, review_count, score_sum,
+        score_sumsq, score_min and score_max
+    """
+    aggregates: Dict[str, Dict[str, Any]] = {}
+    for review in reviews:
+        score = float(review["score"])
+        row = aggregates.get(review["reviewee_zid"])
+        if row is None:
+            aggregates[review["reviewee_zid"]] = {
+                "reviewee_zid": review["reviewee_zid"], "review_count": 1, "score_sum": score,
+                "score_sumsq": score * score, "score_min": score, "score_max": score,
+            }
+        else:
+            row["review_count"] += 1
+            row["score_sum"] += score
+            row["score_sumsq"] += score * score
+            row["score_min"] = min(row["score_min"], score)
+            row["score_max"] = max(row["score_max"], score)
+    return list(aggregates.values())
+
+
+def review_stats(members: List[Dict[str, Any]], aggregates: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Review count, mean, sample standard deviation, min and max score per member.
+
+    Computed from the aggregates alone, in O(members); members nobody
+    reviewed get a count and mean of 0.
+    """
+    by_zid = {row["reviewee_zid"]: row for row in aggregates}
+    stats = {}
+    for member in members:
+        row = by_zid.get(member["zid"])
+        count = row["review_count"] if row else 0
+        if not count:
+            stats[member["zid"]] = {"count": 0, "mean": 0.0, "stdev": 0.0, "min": None, "max": None}
+            continue
+        total, total_sq = float(row["score_sum"]), float(row["score_sumsq"])
+        mean = total / count
+        # Rounding can leave a tiny negative sum of squared deviations
+        variance = max(total_sq - count * mean * mean, 0.0) / (count - 1) if count > 1 else 0.0
+        stats[member["zid"]] = {"count": count, "mean": mean, "stdev": round(math.sqrt(variance), 4),
+                                "min": float(row["score_min"]), "max": float(row["score_max"])}
+    return stats
+
+
+def average_scores(members: List[Dict[str, Any]], reviews: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Average peer review score per member; 0.0 for members nobody reviewed"""
+    return {zid: stat["mean"] for zid, stat in review_stats(members, aggregate_reviews(reviews)).items()}
+
+
+def group_metrics(rows: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    All statistics of one group from its prefetched rows.
+
+    Args:
+        rows: The group's "group_id", "members" ([{"zid"}]), "meeting_ids",
+            "attendance", "tasks", "assignees", "messages", and either its
+            peer_review_aggregates rows as "aggregates" or its raw "reviews"
+
+    Returns:
+        Dictionary with group_id, members, attendance, tasks, channel_activity,
+        review_stats and average_scores
+    """
+    members = rows["members"]
+    aggregates = rows.get("aggregates")
+    stats = review_stats(members, aggregates if aggregates is not None else aggregate_reviews(rows["reviews"]))
+    return {
+        "group_id": rows["group_id"],
+        "members": members,
+        "attendance": attendance_stats(members, rows["meeting_ids"], rows["attendance"]),
+        "tasks": task_stats(members, rows["tasks"], rows["assignees"]),
+        "channel_activity": channel_stats(members, rows["messages"]),
+        "review_stats": stats,
+        "average_scores": {zid: stat["mean"] for zid, stat in stats.items()},
+    }
@@ -0,0 +1,100 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+
+class RoomEventLog:
+    """
+    Bounded log of the messages broadcast to each channel room.
+
+    Lets a client that reconnects catch up from the last message it saw
+    instead of refetching the history. Each room keeps its last `size`
+    messages; rooms beyond `max_rooms` are dropped least recently used first.
+    """
+
+    def __init__(self, size: int = 200, max_rooms: int = 1000):
+        """
+        Args:
+            size: Number of messages kept per room
+            max_rooms: Number of rooms kept before LRU eviction
+        """
+        self.size = size
+        self.max_rooms = max_rooms
+        self._rooms: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, channel_id) -> str:
+        return str(channel_id)
+
+    def record(self, channel_id, message: dict) -> None:
+        """Append a broadcast message to the room's log"""
+        key = self._key(channel_id)
+        with self._lock:
+            log = self._rooms.get(key)
+            if log is None:
+                log = deque(maxlen=self.size)
+                self._rooms[key] = log
+                while len(self._rooms) > self.max_rooms:
+                    self._rooms.popitem(last=False)
+            self._rooms.move_to_end(key)
+            log.append(message)
+
+    def replace(self, channel_id, provisional_id, message: dict) -> None:
+        """
+        Swap a message broadcast with a provisional ID for its stored version.
+
+        The provisional ID is kept on the entry, so clients that only saw the
+        provisional message can still resume from it.
+        """
+        with self._lock:
+            log = self._rooms.get(self._key(channel_id))
+            if log is None:
+                return
+            for i, logged in enumerate(log):
+                if logged.get("id") == provisional_id:
+                    log[i] = {**message, "provisional_id": provisional_id}
+                    return
+
+    def remove(self, channel_id, message_id) -> None:
+        """Drop a logged message, e.g. one whose insert failed for good, so it is not replayed"""
+        with self._lock:
+            log = self._rooms.get(self._key(channel_id))
+            if log is None:
+                return
+            kept = [m for m in log if m.get("id") != message_id]
+            if len(kept) != len(log):
+                self._rooms[self._key(channel_id)] = deque(kept, maxlen=self.size)
+
+    def since(self, channel_id, last_seen_id) -> Optional[List[dict]]:
+        """
+        Get the messages logged after `last_seen_id`, oldest first.
+
+        Returns:
+            List of messages, or None if `last_seen_id` is not in the log
+            (it is older than the log, or the log was lost) and the client
+            has to resync
+        """
+        last_seen = str(last_seen_id)
+        with self._lock:
+            log = self._rooms.get(self._key(channel_id))
+            if log is None:
+                return None
+            entries = list(log)
+        for i in range(len(entries) - 1, -1, -1):
+            entry = entries[i]
+            if str(entry.get("id")) == last_seen or str(entry.get("provisional_id")) == last_seen:
+                return entries[i + 1:]
+        return None
+
+    def evict(self, channel_id) -> None:
+        with self._lock:
+            self._rooms.pop(self._key(channel_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "rooms": len(self._rooms),
+                "messages": sum(len(log) for log in self._rooms.values()),
+                "size": self.size,
+                "max_rooms": self.max_rooms,
+            }
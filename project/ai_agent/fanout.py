@@ -0,0 +1,72 @@
+import logging
+import time
+from concurrent.futures import Executor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CollectorTimeout(Exception):
+    """A collector without a fallback did not finish within its timeout"""
+
+
+def run_collectors(collectors: Dict[str, Callable[[], Any]], executor: Executor, timeout: float,
+                   timeouts: Optional[Dict[str, float]] = None,
+                   fallbacks: Optional[Dict[str, Callable[[], Any]]] = None) -> Tuple[Dict[str, Any], Dict[str, dict]]:
+    """
+    Run independent data collectors at the same time.
+
+    Every collector is submitted to `executor` at once and gets `timeout`
+    seconds (or its own entry in `timeouts`), counted from the start. A
+    collector that times out or raises is replaced by its fallback; without a
+    fallback, the timeout or exception is raised once all collectors are done
+    or have timed out.
+
+    Returns:
+        Tuple of (results by name, timings by name). A timing holds the
+        collector's duration in milliseconds and its status: "ok", "timeout"
+        or "error"
+    """
+    timeouts = timeouts or {}
+    fallbacks = fallbacks or {}
+    started = time.monotonic()
+    finished_at: Dict[str, float] = {}
+
+    def timed(name: str, collector: Callable[[], Any]) -> Callable[[], Any]:
+        def run():
+            try:
+                return collector()
+            finally:
+                finished_at[name] = time.monotonic()
+        return run
+
+    futures = {name: executor.submit(timed(name, collector)) for name, collector in collectors.items()}
+    results: Dict[str, Any] = {}
+    timings: Dict[str, dict] = {}
+    failure: Optional[BaseException] = None
+    for name, future in futures.items():
+        remaining = started + timeouts.get(name, timeout) - time.monotonic()
+        try:
+            results[name] = future.result(timeout=max(remaining, 0))
+            status = "ok"
+        except FutureTimeoutError:
+            # The collector keeps its worker until it returns; its result is ignored
+            future.cancel()
+            status = "timeout"
+            error: BaseException = CollectorTimeout(f"{name} did not finish in {timeouts.get(name, timeout)}s")
+            logger.warning("Collector %s timed out", name)
+        except Exception as e:
+            logger.exception("Error in collector %s: %s", name, e)
+            status = "error"
+            error = e
+        if status != "ok":
+            fallback = fallbacks.get(name)
+            if fallback is None:
+                failure = failure or error
+            else:
+                results[name] = fallback()
+        elapsed = finished_at.get(name, time.monotonic()) - started
+        timings[name] = {"ms": round(elapsed * 1000, 1), "status": status}
+    if failure is not None:
+        raise failure
+    return results, timings
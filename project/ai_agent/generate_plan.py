@@ -1,9 +1,9 @@
 import os
-import requests
 import pdfplumber
-from openai import OpenAI
 from dotenv import load_dotenv
-from supabase import create_client
+from http_pool import create_supabase_client, get_http_client
+from llm_gateway import BATCH, get_gateway
+from prompt_builder import PromptBuilder, prompt_budget
 
 # Load environment variables
 load_dotenv()
@@ -11,12 +11,22 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-# Initializing OpenAI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Token budgets of an agenda request; the PDF text is cut to fit
+AGENDA_PROMPT_TOKENS = int(os.getenv("AGENDA_PROMPT_TOKENS", "12000"))
+AGENDA_MAX_TOKENS = int(os.getenv("AGENDA_MAX_TOKENS", "1500"))
+
+# OpenAI calls go through the process-wide LLM gateway
+llm = get_gateway()
+
+_supabase_client = None
 
 # Factory functions for testing mock
 def get_supabase_client():
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    # Built once per process, so repeated runs reuse its pooled connections
+    global _supabase_client
+    if _supabase_client is None:
+        _supabase_client = create_supabase_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _supabase_client
 
 # Get PDF URL
 def get_pdf_url(assignment_id, supabase_client):
@@ -46,13 +56,15 @@ def get_meeting_details(meeting_id, supabase_client):
 def extract_text_from_pdf(pdf_url):
     print(f"📥 Downloading PDF: {pdf_url}")
     try:
-        response = requests.get(pdf_url, stream=True, timeout=10)
-        if response.status_code == 200:
-            pdf_path = "temp.pdf"
-            with open(pdf_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=1024):
-                    if chunk:
-                        f.write(chunk)
+        with get_http_client().stream("GET", pdf_url, timeout=10) as response:
+            status_code = response.status_code
+            if status_code == 200:
+                pdf_path = "temp.pdf"
+                with open(pdf_path, "wb") as f:
+                    for chunk in response.iter_bytes(chunk_size=1024):
+                        if chunk:
+                            f.write(chunk)
+        if status_code == 200:
             text = ""
             with pdfplumber.open(pdf_path) as pdf:
                 for page in pdf.pages:
@@ -63,7 +75,7 @@ def extract_text_from_pdf(pdf_url):
             print("✅ PDF Text Extraction Successful")
             return text
         else:
-            print(f"❌ Download failed: {response.status_code}")
+            print(f"❌ Download failed: {status_code}")
             return None
     except Exception as e:
         print(f"❌ Error downloading PDF: {e}")
@@ -72,12 +84,18 @@ def extract_text_from_pdf(pdf_url):
 # Generate meeting agendas
 def generate_meeting_agenda(meeting_details, pdf_text):
     meeting_time = meeting_details["start_time"]
-    prompt = f"Generate a meeting agenda for time {meeting_time} based on this document:\n\n{pdf_text}"
-    completion = client.chat.completions.create(
+    # Long documents are cut to the token budget before the request is sent
+    builder = PromptBuilder(prompt_budget("gpt-4o-mini", AGENDA_MAX_TOKENS, AGENDA_PROMPT_TOKENS), model="gpt-4o-mini")
+    builder.add(f"Generate a meeting agenda for time {meeting_time} based on this document:", required=True)
+    builder.add(pdf_text or "", join=True, truncatable=True, required=True, name="document")
+    prompt = builder.build()
+    print(f"Agenda prompt: {prompt.tokens}/{prompt.budget} tokens" + (" (document truncated)" if prompt.truncated else ""))
+    return llm.complete(
+        prompt.messages,
+        priority=BATCH,
         model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+        max_tokens=AGENDA_MAX_TOKENS,
     )
-    return completion.choices[0].message.content
 
 # Storage agenda
 def store_meeting_agenda(meeting_id, agenda, supabase_client):
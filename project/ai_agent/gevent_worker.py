@@ -0,0 +1,19 @@
+from gevent import monkey, socket
+from gunicorn.workers.ggevent import GeventWorker as BaseGeventWorker
+
+
+class GeventWorker(BaseGeventWorker):
+    """
+    gunicorn's gevent worker, patching the standard library non-aggressively.
+
+    Aggressive patching deletes select.epoll, which trio (imported by the
+    HTTP client stack of supabase/openai) needs at import time.
+    """
+
+    def patch(self):
+        monkey.patch_all(aggressive=False)
+        # Same as the base worker: wrap the listening sockets in gevent sockets
+        self.sockets = [
+            socket.socket(s.FAMILY, socket.SOCK_STREAM, fileno=s.sock.detach())
+            for s in self.sockets
+        ]
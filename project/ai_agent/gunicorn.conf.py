@@ -0,0 +1,79 @@
+"""
+Gunicorn settings shared by the production run mode of both services.
+
+Every value can be overridden with an environment variable (see the
+"Production Server" section of README.md). serve.py passes the app, the
+bind address and, for the channel service, a single worker per process.
+"""
+import multiprocessing
+import os
+
+
+def _int_env(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+# Workers: processes per service. Socket.IO sessions live in one process, so
+# serve.py always runs the channel service with 1 worker; use run_cluster.py
+# to add channel service processes.
+workers = _int_env("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1)
+
+# gevent serves many concurrent connections (WebSockets, streaming OpenAI
+# calls, Supabase requests) per worker. eventlet also works for Socket.IO.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent_worker.GeventWorker")
+
+# Connection limits: simultaneous clients per worker, and pending
+# connections the kernel queues before refusing new ones
+worker_connections = _int_env("WORKER_CONNECTIONS", 1000)
+backlog = _int_env("SERVER_BACKLOG", 2048)
+
+# Seconds an idle keep-alive connection is held open. Keep it above the idle
+# timeout of the load balancer in front so the balancer closes first.
+keepalive = _int_env("KEEPALIVE_TIMEOUT", 75)
+
+# A worker that does not report in for this long is killed and restarted
+timeout = _int_env("WORKER_TIMEOUT", 60)
+
+# Seconds a stopping worker keeps serving in-flight requests (graceful drain)
+graceful_timeout = _int_env("GRACEFUL_TIMEOUT", 30)
+
+# Restart a worker after this many requests to bound memory growth (0 = never).
+# Leave it at 0 for the channel service: a restart drops its WebSocket sessions.
+max_requests = _int_env("MAX_REQUESTS", 0)
+max_requests_jitter = _int_env("MAX_REQUESTS_JITTER", 0)
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    """
+    Let the workers split the LLM_RPM/LLM_TPM account budgets between them.
+
+    Runs in the master before the workers are forked, with the final worker
+    count (serve.py passes --workers). Set LLM_PROCESSES yourself when other
+    processes, such as the other service, use the same OpenAI account.
+    """
+    os.environ.setdefault("LLM_PROCESSES", str(server.cfg.workers))
+
+
+def post_worker_init(worker):
+    """
+    Disconnect Socket.IO clients as soon as the worker starts draining.
+
+    WebSocket sessions never finish on their own, so without this a stopping
+    channel service worker would sit out the whole graceful_timeout. Clients
+    reconnect to a live worker and catch up through the room replay log.
+    """
+    socketio = getattr(worker.wsgi, "extensions", {}).get("socketio")
+    if socketio is None:
+        return
+
+    def drain():
+        while worker.alive:
+            socketio.sleep(0.5)
+        worker.log.info("Draining: disconnecting Socket.IO clients (pid: %s)", worker.pid)
+        socketio.server.eio.disconnect()
+
+    socketio.start_background_task(drain)
@@ -0,0 +1,212 @@
+"""
+Process-wide pooled HTTP clients for Supabase and OpenAI.
+
+Every Supabase and OpenAI client in a process sends its requests through
+one httpx client. Connections, TLS sessions and HTTP/2 streams are then
+reused across clients and requests, and are not rebuilt per client. The pool is
+configured through environment variables (see README.md) and reports
+per-host statistics through pool_stats().
+"""
+import importlib.util
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+# HTTP/2 needs the h2 package, which supabase already installs
+HTTP2 = os.getenv("HTTP2", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+
+
+class HostStats:
+    """Request and connection counters of the pool, per host"""
+
+    def __init__(self):
+        self._hosts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host: str) -> Dict[str, Any]:
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = {"requests": 0, "errors": 0, "connections_opened": 0, "tls_handshakes": 0,
+                     "http2_requests": 0, "total_seconds": 0.0}
+            self._hosts[host] = stats
+        return stats
+
+    def tracer(self, host: str):
+        """httpcore trace callback counting the connections and TLS handshakes a request needed"""
+        def trace(event_name: str, info: dict) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                with self._lock:
+                    self._host(host)["connections_opened"] += 1
+            elif event_name == "connection.start_tls.complete":
+                with self._lock:
+                    self._host(host)["tls_handshakes"] += 1
+        return trace
+
+    def async_tracer(self, host: str):
+        trace = self.tracer(host)
+
+        async def async_trace(event_name: str, info: dict) -> None:
+            trace(event_name, info)
+        return async_trace
+
+    def record(self, host: str, seconds: float, response: Optional[httpx.Response]) -> None:
+        with self._lock:
+            stats = self._host(host)
+            stats["requests"] += 1
+            stats["total_seconds"] += seconds
+            if response is None or response.status_code >= 500:
+                stats["errors"] += 1
+            elif response.http_version == "HTTP/2":
+                stats["http2_requests"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for host, stats in self._hosts.items():
+                requests = stats["requests"]
+                result[host] = {
+                    "requests": requests,
+                    "errors": stats["errors"],
+                    "connections_opened": stats["connections_opened"],
+                    "tls_handshakes": stats["tls_handshakes"],
+                    # Share of requests served on an existing connection
+                    "reuse_ratio": round(1 - stats["connections_opened"] / requests, 3) if requests else 0.0,
+                    "http2_requests": stats["http2_requests"],
+                    "avg_response_ms": round(stats["total_seconds"] / requests * 1000, 1) if requests else 0.0,
+                }
+            return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._hosts.clear()
+
+
+host_stats = HostStats()
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """HTTPTransport that records per-host statistics (latency is time to response headers)"""
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        request.extensions = {**request.extensions, "trace": host_stats.tracer(host)}
+        started = time.monotonic()
+        response = None
+        try:
+            response = super().handle_request(request)
+            return response
+        finally:
+            host_stats.record(host, time.monotonic() - started, response)
+
+
+class AsyncPooledTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport counterpart of PooledTransport"""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        request.extensions = {**request.extensions, "trace": host_stats.async_tracer(host)}
+        started = time.monotonic()
+        response = None
+        try:
+            response = await super().handle_async_request(request)
+            return response
+        finally:
+            host_stats.record(host, time.monotonic() - started, response)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """The shared synchronous client, created on first use"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(
+                transport=PooledTransport(http2=HTTP2, limits=_limits()),
+                timeout=_timeout(),
+                follow_redirects=True,
+            )
+        return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """The shared asyncio client, created on first use; use it from one event loop only"""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = httpx.AsyncClient(
+                transport=AsyncPooledTransport(http2=HTTP2, limits=_limits()),
+                timeout=_timeout(),
+                follow_redirects=True,
+            )
+        return _async_client
+
+
+def create_supabase_client(url: str, key: str):
+    """Supabase client that sends its requests through the shared pool"""
+    from supabase import create_client
+    from supabase.lib.client_options import SyncClientOptions
+    return create_client(url, key, options=SyncClientOptions(httpx_client=get_http_client()))
+
+
+async def create_async_supabase_client(url: str, key: str):
+    """Async Supabase client that sends its requests through the shared pool"""
+    from supabase import acreate_client
+    from supabase.lib.client_options import AsyncClientOptions
+    return await acreate_client(url, key, options=AsyncClientOptions(httpx_client=get_async_http_client()))
+
+
+def create_openai_client(api_key: Optional[str]):
+    """OpenAI client that sends its requests through the shared pool"""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=get_http_client())
+
+
+def create_async_openai_client(api_key: Optional[str]):
+    """AsyncOpenAI client that sends its requests through the shared pool"""
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=api_key, http_client=get_async_http_client())
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool settings and per-host request, connection and latency counters"""
+    return {
+        "http2": HTTP2,
+        "max_connections": HTTP_POOL_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_POOL_MAX_KEEPALIVE,
+        "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY,
+        "hosts": host_stats.snapshot(),
+    }
+
+
+def close() -> None:
+    """Close the shared synchronous client, e.g. at process exit"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
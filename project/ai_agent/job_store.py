@@ -0,0 +1,329 @@
+"""
+Background jobs with their state kept in a local SQLite database.
+
+JobStore persists each job's status, progress, result and error, so any
+worker process on the host can report on a job and the state outlives a
+restart. JobRunner executes the jobs on a bounded pool of background
+workers. Each runner holds a lease on its jobs and renews it while it is
+alive; the jobs of a runner whose lease ran out are requeued by another.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from assistant_worker import AssistantJobQueue
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedup_key TEXT,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+-- At most one queued or running job per deduplication key
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedup ON jobs (dedup_key)
+    WHERE dedup_key IS NOT NULL AND status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at);
+"""
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp else None
+
+
+class JobStore:
+    """
+    Job state in a SQLite file.
+
+    Every call opens its own connection, so the store can be used from any
+    thread and by several processes sharing the file. Deduplication is
+    enforced by the database, which makes it hold across processes too.
+    Queued and running jobs carry a lease that their owner renews; once it
+    expires any other owner may take the job over.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 10.0, lease: float = 60.0):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            busy_timeout: Seconds a write waits for another process's lock
+            lease: Seconds an owner keeps its jobs without renewing the lease
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.lease = lease
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "lease_until" not in columns:
+                # Files created before leases were added
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit; multi-statement updates are single UPDATE ... WHERE statements
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": row["progress"],
+            "stage": row["stage"],
+            "params": json.loads(row["params"]),
+            "result": json.loads(row["result"]) if row["result"] is not None else None,
+            "error": row["error"],
+            "owner": row["owner"],
+            "created_at": _iso(row["created_at"]),
+            "updated_at": _iso(row["updated_at"]),
+        }
+
+    def create(self, kind: str, params: Dict[str, Any], dedup_key: Optional[str] = None,
+               owner: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a new job, unless a job with the same dedup_key is queued or running.
+
+        Returns:
+            Tuple of (job, created). When a matching job is already in flight it is
+            returned with created=False
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            for _ in range(3):
+                job_id = uuid.uuid4().hex
+                try:
+                    conn.execute(
+                        "INSERT INTO jobs (id, kind, dedup_key, status, params, owner, lease_until, created_at, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, kind, dedup_key, QUEUED, json.dumps(params), owner, now + self.lease, now, now))
+                    return self.get(job_id), True
+                except sqlite3.IntegrityError:
+                    row = conn.execute(
+                        "SELECT * FROM jobs WHERE dedup_key = ? AND status IN (?, ?)",
+                        (dedup_key, *ACTIVE)).fetchone()
+                    if row is not None:
+                        return self._to_dict(row), False
+                    # The matching job finished in between; try the insert again
+        raise RuntimeError(f"Could not create job for {dedup_key}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job by ID, or None if it does not exist"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """
+        Mark a queued job of owner as running.
+
+        Returns:
+            False if the job is no longer queued or another owner took it over
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = ?, updated_at = ? WHERE id = ? AND status = ? AND owner = ?",
+                (RUNNING, now + self.lease, now, job_id, QUEUED, owner))
+            return cursor.rowcount == 1
+
+    def renew(self, owner: str) -> int:
+        """Extend the lease on every queued and running job of owner; returns how many"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + self.lease, owner, *ACTIVE))
+            return cursor.rowcount
+
+    def update(self, job_id: str, **fields) -> None:
+        """Set status, progress, stage, result or error of a job"""
+        columns = {"status", "progress", "stage", "result", "error"}
+        unknown = set(fields) - columns
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+                         (*fields.values(), time.time(), job_id))
+
+    def recover(self, owner: str) -> List[Dict[str, Any]]:
+        """
+        Take over the queued and running jobs of other owners whose lease expired.
+
+        Each job is moved back to queued under the new owner with a single
+        conditional update, so when several processes recover at once every
+        job goes to exactly one of them.
+
+        Returns:
+            The jobs now queued for owner
+        """
+        recovered = []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, owner FROM jobs WHERE status IN (?, ?) AND owner IS NOT ?"
+                " AND (lease_until IS NULL OR lease_until < ?)",
+                (*ACTIVE, owner, time.time())).fetchall()
+            for row in rows:
+                # Re-checks the lease, which the owner may have renewed since the select
+                now = time.time()
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, progress = 0, stage = NULL, lease_until = ?, updated_at = ?"
+                    " WHERE id = ? AND owner IS ? AND status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)",
+                    (QUEUED, owner, now + self.lease, now, row["id"], row["owner"], *ACTIVE, now))
+                if cursor.rowcount == 1:
+                    recovered.append(row["id"])
+        return [self.get(job_id) for job_id in recovered]
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated more than older_than seconds ago"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                                  (SUCCEEDED, FAILED, time.time() - older_than))
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs by status"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+class JobRunner:
+    """
+    Runs the jobs of a JobStore on a bounded pool of background workers.
+
+    A handler is registered per job kind and called with the job's params
+    and a progress function (fraction, stage). Its return value becomes the
+    job result; an exception fails the job. Jobs run in the process that
+    submitted them. A heartbeat thread renews the lease on this runner's
+    jobs every third of the lease and takes over the jobs of runners whose
+    lease expired.
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, Callable[[Dict[str, Any], Callable], Any]],
+                 workers: int = 2, max_queue: int = 100, retention: float = 86400.0,
+                 spawn: Optional[Callable] = None):
+        """
+        Args:
+            store: Where job state is kept
+            handlers: Function per job kind, called as handler(params, progress)
+            workers: Number of jobs run concurrently by this process
+            max_queue: Jobs allowed to wait before new ones fail with "queue full"
+            retention: Seconds finished jobs are kept before they are purged
+            spawn: Function (target, *args) that starts a background task.
+                Defaults to a daemon thread
+        """
+        self.store = store
+        self.handlers = handlers
+        self.retention = retention
+        # Unique per process start, so a reused PID or another host never looks like the same owner
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._queue = AssistantJobQueue(self._run, workers=workers, max_queue=max_queue, spawn=spawn)
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+
+    def submit(self, kind: str, params: Dict[str, Any], dedup_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Create a job and queue it, or return the matching job that is already in flight.
+
+        Returns:
+            Tuple of (job, created). A created job is failed at once if the queue is full
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        self._purge()
+        job, created = self.store.create(kind, params, dedup_key=dedup_key, owner=self.owner)
+        if created and not self._queue.submit({"id": job["job_id"]}):
+            self.store.update(job["job_id"], status=FAILED, error="Job queue is full")
+            job = self.store.get(job["job_id"])
+        return job, created
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def recover(self) -> int:
+        """Requeue the jobs whose owner's lease expired; returns how many were taken over"""
+        jobs = self.store.recover(self.owner)
+        for job in jobs:
+            if not self._queue.submit({"id": job["job_id"]}):
+                self.store.update(job["job_id"], status=FAILED, error="Job queue is full")
+        return len(jobs)
+
+    def _heartbeat(self) -> None:
+        while not self._stopped.wait(self.store.lease / 3):
+            try:
+                self.store.renew(self.owner)
+                self.recover()
+            except Exception as e:
+                logger.exception("Error renewing job leases: %s", e)
+
+    def close(self) -> None:
+        """Stop renewing leases; the unfinished jobs are taken over once they expire"""
+        self._stopped.set()
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            # At most once a minute
+            if now - self._purged_at < 60:
+                return
+            self._purged_at = now
+        self.store.purge(self.retention)
+
+    def _run(self, item: Dict[str, Any]) -> None:
+        job_id = item["id"]
+        if not self.store.claim(job_id, self.owner):
+            return
+        job = self.store.get(job_id)
+
+        def progress(fraction: float, stage: Optional[str] = None) -> None:
+            self.store.update(job_id, progress=round(min(max(fraction, 0.0), 1.0), 3), stage=stage)
+
+        try:
+            result = self.handlers[job["kind"]](job["params"], progress)
+        except Exception as e:
+            logger.exception("Error running %s job %s: %s", job["kind"], job_id, e)
+            self.store.update(job_id, status=FAILED, error=str(e))
+            return
+        self.store.update(job_id, status=SUCCEEDED, progress=1.0, stage="done", result=result)
+
+    def join(self) -> None:
+        """Block until every queued job has run"""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self._queue.stats(), "jobs": self.store.counts()}
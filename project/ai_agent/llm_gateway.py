@@ -0,0 +1,486 @@
+"""
+Gateway for every LLM call made by a process.
+
+The channel service, the peer review service and generate_plan send their
+chat completions through one LLMGateway. It limits how many calls run at
+once, keeps the process under a requests-per-minute and tokens-per-minute
+budget, lets interactive calls go ahead of batch work, backs off together on
+rate-limit errors and records latency and token usage. The model provider
+is pluggable; the "stub" provider answers deterministically without network
+access, for load tests. Settings come from the environment (see README.md).
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from prompt_builder import count_message_tokens, count_tokens
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Budgets of the OpenAI account tier; 0 disables a limit
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "200000"))
+# Processes sharing the account budgets; each gateway gets an equal share.
+# gunicorn.conf.py and run_cluster.py set it to their worker count.
+LLM_PROCESSES = max(1, int(os.getenv("LLM_PROCESSES", "1")))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+
+# Completion tokens assumed for a call without max_tokens, until its real usage is known
+DEFAULT_COMPLETION_TOKENS = 500
+# Longest pause after a rate-limit error
+MAX_BACKOFF_SECONDS = 30.0
+
+# Priority classes; lower values are admitted first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+
+
+class Usage(NamedTuple):
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class Completion(NamedTuple):
+    text: str
+    usage: Optional[Usage]
+
+
+def process_share(per_minute: int, processes: int) -> int:
+    """One process's share of an account-wide per-minute budget; 0 stays unlimited"""
+    if per_minute <= 0:
+        return 0
+    return max(1, per_minute // max(1, processes))
+
+
+def _usage(usage: Any) -> Optional[Usage]:
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if isinstance(prompt_tokens, int) and isinstance(completion_tokens, int):
+        return Usage(prompt_tokens, completion_tokens)
+    return None
+
+
+class OpenAIProvider:
+    """Chat completions from the OpenAI API"""
+
+    name = "openai"
+
+    def __init__(self, client=None):
+        """
+        Args:
+            client: OpenAI client; by default one on the shared connection pool,
+                without its own retries (the gateway retries)
+        """
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from http_pool import create_openai_client
+            self._client = create_openai_client(os.getenv("OPENAI_API_KEY")).with_options(max_retries=0)
+        return self._client
+
+    def complete(self, messages: List[dict], **options) -> Completion:
+        response = self.client.chat.completions.create(messages=messages, **options)
+        return Completion(response.choices[0].message.content, _usage(getattr(response, "usage", None)))
+
+    def open_stream(self, messages: List[dict], **options) -> Iterator[Union[str, Usage]]:
+        """Start a streamed completion; the iterator yields text deltas, then the usage if reported"""
+        stream = self.client.chat.completions.create(
+            messages=messages, stream=True, stream_options={"include_usage": True}, **options)
+
+        def events():
+            for chunk in stream:
+                usage = _usage(getattr(chunk, "usage", None))
+                if usage:
+                    yield usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        return events()
+
+    def is_retryable(self, error: Exception) -> bool:
+        import openai
+        return isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """Seconds the API asked us to wait, if it said"""
+        response = getattr(error, "response", None)
+        try:
+            return float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+
+class StubProvider:
+    """
+    Deterministic local provider for offline load tests.
+
+    The reply depends only on the messages and options, and every call takes
+    `latency_ms`. Usage is counted locally, like the gateway does.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 0.0, sleep: Callable[[float], None] = time.sleep):
+        self.latency_ms = latency_ms
+        self._sleep = sleep
+
+    def _reply(self, messages: List[dict], options: dict) -> str:
+        digest = hashlib.sha1(json.dumps([messages, options], sort_keys=True, default=str).encode("utf-8"))
+        question = str(messages[-1].get("content") or "") if messages else ""
+        return f"Stub reply {digest.hexdigest()[:8]} to: {question[:200]}"
+
+    def complete(self, messages: List[dict], **options) -> Completion:
+        if self.latency_ms:
+            self._sleep(self.latency_ms / 1000)
+        text = self._reply(messages, options)
+        model = options.get("model", "gpt-3.5-turbo")
+        return Completion(text, Usage(count_message_tokens(messages, model), count_tokens(text, model)))
+
+    def open_stream(self, messages: List[dict], **options) -> Iterator[Union[str, Usage]]:
+        completion = self.complete(messages, **options)
+
+        def events():
+            words = completion.text.split(" ")
+            for index, word in enumerate(words):
+                yield word if index == len(words) - 1 else word + " "
+            yield completion.usage
+        return events()
+
+    def is_retryable(self, error: Exception) -> bool:
+        return False
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        return None
+
+
+PROVIDERS = {"openai": OpenAIProvider, "stub": lambda: StubProvider(latency_ms=LLM_STUB_LATENCY_MS)}
+
+
+def create_provider(name: str):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    return PROVIDERS[name]()
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `per_minute` tokens per minute, holding at most a minute's worth.
+
+    reserve() takes tokens straight away and returns how long the caller has
+    to wait until they are covered, so callers are served in the order they
+    reserved. A `per_minute` of 0 disables the limit.
+    """
+
+    def __init__(self, per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens; returns the seconds to wait before they are available"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        # A request larger than the bucket would otherwise never fit
+        self._tokens -= min(amount, self.capacity)
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back tokens that were reserved but not used (negative to charge more)"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class PriorityGate:
+    """Admits at most `limit` holders at once; waiters go in priority order, then arrival order"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._waiters: list = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: int) -> None:
+        with self._condition:
+            entry = (priority, next(self._order))
+            heapq.heappush(self._waiters, entry)
+            while self._active >= self.limit or self._waiters[0] != entry:
+                self._condition.wait()
+            heapq.heappop(self._waiters)
+            self._active += 1
+            # The next waiter may fit as well
+            self._condition.notify_all()
+
+    def release(self) -> None:
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+
+class _ClassStats:
+    """Counters of one priority class"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.queue_seconds = 0.0
+        self.latencies: deque = deque(maxlen=1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_queue_ms": round(self.queue_seconds / self.requests * 1000, 1) if self.requests else 0.0,
+            "avg_latency_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "p95_latency_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else 0.0,
+        }
+
+
+class LLMGateway:
+    """
+    Shared entry point for chat completions.
+
+    complete() and stream() wait for a concurrency slot (interactive calls
+    first), then for room in the request and token budgets, and call the
+    provider. Retryable errors such as 429s pause every caller of the gateway
+    for the backoff, and the call is retried up to `max_retries` times.
+    """
+
+    def __init__(self, provider, max_concurrency: int = 8, rpm: int = 0, tpm: int = 0,
+                 max_retries: int = 3, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Args:
+            provider: Object with complete(), open_stream(), is_retryable() and retry_after()
+            max_concurrency: Calls sent to the provider at the same time
+            rpm: Requests per minute, 0 for no limit
+            tpm: Prompt plus completion tokens per minute, 0 for no limit
+            max_retries: Retries of a call after a retryable error
+            clock, sleep: Time functions, replaceable in tests
+        """
+        self.provider = provider
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._gate = PriorityGate(max_concurrency)
+        self._requests = TokenBucket(rpm, clock=clock)
+        self._tokens = TokenBucket(tpm, clock=clock)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {name: _ClassStats() for name in PRIORITIES}
+
+    def _wait_for_budget(self, estimate: int, stats: _ClassStats) -> None:
+        with self._lock:
+            delay = max(self._paused_until - self._clock(), self._requests.reserve(1),
+                        self._tokens.reserve(estimate), 0.0)
+            if delay:
+                stats.throttled += 1
+        if delay:
+            self._sleep(delay)
+
+    def _wait_for_pause(self) -> None:
+        with self._lock:
+            delay = self._paused_until - self._clock()
+        if delay > 0:
+            self._sleep(delay)
+
+    def _send(self, call: Callable[[], Any], estimate: int, stats: _ClassStats) -> Any:
+        """
+        Run `call` within the budgets, retrying retryable errors.
+
+        The budgets are reserved once per call; retries only wait out the
+        shared backoff, so a burst of 429s does not use up the budget again.
+        """
+        attempt = 0
+        self._wait_for_budget(estimate, stats)
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.provider.is_retryable(e):
+                    raise
+                backoff = self.provider.retry_after(e) or min(2 ** attempt, MAX_BACKOFF_SECONDS)
+                with self._lock:
+                    stats.retries += 1
+                    self._paused_until = max(self._paused_until, self._clock() + backoff)
+                attempt += 1
+                self._wait_for_pause()
+
+    def _begin(self, priority: str, messages: List[dict], options: dict):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        queued = self._clock()
+        self._gate.acquire(PRIORITIES[priority])
+        stats = self._stats[priority]
+        with self._lock:
+            stats.requests += 1
+            stats.queue_seconds += self._clock() - queued
+        estimate = (count_message_tokens(messages, options.get("model", "gpt-3.5-turbo"))
+                    + options.get("max_tokens", DEFAULT_COMPLETION_TOKENS))
+        return stats, estimate
+
+    def _finish(self, stats: _ClassStats, estimate: int, usage: Optional[Usage], started: float,
+                failed: bool) -> None:
+        with self._lock:
+            if failed:
+                stats.errors += 1
+            else:
+                stats.latencies.append(self._clock() - started)
+            if usage:
+                stats.prompt_tokens += usage.prompt_tokens
+                stats.completion_tokens += usage.completion_tokens
+                self._tokens.refund(estimate - usage.prompt_tokens - usage.completion_tokens)
+            elif failed:
+                # A call that failed without usage generated nothing
+                self._tokens.refund(estimate)
+        self._gate.release()
+
+    def complete(self, messages: List[dict], priority: str = INTERACTIVE, **options) -> str:
+        """Text of a chat completion; options (model, max_tokens, ...) go to the provider"""
+        stats, estimate = self._begin(priority, messages, options)
+        started = self._clock()
+        completion = None
+        try:
+            completion = self._send(lambda: self.provider.complete(messages, **options), estimate, stats)
+            return completion.text
+        finally:
+            self._finish(stats, estimate, completion.usage if completion else None, started, completion is None)
+
+    def stream(self, messages: List[dict], priority: str = INTERACTIVE, **options) -> Iterator[str]:
+        """
+        Stream a chat completion as text deltas.
+
+        The concurrency slot is held until the stream is exhausted or closed.
+        """
+        stats, estimate = self._begin(priority, messages, options)
+        started = self._clock()
+        usage = None
+        failed = True
+        try:
+            for event in self._send(lambda: self.provider.open_stream(messages, **options), estimate, stats):
+                if isinstance(event, Usage):
+                    usage = event
+                else:
+                    yield event
+            failed = False
+        finally:
+            self._finish(stats, estimate, usage, started, failed)
+
+    async def complete_async(self, messages: List[dict], priority: str = INTERACTIVE, **options) -> str:
+        """complete() on a worker thread, for asyncio callers such as the ASGI build"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.complete(messages, priority, **options))
+
+    async def stream_async(self, messages: List[dict], priority: str = INTERACTIVE,
+                           **options) -> AsyncIterator[str]:
+        """stream() on a worker thread, handing each delta to the event loop as it arrives"""
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce() -> None:
+            stream = self.stream(messages, priority, **options)
+            try:
+                for delta in stream:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(events.put_nowait, ("delta", delta))
+            except BaseException as e:
+                loop.call_soon_threadsafe(events.put_nowait, ("error", e))
+                return
+            finally:
+                # Releases the concurrency slot if the consumer stopped early
+                stream.close()
+            loop.call_soon_threadsafe(events.put_nowait, ("done", None))
+
+        producer = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                kind, value = await events.get()
+                if kind == "done":
+                    break
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            stop.set()
+            await asyncio.shield(producer)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "provider": self.provider.name,
+                "requests_per_minute": int(self._requests.capacity),
+                "tokens_per_minute": int(self._tokens.capacity),
+                "max_concurrency": self._gate.limit,
+                "in_flight": self._gate.active,
+                "waiting": self._gate.waiting,
+                "requests_available": round(self._requests.available, 1) if self._requests.rate else None,
+                "tokens_available": round(self._tokens.available) if self._tokens.rate else None,
+                "paused_seconds": round(max(self._paused_until - self._clock(), 0.0), 3),
+                "classes": {name: stats.snapshot() for name, stats in self._stats.items()},
+            }
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway, configured from the environment on first use"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway(
+                create_provider(LLM_PROVIDER),
+                max_concurrency=LLM_MAX_CONCURRENCY,
+                rpm=process_share(LLM_RPM, LLM_PROCESSES),
+                tpm=process_share(LLM_TPM, LLM_PROCESSES),
+                max_retries=LLM_MAX_RETRIES,
+            )
+        return _gateway
@@ -0,0 +1,153 @@
+import threading
+import traceback
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+
+class RecentMessageBuffer:
+    """
+    Bounded in-memory buffer of the latest messages of each channel.
+
+    Every channel keeps at most `size` messages in a ring buffer. At most
+    `max_channels` channels are held at once; the least recently used channel
+    is evicted when a new one is loaded. A channel that is not in memory is
+    backfilled through `loader` the first time it is read.
+    """
+
+    def __init__(self, size: int = 20, max_channels: int = 500,
+                 loader: Optional[Callable[[str, int], List[dict]]] = None):
+        """
+        Args:
+            size: Number of messages kept per channel
+            max_channels: Number of channels kept before LRU eviction
+            loader: Function (channel_id, limit) returning the latest messages
+                of a channel in chronological order, used on cold start
+        """
+        self.size = size
+        self.max_channels = max_channels
+        self.loader = loader
+        self._channels: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, channel_id) -> str:
+        # Route parameters arrive as strings while database rows may hold integers
+        return str(channel_id)
+
+    def _store(self, key: str, messages: List[dict]) -> deque:
+        buffer = deque(messages[-self.size:], maxlen=self.size)
+        self._channels[key] = buffer
+        self._channels.move_to_end(key)
+        while len(self._channels) > self.max_channels:
+            self._channels.popitem(last=False)
+        return buffer
+
+    def append(self, channel_id, message: dict) -> None:
+        """
+        Record a message that was just inserted or broadcast.
+
+        Channels that are not loaded are left alone: the next read backfills
+        them from the database, which already includes this message.
+        """
+        key = self._key(channel_id)
+        with self._lock:
+            buffer = self._channels.get(key)
+            if buffer is None:
+                return
+            message_id = message.get("id")
+            if message_id is not None and any(m.get("id") == message_id for m in buffer):
+                # The same message can be seen both on insert and on broadcast
+                return
+            buffer.append(message)
+            self._channels.move_to_end(key)
+
+    def get(self, channel_id, limit: Optional[int] = None) -> List[dict]:
+        """
+        Get the latest messages of a channel in chronological order.
+
+        Args:
+            channel_id: The channel ID
+            limit: Return only the last `limit` messages
+
+        Returns:
+            List of message dictionaries
+        """
+        cached = self.cached(channel_id, limit)
+        if cached is not None:
+            return cached
+
+        # Cold start: load outside the lock so other channels are not blocked
+        key = self._key(channel_id)
+        messages: List[dict] = []
+        if self.loader:
+            try:
+                messages = self.loader(key, self.size) or []
+            except Exception as e:
+                print(f"Error backfilling recent messages for channel {key}: {str(e)}")
+                traceback.print_exc()
+                # Do not cache a failed load, retry on the next read
+                return []
+        return self.seed(channel_id, messages, limit)
+
+    def cached(self, channel_id, limit: Optional[int] = None) -> Optional[List[dict]]:
+        """Like get(), but return None instead of loading a channel that is not in memory"""
+        key = self._key(channel_id)
+        with self._lock:
+            buffer = self._channels.get(key)
+            if buffer is None:
+                return None
+            self._channels.move_to_end(key)
+            messages = list(buffer)
+        return messages[-limit:] if limit else messages
+
+    def seed(self, channel_id, messages: List[dict], limit: Optional[int] = None) -> List[dict]:
+        """
+        Store the backfilled messages of a channel and return its buffered messages.
+
+        Used by callers that load the messages themselves, e.g. with an async
+        database client. A channel loaded in the meantime is kept as it is.
+        """
+        key = self._key(channel_id)
+        with self._lock:
+            buffer = self._channels.get(key)
+            if buffer is None:
+                buffer = self._store(key, messages)
+            messages = list(buffer)
+        return messages[-limit:] if limit else messages
+
+    def replace(self, channel_id, message_id, message: dict) -> None:
+        """Swap the buffered message with the given ID, e.g. when a provisional ID is committed"""
+        key = self._key(channel_id)
+        with self._lock:
+            buffer = self._channels.get(key)
+            if buffer is None:
+                return
+            for i, buffered in enumerate(buffer):
+                if buffered.get("id") == message_id:
+                    buffer[i] = message
+                    return
+
+    def remove(self, channel_id, message_id) -> None:
+        """Drop the buffered message with the given ID, e.g. when its insert failed for good"""
+        key = self._key(channel_id)
+        with self._lock:
+            buffer = self._channels.get(key)
+            if buffer is None:
+                return
+            kept = [m for m in buffer if m.get("id") != message_id]
+            if len(kept) != len(buffer):
+                self._channels[key] = deque(kept, maxlen=self.size)
+
+    def evict(self, channel_id) -> None:
+        """Drop a channel from the buffer, e.g. when it is deleted"""
+        with self._lock:
+            self._channels.pop(self._key(channel_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        """Number of channels and messages currently held"""
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "messages": sum(len(buffer) for buffer in self._channels.values()),
+                "size": self.size,
+                "max_channels": self.max_channels,
+            }
@@ -1,15 +1,24 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from supabase import create_client
 from datetime import datetime
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
 import re
 import logging
 from typing import List, Dict, Any, Tuple
+import functools
 import json
-import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http_pool import create_supabase_client, pool_stats
+from llm_gateway import BATCH, get_gateway
+from prompt_builder import PromptBuilder, prompt_budget
+from fanout import run_collectors
+from job_store import JobRunner, JobStore
+from cohort_analysis import analyze_cohort, fetch_course_reviews
+from analysis_cache import AnalysisCache, input_fingerprint
+from score_matrix import ScoreMatrix, score_outliers
+from contribution_metrics import aggregate_reviews, attendance_stats, channel_stats, review_stats, task_stats
 
 # Configure logging
 logging.basicConfig(
@@ -18,8 +27,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Debug mode
-DEBUG = True
+# Token budgets of the AI contribution analysis
+ANALYSIS_PROMPT_TOKENS = int(os.getenv("ANALYSIS_PROMPT_TOKENS", "6000"))
+ANALYSIS_MAX_TOKENS = int(os.getenv("ANALYSIS_MAX_TOKENS", "800"))
+
+# Analyses whose inputs have not changed are reused instead of calling the model again
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1000"))
+# Part of every input fingerprint; bump it when the analysis prompt changes
+ANALYSIS_PROMPT_VERSION = "1"
+AI_ANALYSIS_UNAVAILABLE = "AI analysis unavailable."
+
+# The data collectors of an analysis run concurrently, each within ANALYZE_COLLECTOR_TIMEOUT seconds
+ANALYZE_COLLECTOR_TIMEOUT = float(os.getenv("ANALYZE_COLLECTOR_TIMEOUT", "10"))
+ANALYZE_COLLECTOR_WORKERS = int(os.getenv("ANALYZE_COLLECTOR_WORKERS", "16"))
+
+# Background analysis jobs: SQLite file of their state, workers per process, queue bound and retention
+ANALYSIS_JOB_DB = os.getenv("ANALYSIS_JOB_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "analysis_jobs.sqlite3"))
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+ANALYSIS_JOB_QUEUE_SIZE = int(os.getenv("ANALYSIS_JOB_QUEUE_SIZE", "50"))
+ANALYSIS_JOB_RETENTION_HOURS = float(os.getenv("ANALYSIS_JOB_RETENTION_HOURS", "24"))
+ANALYSIS_JOB_LEASE_SECONDS = float(os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "60"))
+
+# Read per-reviewee score aggregates (database/peer_review_service.sql) instead of every review
+PEER_REVIEW_AGGREGATES = os.getenv("PEER_REVIEW_AGGREGATES", "true").lower() == "true"
+
+# Cohort analyses: processes computing group statistics (0 = in a thread) and concurrent AI analyses
+COHORT_PROCESSES = int(os.getenv("COHORT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+COHORT_LLM_CONCURRENCY = int(os.getenv("COHORT_LLM_CONCURRENCY", "4"))
+
+# Debug mode of the development server (serve.py runs production mode without it)
+DEBUG = os.getenv("PEER_REVIEW_SERVICE_DEBUG", "true").lower() == "true"
 
 # Load environment variables from .env file
 load_dotenv()
@@ -45,8 +83,9 @@ class PeerReviewService:
             logger.error(f"Debug - Key length: {len(self.supabase_key) if self.supabase_key else 'None'}")
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
             
-        self.supabase = create_client(self.supabase_url, self.supabase_key)
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Supabase shares the process-wide connection pool; OpenAI calls go through the LLM gateway
+        self.supabase = create_supabase_client(self.supabase_url, self.supabase_key)
+        self.llm = get_gateway()
 
     def _check_score_distribution_zscore(self, average_scores: Dict[str, float], z_threshold: float = 1.0) -> Tuple[bool, List[str]]:
         """
@@ -59,15 +98,7 @@ class PeerReviewService:
         Returns:
             Tuple of (outliers_exist, list_of_outlier_zids)
         """
-        if not average_scores:
-            return False, []
-        scores = list(average_scores.values())
-        mean = statistics.mean(scores)
-        std = statistics.stdev(scores) if len(scores) > 1 else 0
-        outliers = [
-            zid for zid, score in average_scores.items()
-            if std > 0 and abs(score - mean) / std > z_threshold
-        ]
+        outliers = score_outliers(average_scores, z_threshold)
         return len(outliers) > 0, outliers
 
     def _extract_summary(self, ai_response: str) -> str:
@@ -126,7 +157,8 @@ class PeerReviewService:
                     pass
         return adjustments
 
-    def _save_analysis_result(self, group_id, assignment_id, summary, fairness, suggestions):
+    def _save_analysis_result(self, group_id, assignment_id, summary, fairness, suggestions,
+                              ai_analysis=None, fingerprint=None):
         """
         Save analysis results to database
         
@@ -136,6 +168,8 @@ class PeerReviewService:
             summary: Summary text
             fairness: Fairness assessment
             suggestions: Suggested score adjustments
+            ai_analysis: Full AI analysis text
+            fingerprint: Fingerprint of the analysis inputs, None if the analysis must not be reused
         """
         try:
             result = self.supabase.table("contribution_analyses").insert({
@@ -145,6 +179,8 @@ class PeerReviewService:
                 "fairness": fairness["is_fair"],
                 "fairness_issues": json.dumps(fairness["issues"]),
                 "suggested_adjustments": json.dumps(suggestions),
+                "ai_analysis": ai_analysis,
+                "input_fingerprint": fingerprint,
                 "created_at": datetime.utcnow().isoformat()
             }).execute()
             logger.info(f"Analysis saved successfully for group {group_id}, assignment {assignment_id}")
@@ -153,6 +189,18 @@ class PeerReviewService:
             logger.error(f"[Save Error] {e}")
             raise
 
+    @staticmethod
+    def _empty_attendance(members: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {member["zid"]: {"attended": 0, "total": 0, "attendance_rate": 0.0} for member in members}
+
+    @staticmethod
+    def _empty_task_completion(members: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {member["zid"]: {"assigned": 0, "completed": 0, "avg_difficulty": 0.0, "completion_rate": 0.0} for member in members}
+
+    @staticmethod
+    def _empty_channel_activity(members: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        return {member["zid"]: {"message_count": 0} for member in members}
+
     def _get_meeting_attendance(self, group_id: str, members: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Get meeting attendance records for group members
@@ -167,27 +215,14 @@ class PeerReviewService:
         try:
             meetings = self.supabase.table("meetings").select("id").eq("group_id", group_id).execute().data
             if not meetings:
-                return {member["zid"]: {"attended": 0, "total": 0, "attendance_rate": 0.0} for member in members}
+                return self._empty_attendance(members)
 
             meeting_ids = [meeting["id"] for meeting in meetings]
             attendance_records = self.supabase.table("meeting_attendances").select("meeting_id,member_zid").in_("meeting_id", meeting_ids).execute().data
-
-            attendance_count = {member["zid"]: 0 for member in members}
-            for record in attendance_records:
-                zid = record.get("member_zid")
-                if zid in attendance_count:
-                    attendance_count[zid] += 1
-
-            result = {}
-            total = len(meeting_ids)
-            for zid, attended in attendance_count.items():
-                rate = round(attended / total, 2) if total > 0 else 0.0
-                result[zid] = {"attended": attended, "total": total, "attendance_rate": rate}
-
-            return result
+            return attendance_stats(members, meeting_ids, attendance_records)
         except Exception as e:
             logger.error(f"[Meeting Attendance Error] {e}")
-            return {member["zid"]: {"attended": 0, "total": 0, "attendance_rate": 0.0} for member in members}
+            return self._empty_attendance(members)
 
     def _get_task_completion(self, group_id: str, assignment_id: str, members: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -204,29 +239,11 @@ class PeerReviewService:
         try:
             tasks = self.supabase.table("tasks").select("task_id,description").eq("group_id", group_id).eq("assignment_id", assignment_id).execute().data
             task_ids = [task["task_id"] for task in tasks]
-            task_descriptions = {task["task_id"]: task.get("description", "") for task in tasks}
-
             assignees = self.supabase.table("task_assignees").select("task_id,zid,is_completed").in_("task_id", task_ids).execute().data
-
-            stats = {member["zid"]: {"assigned": 0, "completed": 0, "avg_difficulty": 0.0, "completion_rate": 0.0} for member in members}
-            length_sum = {member["zid"]: 0 for member in members}
-
-            for a in assignees:
-                zid = a["zid"]
-                if zid in stats:
-                    stats[zid]["assigned"] += 1
-                    if a.get("is_completed"):
-                        stats[zid]["completed"] += 1
-                    length_sum[zid] += len(task_descriptions.get(a["task_id"], ""))
-
-            for zid, stat in stats.items():
-                if stat["assigned"] > 0:
-                    stat["avg_difficulty"] = round(length_sum[zid] / stat["assigned"], 2)
-                    stat["completion_rate"] = round(stat["completed"] / stat["assigned"], 2)
-            return stats
+            return task_stats(members, tasks, assignees)
         except Exception as e:
             logger.error(f"[Task Completion Error] {e}")
-            return {member["zid"]: {"assigned": 0, "completed": 0, "avg_difficulty": 0.0, "completion_rate": 0.0} for member in members}
+            return self._empty_task_completion(members)
 
     def _get_channel_activity(self, group_id: str, members: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
         """
@@ -242,21 +259,14 @@ class PeerReviewService:
         try:
             response = self.supabase.table("channels").select("id").eq("group_id", group_id).execute()
             if not response.data:
-                return {member["zid"]: {"message_count": 0} for member in members}
+                return self._empty_channel_activity(members)
 
             channel_id = response.data[0]["id"]
             messages_response = self.supabase.table("channel_messages").select("sender_zid").eq("channel_id", channel_id).execute()
-
-            result = {member["zid"]: {"message_count": 0} for member in members}
-            if messages_response.data:
-                for msg in messages_response.data:
-                    zid = msg.get("sender_zid")
-                    if zid in result:
-                        result[zid]["message_count"] += 1
-            return result
+            return channel_stats(members, messages_response.data or [])
         except Exception as e:
             logger.error(f"Error getting channel activity: {str(e)}")
-            return {member["zid"]: {"message_count": 0} for member in members}
+            return self._empty_channel_activity(members)
 
     def _ai_analyze_contributions(self, attendance, tasks, channel_activity):
         """
@@ -271,31 +281,98 @@ class PeerReviewService:
             AI analysis text
         """
         try:
-            prompt = f"""
-Analyze the following student contributions for a group project. Consider attendance, task completion, and discussion activity.
-
-Attendance:
-{attendance}
-
-Tasks:
-{tasks}
-
-Channel Activity:
-{channel_activity}
-
-Please provide a summary, identify any unfair contributions, and suggest score adjustments if necessary.
-"""
-            response = self.openai_client.chat.completions.create(
+            # Within the token budget, channel activity is shortened first, then tasks and attendance
+            builder = PromptBuilder(prompt_budget("gpt-3.5-turbo", ANALYSIS_MAX_TOKENS, ANALYSIS_PROMPT_TOKENS))
+            builder.add("You are a helpful teaching assistant.", role="system", required=True, name="system")
+            builder.add("Analyze the following student contributions for a group project. "
+                        "Consider attendance, task completion, and discussion activity.", required=True)
+            builder.add(f"Attendance:\n{attendance}", join=True, truncatable=True, min_tokens=200, priority=1,
+                        name="attendance")
+            builder.add(f"Tasks:\n{tasks}", join=True, truncatable=True, min_tokens=200, priority=1, name="tasks")
+            builder.add(f"Channel Activity:\n{channel_activity}", join=True, truncatable=True, min_tokens=100,
+                        priority=2, name="channel activity")
+            builder.add("Please provide a summary, identify any unfair contributions, "
+                        "and suggest score adjustments if necessary.", join=True, required=True)
+            prompt = builder.build()
+            logger.info(f"Contribution analysis prompt: {prompt.tokens}/{prompt.budget} tokens, "
+                        f"truncated {prompt.truncated}")
+
+            # Batch priority: waits behind interactive chat replies
+            response = self.llm.complete(
+                prompt.messages,
+                priority=BATCH,
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful teaching assistant."},
-                    {"role": "user", "content": prompt}
-                ]
+                max_tokens=ANALYSIS_MAX_TOKENS
             )
-            return response.choices[0].message.content.strip()
+            return response.strip()
         except Exception as e:
             logger.error(f"[OpenAI Error] {e}")
-            return "AI analysis unavailable."
+            return AI_ANALYSIS_UNAVAILABLE
+
+    def _load_stored_analysis(self, group_id: str, assignment_id: str, fingerprint: str):
+        """
+        Get the AI analysis text of the latest saved analysis with the given input fingerprint
+
+        Args:
+            group_id: The group ID
+            assignment_id: The assignment ID
+            fingerprint: Fingerprint of the analysis inputs
+
+        Returns:
+            The AI analysis text, or None if no analysis has these inputs
+        """
+        rows = self.supabase.table("contribution_analyses") \
+            .select("ai_analysis") \
+            .eq("group_id", group_id) \
+            .eq("assignment_id", assignment_id) \
+            .eq("input_fingerprint", fingerprint) \
+            .order("created_at", desc=True) \
+            .limit(1) \
+            .execute().data
+        return rows[0]["ai_analysis"] if rows else None
+
+    def _get_review_aggregates(self, group_id: str, assignment_id: str) -> List[Dict[str, Any]]:
+        """
+        Get the score aggregates of each reviewee of a group
+
+        Args:
+            group_id: The group ID
+            assignment_id: The assignment ID
+
+        Returns:
+            List of peer_review_aggregates rows, one per reviewed member
+        """
+        if not PEER_REVIEW_AGGREGATES:
+            reviews = self.supabase.table("peer_reviews").select("reviewee_zid,score").eq("group_id", group_id).eq("assignment_id", assignment_id).execute().data
+            return aggregate_reviews(reviews)
+        return self.supabase.table("peer_review_aggregates") \
+            .select("reviewee_zid,review_count,score_sum,score_sumsq,score_min,score_max") \
+            .eq("group_id", group_id) \
+            .eq("assignment_id", assignment_id) \
+            .execute().data
+
+    def _get_review_patterns(self, group_id: str, assignment_id: str, members: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Get reviewer bias, reciprocity, collusion pairs, self-review inflation and reliability weights within a group
+
+        Args:
+            group_id: The group ID
+            assignment_id: The assignment ID
+            members: List of member dictionaries with 'zid' key
+
+        Returns:
+            The review pattern statistics of the group's score matrix, and its
+            reviewer-reliability weighted scores
+        """
+        reviews = self.supabase.table("peer_reviews").select("reviewer_zid,reviewee_zid,score").eq("group_id", group_id).eq("assignment_id", assignment_id).execute().data
+        matrix = ScoreMatrix(reviews, {member["zid"]: group_id for member in members})
+        patterns = matrix.analyze()
+        reliability = matrix.reliability()
+        return {
+            **{key: patterns[key] for key in ("reviewer_bias", "reciprocity", "collusion_pairs", "self_inflation")},
+            "weighted_scores": reliability["weighted_scores"],
+            "reviewer_weights": reliability["reviewer_weights"],
+        }
 
     def get_peer_reviews(self, group_id: str, assignment_id: str):
         """
@@ -335,6 +412,12 @@ Please provide a summary, identify any unfair contributions, and suggest score a
 # Initialize the peer review service
 prs = PeerReviewService()
 
+# AI analyses by input fingerprint, backed by the saved contribution_analyses rows
+analysis_cache = AnalysisCache(prs._load_stored_analysis, ttl=ANALYSIS_CACHE_TTL, max_entries=ANALYSIS_CACHE_SIZE)
+
+# Threads shared by the concurrent data collectors of all analyses
+collector_pool = ThreadPoolExecutor(max_workers=ANALYZE_COLLECTOR_WORKERS, thread_name_prefix="collector")
+
 @app.route('/api/peer-reviews', methods=['POST'])
 def submit_peer_review():
     """API endpoint to submit a peer review"""
@@ -369,6 +452,181 @@ def submit_peer_review():
         logger.error(f"[Peer Review Submit Error] {e}")
         return jsonify({"status": "error", "message": "Failed to submit review"}), 500
 
+def run_contribution_analysis(group_id: str, assignment_id: str, progress=None, refresh: bool = False,
+                              review_patterns: bool = False) -> Dict[str, Any]:
+    """
+    Analyze the contributions of a group's members and save the result
+
+    Args:
+        group_id: Group to analyze
+        assignment_id: Assignment the peer reviews belong to
+        progress: Optional function (fraction, stage) told about each step
+        refresh: Call the model even if an analysis with the same inputs exists
+        review_patterns: Also read every review of the group for the review
+            patterns and reliability-weighted scores
+
+    Returns:
+        The objective data, the analysis and the timings of each step
+
+    Raises:
+        LookupError: The group has no members
+    """
+    report = progress or (lambda fraction, stage: None)
+    started = time.monotonic()
+
+    # Get group members; the collectors need them to shape their results
+    report(0.05, "members")
+    members_response = prs.supabase.table("group_members").select("member_zid").eq("group_id", group_id).execute()
+    if not members_response.data:
+        raise LookupError("No members found in this group")
+    members_ms = round((time.monotonic() - started) * 1000, 1)
+
+    # Format member data consistently
+    members_info = [{"zid": member["member_zid"]} for member in members_response.data]
+
+    # Get all objective data and the peer reviews concurrently; a collector that
+    # times out contributes empty statistics, the peer reviews are required
+    report(0.1, "collecting")
+    collectors = {
+        "attendance": lambda: prs._get_meeting_attendance(group_id, members_info),
+        "tasks": lambda: prs._get_task_completion(group_id, assignment_id, members_info),
+        "channel_activity": lambda: prs._get_channel_activity(group_id, members_info),
+        "reviews": lambda: prs._get_review_aggregates(group_id, assignment_id),
+    }
+    if review_patterns:
+        # Reads every review of the group, which the aggregates above avoid
+        collectors["review_patterns"] = lambda: prs._get_review_patterns(group_id, assignment_id, members_info)
+    collected, collector_timings = run_collectors(collectors, collector_pool, ANALYZE_COLLECTOR_TIMEOUT, fallbacks={
+        "review_patterns": lambda: None,
+        "attendance": lambda: prs._empty_attendance(members_info),
+        "tasks": lambda: prs._empty_task_completion(members_info),
+        "channel_activity": lambda: prs._empty_channel_activity(members_info),
+    })
+    attendance = collected["attendance"]
+    tasks = collected["tasks"]
+    channel = collected["channel_activity"]
+    stats = review_stats(members_info, collected["reviews"])
+
+    result = complete_analysis(group_id, assignment_id, attendance, tasks, channel, stats, report, refresh)
+    if review_patterns:
+        patterns = collected["review_patterns"]
+        # Offered next to the plain averages; None when the reviews could not be read in time
+        result["analysis"]["weighted_scores"] = patterns.pop("weighted_scores") if patterns else None
+        result["analysis"]["review_patterns"] = patterns
+    result["timings"] = {
+        "members_ms": members_ms,
+        "collectors": collector_timings,
+        **result["timings"],
+        "total_ms": round((time.monotonic() - started) * 1000, 1)
+    }
+    return result
+
+def complete_analysis(group_id: str, assignment_id: str, attendance: Dict[str, Any], tasks: Dict[str, Any],
+                      channel: Dict[str, Any], stats: Dict[str, Dict[str, Any]], progress=None,
+                      refresh: bool = False) -> Dict[str, Any]:
+    """
+    AI step of a contribution analysis: analyze the collected statistics, save the result
+
+    Args:
+        group_id: Group analyzed
+        assignment_id: Assignment the peer reviews belong to
+        attendance: Attendance statistics per member
+        tasks: Task completion statistics per member
+        channel: Channel activity per member
+        stats: Peer review count, mean, stdev, min and max score per member
+        progress: Optional function (fraction, stage) told about each step
+        refresh: Call the model even if an analysis with the same inputs exists
+
+    Returns:
+        The objective data, the analysis, whether it was reused ("cache") and the
+        timings of the AI call and the save
+    """
+    report = progress or (lambda fraction, stage: None)
+    scores = {zid: stat["mean"] for zid, stat in stats.items()}
+
+    # An unchanged set of inputs gets the analysis already made for it
+    fingerprint = input_fingerprint({
+        "version": ANALYSIS_PROMPT_VERSION,
+        "model": "gpt-3.5-turbo",
+        "budget": [ANALYSIS_PROMPT_TOKENS, ANALYSIS_MAX_TOKENS],
+        "attendance": attendance,
+        "tasks": tasks,
+        "channel_activity": channel,
+        "reviews": stats,
+    })
+    ai_summary, source = analysis_cache.get(group_id, assignment_id, fingerprint, refresh=refresh)
+
+    # Generate AI analysis
+    report(0.4, "analyzing")
+    ai_started = time.monotonic()
+    if ai_summary is None:
+        ai_summary = prs._ai_analyze_contributions(attendance, tasks, channel)
+    ai_ms = round((time.monotonic() - ai_started) * 1000, 1)
+
+    # Extract information from AI analysis
+    summary = prs._extract_summary(ai_summary)
+    fairness = prs._extract_fairness_assessment(ai_summary)
+
+    # Check for outliers in the score distribution
+    has_outliers, outlier_zids = prs._check_score_distribution_zscore(scores)
+
+    # Generate adjustment suggestions
+    suggestions = prs._extract_adjustments(ai_summary, scores)
+
+    # Save the analysis results to database; a reused analysis is already saved
+    report(0.9, "saving")
+    save_started = time.monotonic()
+    if source is None:
+        # A failed AI call is saved, but never reused
+        reusable = ai_summary != AI_ANALYSIS_UNAVAILABLE
+        prs._save_analysis_result(group_id, assignment_id, summary, fairness, suggestions,
+                                  ai_analysis=ai_summary, fingerprint=fingerprint if reusable else None)
+        if reusable:
+            analysis_cache.set(group_id, assignment_id, fingerprint, ai_summary)
+    save_ms = round((time.monotonic() - save_started) * 1000, 1)
+
+    return {
+        "objective_data": {
+            "attendance": attendance,
+            "tasks": tasks,
+            "channel_activity": channel
+        },
+        "analysis": {
+            "summary": summary,
+            "fairness": fairness,
+            "average_scores": scores,
+            "review_stats": stats,
+            "has_outliers": has_outliers,
+            "outlier_zids": outlier_zids,
+            "suggested_adjustments": suggestions
+        },
+        "full_ai_analysis": ai_summary,
+        "cache": {"hit": source is not None, "source": source, "fingerprint": fingerprint},
+        "timings": {
+            "ai_ms": ai_ms,
+            "save_ms": save_ms
+        }
+    }
+
+def _run_analysis_job(params: Dict[str, Any], progress) -> Dict[str, Any]:
+    return run_contribution_analysis(params["group_id"], params["assignment_id"], progress,
+                                     refresh=params.get("refresh", False),
+                                     review_patterns=params.get("review_patterns", False))
+
+# Contribution analyses run as background jobs; their state is kept in SQLite
+analysis_jobs = JobRunner(
+    JobStore(ANALYSIS_JOB_DB, lease=ANALYSIS_JOB_LEASE_SECONDS),
+    {"contribution_analysis": _run_analysis_job},
+    workers=ANALYSIS_JOB_WORKERS,
+    max_queue=ANALYSIS_JOB_QUEUE_SIZE,
+    retention=ANALYSIS_JOB_RETENTION_HOURS * 3600,
+)
+# Take over the jobs of workers that exited and stopped renewing their lease
+analysis_jobs.recover()
+
+def _job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: job[key] for key in ("job_id", "status", "progress", "stage", "params", "result", "error", "created_at", "updated_at")}
+
 @app.route('/api/peer-reviews/analyze', methods=['POST'])
 def analyze_contribution():
     """API endpoint to analyze contributions and save results"""
@@ -380,72 +638,99 @@ def analyze_contribution():
         if not all([group_id, assignment_id]):
             return jsonify({"error": "Missing required fields"}), 400
 
-        # Get group members
-        members_response = prs.supabase.table("group_members").select("member_zid").eq("group_id", group_id).execute()
-        if not members_response.data:
-            return jsonify({"error": "No members found in this group"}), 404
-
-        # Format member data consistently
-        members_info = [{"zid": member["member_zid"]} for member in members_response.data]
-
-        # Get all objective data for analysis
-        attendance = prs._get_meeting_attendance(group_id, members_info)
-        tasks = prs._get_task_completion(group_id, assignment_id, members_info)
-        channel = prs._get_channel_activity(group_id, members_info)
-        
-        # Generate AI analysis
-        ai_summary = prs._ai_analyze_contributions(attendance, tasks, channel)
-        
-        # Extract information from AI analysis
-        summary = prs._extract_summary(ai_summary)
-        fairness = prs._extract_fairness_assessment(ai_summary)
-        
-        # Get peer reviews and calculate average scores
-        reviews = prs.supabase.table("peer_reviews").select("reviewer_zid,reviewee_zid,score").eq("group_id", group_id).eq("assignment_id", assignment_id).execute().data
-        
-        # Calculate average scores for each member
-        scores = {}
-        for member in members_info:
-            zid = member["zid"]
-            member_reviews = [r for r in reviews if r["reviewee_zid"] == zid]
-            if member_reviews:
-                scores[zid] = sum(r["score"] for r in member_reviews) / len(member_reviews)
-            else:
-                scores[zid] = 0.0  # Default score if no reviews
-        
-        # Check for outliers in the score distribution
-        has_outliers, outlier_zids = prs._check_score_distribution_zscore(scores)
-        
-        # Generate adjustment suggestions
-        suggestions = prs._extract_adjustments(ai_summary, scores)
-        
-        # Save the analysis results to database
-        prs._save_analysis_result(group_id, assignment_id, summary, fairness, suggestions)
-        
-        # Return the analysis data
-        return jsonify({
-            "status": "success",
-            "data": {
-                "objective_data": {
-                    "attendance": attendance,
-                    "tasks": tasks,
-                    "channel_activity": channel
-                },
-                "analysis": {
-                    "summary": summary,
-                    "fairness": fairness,
-                    "average_scores": scores,
-                    "has_outliers": has_outliers,
-                    "outlier_zids": outlier_zids,
-                    "suggested_adjustments": suggestions
-                },
-                "full_ai_analysis": ai_summary
-            }
-        })
+        refresh = bool(data.get("refresh", False))
+        review_patterns = bool(data.get("review_patterns", False))
+        return jsonify({"status": "success", "data": run_contribution_analysis(
+            group_id, assignment_id, refresh=refresh, review_patterns=review_patterns)})
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         logger.error(f"[Analyze Error] {e}")
         return jsonify({"status": "error", "message": "Server error"}), 500
 
+@app.route('/api/peer-reviews/analyze/jobs', methods=['POST'])
+def create_analysis_job():
+    """API endpoint to start a contribution analysis in the background"""
+    try:
+        data = request.get_json()
+        group_id = data.get("group_id")
+        assignment_id = data.get("assignment_id")
+
+        if not all([group_id, assignment_id]):
+            return jsonify({"error": "Missing required fields"}), 400
+
+        # Identical requests share the job that is already queued or running
+        review_patterns = bool(data.get("review_patterns", False))
+        job, created = analysis_jobs.submit(
+            "contribution_analysis",
+            {"group_id": str(group_id), "assignment_id": str(assignment_id), "refresh": bool(data.get("refresh", False)),
+             "review_patterns": review_patterns},
+            dedup_key=f"contribution_analysis:{group_id}:{assignment_id}" + (":review_patterns" if review_patterns else ""),
+        )
+        if job["status"] == "failed":
+            return jsonify({"status": "error", "message": job["error"], "data": _job_response(job)}), 503
+        response = jsonify({"status": "success", "data": {**_job_response(job), "deduplicated": not created}})
+        response.headers["Location"] = f"/api/peer-reviews/analyze/jobs/{job['job_id']}"
+        return response, 202
+    except Exception as e:
+        logger.error(f"[Analyze Job Error] {e}")
+        return jsonify({"status": "error", "message": "Failed to start analysis"}), 500
+
+@app.route('/api/peer-reviews/analyze/jobs/<string:job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """API endpoint to get the status, progress and result of an analysis job"""
+    try:
+        job = analysis_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"status": "success", "data": _job_response(job)})
+    except Exception as e:
+        logger.error(f"[Analyze Job Fetch Error] {e}")
+        return jsonify({"status": "error", "message": "Failed to fetch analysis job"}), 500
+
+@app.route('/api/peer-reviews/analyze/cohort', methods=['POST'])
+def analyze_cohort_contributions():
+    """API endpoint to analyze every group of a course, streaming one JSON line per finished group"""
+    data = request.get_json() or {}
+    course_code = data.get("course_code")
+    assignment_id = data.get("assignment_id")
+
+    if not all([course_code, assignment_id]):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    def events():
+        try:
+            complete = functools.partial(complete_analysis, refresh=bool(data.get("refresh", False)))
+            for event in analyze_cohort(prs.supabase, course_code, assignment_id, complete,
+                                        processes=COHORT_PROCESSES, llm_concurrency=COHORT_LLM_CONCURRENCY,
+                                        use_aggregates=PEER_REVIEW_AGGREGATES):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logger.error(f"[Cohort Analyze Error] {e}")
+            yield json.dumps({"event": "error", "message": "Server error"}) + "\n"
+
+    return Response(stream_with_context(events()), mimetype="application/x-ndjson")
+
+@app.route('/api/peer-reviews/analytics/course/<string:course_code>/assignment/<string:assignment_id>', methods=['GET'])
+def get_course_review_analytics(course_code, assignment_id):
+    """API endpoint for the course dashboard: review statistics of every group of a course"""
+    try:
+        z_threshold = float(request.args.get("z_threshold", 1.0))
+    except ValueError:
+        return jsonify({"error": "z_threshold must be a number"}), 400
+    try:
+        started = time.monotonic()
+        reviews, members = fetch_course_reviews(prs.supabase, course_code, assignment_id)
+        fetch_ms = round((time.monotonic() - started) * 1000, 1)
+        matrix = ScoreMatrix(reviews, members)
+        analytics = matrix.analyze(z_threshold=z_threshold)
+        analytics["reliability"] = matrix.reliability()
+        analytics["timings"] = {"fetch_ms": fetch_ms, "total_ms": round((time.monotonic() - started) * 1000, 1)}
+        return jsonify({"status": "success", "data": analytics})
+    except Exception as e:
+        logger.error(f"[Course Analytics Error] {e}")
+        return jsonify({"status": "error", "message": "Failed to compute course analytics"}), 500
+
 @app.route('/api/peer-reviews/analysis-results/group/<string:group_id>/assignment/<string:assignment_id>', methods=['GET'])
 def get_analysis_results(group_id, assignment_id):
     """API endpoint to get saved analysis results"""
@@ -494,10 +779,18 @@ def get_member_reviews(zid):
         logger.error(f"[Get Member Reviews Error] {e}")
         return jsonify({"status": "error", "message": "Failed to fetch member reviews"}), 500
 
-if __name__ == '__main__':
+# API Routing: Connection pool statistics
+@app.route('/api/service/stats', methods=['GET'])
+def get_service_stats():
+    return jsonify({"status": "success", "data": {"http_pool": pool_stats(), "llm_gateway": get_gateway().stats(),
+                                                     "analysis_jobs": analysis_jobs.stats(),
+                                                     "analysis_cache": analysis_cache.stats()}})
+
+def run_dev_server(port: int = 5003) -> None:
+    """Run on the Werkzeug development server (see serve.py for production)"""
     print("========================")
     print("Starting peer review service...")
-    print(f"Server will run at http://localhost:5003")
+    print(f"Server will run at http://localhost:{port}")
     print(f"Debug mode: {DEBUG}")
     print("Use Ctrl+C to stop the server")
     print("========================")
@@ -513,6 +806,9 @@ if __name__ == '__main__':
     
     app.run(
         host='0.0.0.0',
-        port=5003,
+        port=port,
         debug=DEBUG
-    )
\ No newline at end of file
+    )
+
+if __name__ == '__main__':
+    run_dev_server()
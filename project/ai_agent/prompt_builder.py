@@ -0,0 +1,188 @@
+"""
+Token-budgeted assembly of chat prompts.
+
+Tokens are counted locally, with tiktoken when it is installed and its
+encodings can be loaded, and with a word-based approximation otherwise.
+PromptBuilder assembles chat messages from prioritised sections and
+shortens or drops the least important ones until the prompt fits its
+budget, so oversized prompts are trimmed before they are sent instead of
+being rejected by the API.
+"""
+import math
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Framing tokens chat models add per message, and once to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+TRUNCATION_MARKER = " [...]"
+
+# Context windows of the models in use
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4o-mini": 128000,
+}
+
+# Word and punctuation pieces, used when tiktoken is unavailable
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+_encodings: Dict[str, object] = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # The encoding files could not be fetched, e.g. offline
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Number of tokens of a text"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # About one token per short word or symbol, longer words every four characters
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECES.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """The longest prefix of a text with at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    used = 0
+    for match in _PIECES.finditer(text):
+        used += math.ceil(len(match.group()) / 4)
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-3.5-turbo") -> int:
+    """Prompt tokens of a list of chat messages"""
+    return sum(count_tokens(str(message.get("content") or ""), model) + MESSAGE_OVERHEAD_TOKENS
+               for message in messages) + REPLY_OVERHEAD_TOKENS
+
+
+def prompt_budget(model: str, max_tokens: int, limit: Optional[int] = None) -> int:
+    """Prompt tokens available next to a reply of max_tokens, optionally capped at limit"""
+    budget = MODEL_CONTEXT_TOKENS.get(model, 4096) - max_tokens
+    return min(budget, limit) if limit else budget
+
+
+class Prompt(NamedTuple):
+    messages: List[dict]
+    tokens: int
+    budget: int
+    truncated: List[str]
+    dropped: List[str]
+
+
+class PromptBuilder:
+    """
+    Chat prompt assembled from sections within a token budget.
+
+    Sections are added in prompt order. Each one has a priority (0 is the
+    most important). When the prompt is over budget, the least important
+    section is shortened down to its min_tokens if it is truncatable, and
+    dropped if it is not required, until the prompt fits; among sections of
+    the same priority, the one added first goes first. A section added with
+    join=True is appended to the previous section's message.
+    """
+
+    def __init__(self, budget: int, model: str = "gpt-3.5-turbo"):
+        """
+        Args:
+            budget: Most prompt tokens the built messages may take
+            model: Model whose tokenizer counts the tokens
+        """
+        self.budget = budget
+        self.model = model
+        self._sections: List[dict] = []
+
+    def add(self, text: str, role: str = "user", priority: int = 0, required: bool = False,
+            truncatable: bool = False, min_tokens: int = 0, name: Optional[str] = None,
+            join: bool = False) -> "PromptBuilder":
+        """
+        Args:
+            text: Section content
+            role: Chat role of the section's message
+            priority: Lower values are kept longer
+            required: Never drop the section
+            truncatable: The section may be shortened, down to min_tokens
+            min_tokens: Shortest length a truncatable section is cut to
+            name: Label of the section in the truncated/dropped report
+            join: Append to the previous section's message instead of starting a new one
+        """
+        message = self._sections[-1]["message"] if join and self._sections else len(self._sections)
+        self._sections.append({
+            "text": text, "role": role, "priority": priority, "required": required,
+            "truncatable": truncatable, "min_tokens": min_tokens,
+            "name": name or f"section {len(self._sections)}", "message": message,
+            "tokens": count_tokens(text, self.model), "dropped": False,
+        })
+        return self
+
+    def _messages(self) -> List[dict]:
+        messages: Dict[int, dict] = {}
+        for section in self._sections:
+            if section["dropped"] or not section["text"]:
+                continue
+            message = messages.get(section["message"])
+            if message is None:
+                messages[section["message"]] = {"role": section["role"], "content": section["text"]}
+            else:
+                message["content"] += "\n\n" + section["text"]
+        return list(messages.values())
+
+    def build(self) -> Prompt:
+        """Messages within the budget, their token count and the names of cut sections"""
+        truncated: List[str] = []
+        dropped: List[str] = []
+        marker_tokens = count_tokens(TRUNCATION_MARKER, self.model)
+        messages = self._messages()
+        tokens = count_message_tokens(messages, self.model)
+        # Least important first; among equal priorities, the earliest added
+        for index in sorted(range(len(self._sections)), key=lambda i: (-self._sections[i]["priority"], i)):
+            if tokens <= self.budget:
+                break
+            section = self._sections[index]
+            while tokens > self.budget and section["truncatable"] and section["tokens"] > section["min_tokens"]:
+                keep = max(section["min_tokens"], section["tokens"] - (tokens - self.budget) - marker_tokens)
+                if keep <= 0 and not section["required"]:
+                    break
+                text = truncate_to_tokens(section["text"], keep, self.model) + TRUNCATION_MARKER
+                text_tokens = count_tokens(text, self.model)
+                if text_tokens >= section["tokens"]:
+                    break
+                section["text"], section["tokens"] = text, text_tokens
+                if section["name"] not in truncated:
+                    truncated.append(section["name"])
+                messages = self._messages()
+                tokens = count_message_tokens(messages, self.model)
+            if tokens > self.budget and not section["required"]:
+                section["dropped"] = True
+                dropped.append(section["name"])
+                if section["name"] in truncated:
+                    truncated.remove(section["name"])
+                messages = self._messages()
+                tokens = count_message_tokens(messages, self.model)
+        return Prompt(messages, tokens, self.budget, truncated, dropped)
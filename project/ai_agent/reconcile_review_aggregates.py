@@ -0,0 +1,81 @@
+"""
+Compare the peer_review_aggregates table with the peer reviews and rebuild it.
+
+The aggregates are maintained by a trigger on peer_reviews (see
+database/peer_review_service.sql). This command recomputes them from the
+reviews, reports every reviewee whose stored aggregate differs, and then
+rebuilds the table through rebuild_peer_review_aggregates(). With --check
+it only reports, and exits with status 1 if anything differs.
+
+Usage:
+    python reconcile_review_aggregates.py --check
+    python reconcile_review_aggregates.py --group-id 3 --assignment-id 1
+"""
+import argparse
+import math
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from cohort_analysis import fetch_rows
+from contribution_metrics import aggregate_reviews
+from http_pool import create_supabase_client
+
+FIELDS = ("review_count", "score_sum", "score_sumsq", "score_min", "score_max")
+
+
+def find_drift(reviews, aggregates):
+    """
+    (group_id, assignment_id, reviewee_zid, stored row or None, expected row or None)
+    for every reviewee whose stored aggregate does not match its reviews
+    """
+    expected = {}
+    by_key = {}
+    for review in reviews:
+        by_key.setdefault((review["group_id"], review["assignment_id"]), []).append(review)
+    for (group_id, assignment_id), group_reviews in by_key.items():
+        for row in aggregate_reviews(group_reviews):
+            expected[(group_id, assignment_id, row["reviewee_zid"])] = row
+    stored = {(row["group_id"], row["assignment_id"], row["reviewee_zid"]): row for row in aggregates}
+
+    drift = []
+    for key in sorted(set(expected) | set(stored), key=lambda k: tuple(map(str, k))):
+        want, have = expected.get(key), stored.get(key)
+        if want is None or have is None or not all(
+                math.isclose(float(want[f]), float(have[f]), rel_tol=1e-9, abs_tol=1e-6) for f in FIELDS):
+            drift.append((*key, have, want))
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile peer review aggregates with the peer reviews")
+    parser.add_argument("--group-id", type=int, help="Only this group")
+    parser.add_argument("--assignment-id", type=int, help="Only this assignment")
+    parser.add_argument("--check", action="store_true", help="Report differences without rebuilding")
+    args = parser.parse_args()
+
+    load_dotenv()
+    supabase = create_supabase_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    filters = {name: value for name, value in (("group_id", args.group_id), ("assignment_id", args.assignment_id))
+               if value is not None}
+
+    reviews = fetch_rows(supabase, "peer_reviews", "group_id,assignment_id,reviewee_zid,score",
+                         ["group_id", "assignment_id", "reviewee_zid", "reviewer_zid", "created_at"], filters=filters)
+    aggregates = fetch_rows(supabase, "peer_review_aggregates",
+                            "group_id,assignment_id,reviewee_zid," + ",".join(FIELDS),
+                            ["group_id", "assignment_id", "reviewee_zid"], filters=filters)
+    drift = find_drift(reviews, aggregates)
+    for group_id, assignment_id, zid, have, want in drift:
+        print(f"group {group_id} assignment {assignment_id} {zid}: stored {have}, expected {want}")
+    print(f"{len(reviews)} reviews, {len(aggregates)} aggregates, {len(drift)} differing")
+
+    if args.check:
+        sys.exit(1 if drift else 0)
+    written = supabase.rpc("rebuild_peer_review_aggregates",
+                           {"p_group_id": args.group_id, "p_assignment_id": args.assignment_id}).execute().data
+    print(f"Rebuilt {written} aggregates")
+
+
+if __name__ == "__main__":
+    main()
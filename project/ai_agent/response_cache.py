@@ -0,0 +1,107 @@
+import hashlib
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from channel_queries import ASSISTANT_SENDER_ZID
+from ttl_cache import MISSING, TTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:]+$")
+
+
+def normalize_question(content: str) -> str:
+    """Question text compared by the cache: no @assistant tag, case or extra whitespace"""
+    question = re.sub("@assistant", "", content, flags=re.IGNORECASE)
+    question = _WHITESPACE.sub(" ", question).strip().lower()
+    return _TRAILING_PUNCTUATION.sub("", question)
+
+
+def context_hash(channel_context: Optional[list]) -> str:
+    """
+    Hash of the discussion a question was asked in.
+
+    Earlier @assistant questions and AI replies are left out, so asking the
+    same question again right after it was answered still finds the entry.
+    """
+    digest = hashlib.sha1()
+    for msg in channel_context or []:
+        content = msg.get("content") or ""
+        if msg.get("sender_zid") == ASSISTANT_SENDER_ZID or "@assistant" in content.lower():
+            continue
+        digest.update(content.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class AssistantResponseCache:
+    """
+    Exact-match cache of AI assistant replies.
+
+    Replies are keyed on the channel, the normalised question and a hash of the
+    context window, and kept in a TTLCache (TTL and LRU eviction). Questions
+    starting with `bypass_prefix` (after the @assistant tag) skip the cache and
+    are answered fresh. A `max_entries` of 0 disables caching.
+    """
+
+    def __init__(self, ttl: float = 900.0, max_entries: int = 1000, bypass_prefix: str = "!fresh"):
+        """
+        Args:
+            ttl: Seconds a cached reply is served
+            max_entries: Number of replies kept before LRU eviction, 0 disables the cache
+            bypass_prefix: Question prefix that forces a fresh reply
+        """
+        self.enabled = max_entries > 0
+        self.bypass_prefix = bypass_prefix
+        self._replies = TTLCache(ttl=ttl, max_entries=max(max_entries, 1))
+        # Bumped by evict_channel(); entries of older generations are never hit again
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.bypassed = 0
+        self.stored = 0
+
+    def strip_bypass(self, content: str) -> Tuple[str, bool]:
+        """Remove the opt-out prefix from a message, returning the message and whether it was there"""
+        if not self.bypass_prefix:
+            return content, False
+        question = re.sub("@assistant", "", content, flags=re.IGNORECASE).strip()
+        if not question.lower().startswith(self.bypass_prefix.lower()):
+            return content, False
+        with self._lock:
+            self.bypassed += 1
+        return "@assistant " + question[len(self.bypass_prefix):].strip(), True
+
+    def key(self, channel_id, content: str, channel_context: Optional[list]) -> tuple:
+        channel = str(channel_id)
+        with self._lock:
+            generation = self._generations.get(channel, 0)
+        return channel, generation, normalize_question(content), context_hash(channel_context)
+
+    def get(self, key: tuple) -> Optional[str]:
+        """Cached reply for a key made by key(), or None"""
+        if not self.enabled:
+            return None
+        value = self._replies.get(key)
+        return None if value is MISSING else value
+
+    def set(self, key: tuple, reply: Optional[str]) -> None:
+        if not self.enabled or not reply:
+            return
+        self._replies.set(key, reply)
+        with self._lock:
+            self.stored += 1
+
+    def evict_channel(self, channel_id) -> None:
+        """Stop serving the cached replies of a channel; they age out of the LRU"""
+        channel = str(channel_id)
+        with self._lock:
+            self._generations[channel] = self._generations.get(channel, 0) + 1
+
+    def clear(self) -> None:
+        self._replies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._replies.stats()
+        with self._lock:
+            stats.update({"enabled": self.enabled, "stored": self.stored, "bypassed": self.bypassed})
+        return stats
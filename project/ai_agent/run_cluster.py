@@ -0,0 +1,121 @@
+"""
+Run several channel service worker processes that share Socket.IO rooms.
+
+A local UnixSocketBroker relays broadcasts between the workers, so no
+external message queue is needed. Worker i listens on base_port + i; put a
+load balancer with sticky sessions in front of them (see README.md).
+
+Usage:
+    python run_cluster.py --workers 4 --base-port 5102
+    python run_cluster.py --workers 4 --base-port 5102 --print-nginx
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from socketio_backend import UnixSocketBroker
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOCKET_PATH = "/tmp/avocado-channel-socketio.sock"
+
+
+def nginx_config(base_port: int, workers: int, listen_port: int) -> str:
+    """nginx config that pins each client to one worker (ip_hash) and proxies WebSockets"""
+    servers = "\n".join(f"    server 127.0.0.1:{base_port + i};" for i in range(workers))
+    return f"""upstream channel_workers {{
+    ip_hash;
+{servers}
+}}
+
+server {{
+    listen {listen_port};
+
+    location / {{
+        proxy_pass http://channel_workers;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_read_timeout 3600s;
+    }}
+}}
+"""
+
+
+def start_workers(workers: int, base_port: int, queue_url: str, extra_env=None, dev: bool = False,
+                  asgi: bool = False):
+    """Start `workers` channel service processes, in production mode unless `dev` is set"""
+    command = [sys.executable, "serve.py", "channel-asgi" if asgi else "channel"] + (["--dev"] if dev else [])
+    processes = []
+    for i in range(workers):
+        env = dict(os.environ)
+        env.update(extra_env or {})
+        env["PORT"] = str(base_port + i)
+        env["SOCKETIO_MESSAGE_QUEUE"] = queue_url
+        # The reloader would fork a second copy of every worker
+        env.setdefault("CHANNEL_SERVICE_DEBUG", "false")
+        # The workers split the LLM budgets between them
+        env.setdefault("LLM_PROCESSES", str(workers))
+        processes.append(subprocess.Popen(command, cwd=SERVICE_DIR, env=env))
+        print(f"Started worker {i} (pid {processes[-1].pid}) on port {base_port + i}")
+    return processes
+
+
+def stop_workers(processes, timeout: float = 15.0) -> None:
+    """SIGTERM every worker so they flush buffered messages, then wait for them"""
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(max(0.1, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run channel service workers behind a local Socket.IO broker")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--base-port", type=int, default=5102)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Path of the broker's UNIX socket")
+    parser.add_argument("--dev", action="store_true", help="Run the workers on the development server")
+    parser.add_argument("--asgi", action="store_true", help="Run the ASGI build of the channel service")
+    parser.add_argument("--print-nginx", action="store_true",
+                        help="Print an nginx config that exposes the workers on port 5002 and exit")
+    args = parser.parse_args()
+
+    if args.print_nginx:
+        print(nginx_config(args.base_port, args.workers, 5002))
+        return
+
+    broker = UnixSocketBroker(args.socket).start()
+    print(f"Socket.IO broker listening on {args.socket}")
+    processes = start_workers(args.workers, args.base_port, f"unix://{args.socket}", dev=args.dev, asgi=args.asgi)
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    try:
+        while not stopping:
+            if all(process.poll() is not None for process in processes):
+                print("All workers exited")
+                break
+            time.sleep(0.5)
+    finally:
+        print("Stopping workers...")
+        stop_workers(processes)
+        broker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Reviewer x reviewee score matrix and the review statistics derived from it.
+
+ScoreMatrix indexes the peer reviews of any number of groups (a whole
+course) once and computes every statistic with vectorised NumPy
+operations over the review arrays, so the cost grows with the number of
+reviews, not with students squared. The matrix itself is available dense
+or, with SciPy installed, sparse.
+
+Statistics:
+    received: count and mean of the scores each student received from others
+    leniency: how far above (lenient) or below (severe) the other reviewers
+        of the same reviewees a reviewer scores, with z-scores across reviewers
+    reciprocity: correlation of the scores mutual reviewers gave each other,
+        and collusion pairs that scored each other well above both the other
+        reviewers and their own scores for everyone else
+    self-review inflation: a student's self score minus what others gave them
+    group z-scores: each student's mean received score against their group's
+    reliability: scores weighted by how reliable each reviewer is, solved
+        iteratively over the whole review graph
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from scipy import sparse as sp
+except ImportError:
+    sp = None
+
+# Above this many students, to_matrix() returns a sparse matrix when SciPy is available
+DENSE_MAX_STUDENTS = 2000
+
+
+def zscores(values: np.ndarray) -> np.ndarray:
+    """Z-scores with the sample standard deviation; all zero when it is 0 or undefined"""
+    values = np.asarray(values, dtype=float)
+    if values.size < 2:
+        return np.zeros_like(values)
+    std = values.std(ddof=1)
+    if std == 0:
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+def score_outliers(scores: Dict[str, float], z_threshold: float = 1.0) -> List[str]:
+    """Keys of the scores whose z-score is beyond z_threshold, in input order"""
+    if not scores:
+        return []
+    keys = list(scores)
+    z = zscores(np.fromiter(scores.values(), dtype=float, count=len(keys)))
+    return [keys[i] for i in np.flatnonzero(np.abs(z) > z_threshold)]
+
+
+class ScoreMatrix:
+    """
+    Peer review scores of many groups, indexed for batched statistics.
+
+    Several reviews of the same reviewer and reviewee are averaged into one
+    score. A student's group is the group_id of the reviews they wrote or
+    received, or the one given in `members`.
+    """
+
+    def __init__(self, reviews: Iterable[Dict[str, Any]], members: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            reviews: Rows with reviewer_zid, reviewee_zid, score and optionally group_id
+            members: Optional {zid: group_id} of students to include even if nobody reviewed them
+        """
+        reviews = list(reviews)
+        zids: Dict[str, int] = {}
+        group_ids: Dict[Any, int] = {}
+        student_group: Dict[int, int] = {}
+
+        def student(zid: str, group_id: Any) -> int:
+            index = zids.setdefault(zid, len(zids))
+            if group_id is not None and index not in student_group:
+                student_group[index] = group_ids.setdefault(group_id, len(group_ids))
+            return index
+
+        for zid, group_id in (members or {}).items():
+            student(zid, group_id)
+        reviewer = np.fromiter((student(r["reviewer_zid"], r.get("group_id")) for r in reviews), dtype=np.int64,
+                               count=len(reviews))
+        reviewee = np.fromiter((student(r["reviewee_zid"], r.get("group_id")) for r in reviews), dtype=np.int64,
+                               count=len(reviews))
+        score = np.fromiter((float(r["score"]) for r in reviews), dtype=float, count=len(reviews))
+
+        self.zids: List[str] = list(zids)
+        self.groups: List[Any] = list(group_ids)
+        self.n = len(self.zids)
+        self.group_of = np.full(self.n, -1, dtype=np.int64)
+        for index, group in student_group.items():
+            self.group_of[index] = group
+
+        # One score per (reviewer, reviewee) pair, keyed reviewer * n + reviewee
+        keys, inverse = np.unique(reviewer * self.n + reviewee, return_inverse=True)
+        counts = np.bincount(inverse, minlength=keys.size)
+        self.keys = keys
+        self.reviewer = keys // max(self.n, 1)
+        self.reviewee = keys % max(self.n, 1)
+        self.score = np.bincount(inverse, weights=score, minlength=keys.size) / np.maximum(counts, 1)
+        self.review_count = len(reviews)
+        self._is_self = self.reviewer == self.reviewee
+        self._others_sparse = None
+
+    def to_matrix(self, dense: Optional[bool] = None):
+        """
+        The reviewer x reviewee score matrix.
+
+        Args:
+            dense: True for a NumPy array with NaN where there is no review, False for a
+                SciPy CSR matrix (missing reviews are implicit zeros). By default dense up
+                to DENSE_MAX_STUDENTS students or when SciPy is missing
+        """
+        if dense is None:
+            dense = self.n <= DENSE_MAX_STUDENTS or sp is None
+        if dense:
+            matrix = np.full((self.n, self.n), np.nan)
+            matrix[self.reviewer, self.reviewee] = self.score
+            return matrix
+        if sp is None:
+            raise RuntimeError("A sparse score matrix needs scipy")
+        return sp.csr_matrix((self.score, (self.reviewer, self.reviewee)), shape=(self.n, self.n))
+
+    def received(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per student: number of other reviewers, sum and mean of their scores (0 without reviews)"""
+        others = ~self._is_self
+        count = np.bincount(self.reviewee[others], minlength=self.n)
+        total = np.bincount(self.reviewee[others], weights=self.score[others], minlength=self.n)
+        mean = np.divide(total, count, out=np.zeros(self.n), where=count > 0)
+        return count, total, mean
+
+    def residuals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Each review's score minus the mean the other reviewers gave the same reviewee.
+
+        Returns:
+            Tuple of (indices of the pairs that have a residual, residuals). Self-reviews
+            and reviewees with a single reviewer have none
+        """
+        count, total, _ = self.received()
+        pairs = np.flatnonzero(~self._is_self & (count[self.reviewee] > 1))
+        reviewee = self.reviewee[pairs]
+        leave_one_out = (total[reviewee] - self.score[pairs]) / (count[reviewee] - 1)
+        return pairs, self.score[pairs] - leave_one_out
+
+    def leniency(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Per reviewer: number of reviews with a residual and their mean residual (0 without any)"""
+        pairs, residual = self.residuals()
+        reviewer = self.reviewer[pairs]
+        count = np.bincount(reviewer, minlength=self.n)
+        total = np.bincount(reviewer, weights=residual, minlength=self.n)
+        return count, np.divide(total, count, out=np.zeros(self.n), where=count > 0)
+
+    def mutual_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices (forward, backward) of the pairs i -> j, i < j, whose reverse j -> i also exists"""
+        candidates = np.flatnonzero(self.reviewer < self.reviewee)
+        reverse = self.reviewee[candidates] * self.n + self.reviewer[candidates]
+        position = np.searchsorted(self.keys, reverse)
+        position = np.minimum(position, max(self.keys.size - 1, 0))
+        found = self.keys[position] == reverse if self.keys.size else np.zeros(0, dtype=bool)
+        return candidates[found], position[found]
+
+    def group_zscores(self, values: np.ndarray) -> np.ndarray:
+        """Z-score of each student's value among the students of the same group (0 without a group)"""
+        values = np.asarray(values, dtype=float)
+        z = np.zeros(self.n)
+        grouped = self.group_of >= 0
+        group = self.group_of[grouped]
+        size = np.bincount(group, minlength=len(self.groups))
+        mean = np.bincount(group, weights=values[grouped], minlength=len(self.groups)) / np.maximum(size, 1)
+        deviation = values[grouped] - mean[group]
+        squares = np.bincount(group, weights=deviation ** 2, minlength=len(self.groups))
+        std = np.sqrt(np.divide(squares, size - 1, out=np.zeros(len(self.groups)), where=size > 1))
+        z[grouped] = np.divide(deviation, std[group], out=np.zeros(group.size), where=std[group] > 0)
+        return z
+
+    def _weighted_received(self, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Per student: sum of reviewer weight x score and sum of reviewer weights, self-reviews excluded"""
+        if sp is not None:
+            if self._others_sparse is None:
+                others = ~self._is_self
+                shape = (self.n, self.n)
+                rows, cols = self.reviewer[others], self.reviewee[others]
+                # Transposed (reviewee x reviewer), so each iteration is two CSR mat-vecs
+                self._others_sparse = (sp.csr_matrix((self.score[others], (cols, rows)), shape=shape),
+                                       sp.csr_matrix((np.ones(rows.size), (cols, rows)), shape=shape))
+            scores, present = self._others_sparse
+            return scores @ weights, present @ weights
+        others = ~self._is_self
+        reviewee, w = self.reviewee[others], weights[self.reviewer[others]]
+        return (np.bincount(reviewee, weights=w * self.score[others], minlength=self.n),
+                np.bincount(reviewee, weights=w, minlength=self.n))
+
+    def reliability(self, max_iterations: int = 100, tolerance: float = 1e-6,
+                    smoothing: float = 1.0) -> Dict[str, Any]:
+        """
+        Reviewer-reliability weighted scores, by iterating to a consensus.
+
+        Each round, a student's consensus score is the weighted mean of the
+        scores others gave them. A reviewer's error is the root mean square
+        distance of their scores from the consensus of the other reviewers
+        (their own score left out), and their weight becomes
+        1 / (error + smoothing), scaled to a mean of 1. Rounds repeat until no
+        consensus score moves by more than `tolerance`. A reviewer far from
+        everyone else thus counts for little, and nobody's weight depends on
+        their own scores agreeing with themselves.
+
+        Args:
+            max_iterations: Rounds at most
+            tolerance: Largest change of a consensus score that counts as converged
+            smoothing: Points added to every error, so an exact agreement does not get
+                an unbounded weight
+
+        Returns:
+            Dictionary with weighted_scores (0.0 for students nobody else reviewed),
+            reviewer_weights (reviewers with others' reviews to compare against),
+            iterations and converged
+        """
+        others = np.flatnonzero(~self._is_self)
+        reviewer, reviewee, score = self.reviewer[others], self.reviewee[others], self.score[others]
+        # Reviewers whose reviewees have another reviewer can be compared
+        count = np.bincount(reviewee, minlength=self.n)
+        comparable = count[reviewee] > 1
+        compared = np.bincount(reviewer[comparable], minlength=self.n)
+
+        weights = np.ones(self.n)
+        consensus = np.zeros(self.n)
+        converged = False
+        iterations = 0
+        for iterations in range(1, max_iterations + 1):
+            total, weight_sum = self._weighted_received(weights)
+            updated = np.divide(total, weight_sum, out=np.zeros(self.n), where=weight_sum > 0)
+            converged = iterations > 1 and np.max(np.abs(updated - consensus), initial=0.0) <= tolerance
+            consensus = updated
+            if converged:
+                break
+            # Leave-one-out consensus of each comparable review
+            w = weights[reviewer[comparable]]
+            rest = (total[reviewee[comparable]] - w * score[comparable]) / (weight_sum[reviewee[comparable]] - w)
+            squared = np.bincount(reviewer[comparable], weights=(score[comparable] - rest) ** 2, minlength=self.n)
+            error = np.sqrt(np.divide(squared, compared, out=np.zeros(self.n), where=compared > 0))
+            weights = np.where(compared > 0, 1.0 / (error + smoothing), 1.0)
+            rated = compared > 0
+            if rated.any():
+                weights[rated] /= weights[rated].mean()
+
+        return {
+            "weighted_scores": {self.zids[i]: round(float(consensus[i]), 4) for i in range(self.n)},
+            "reviewer_weights": {self.zids[i]: round(float(weights[i]), 4) for i in np.flatnonzero(compared > 0)},
+            "iterations": iterations,
+            "converged": bool(converged),
+        }
+
+    def analyze(self, z_threshold: float = 1.0, bias_threshold: float = 1.5, collusion_margin: float = 1.5,
+                min_reviews: int = 2) -> Dict[str, Any]:
+        """
+        All statistics of the matrix.
+
+        Args:
+            z_threshold: |z| above which a student's mean received score is an outlier in the group
+            bias_threshold: |z| of leniency above which a reviewer is lenient or severe
+            collusion_margin: Points two students must both score each other above the
+                other reviewers' mean, and above what they give everyone else, to be
+                reported as a collusion pair
+            min_reviews: Reviews with a residual a reviewer needs to be rated for bias
+        """
+        count, _, mean = self.received()
+        z = self.group_zscores(mean)
+        rated, leniency = self.leniency()
+        ranked = np.flatnonzero(rated >= min_reviews)
+        leniency_z = np.zeros(self.n)
+        leniency_z[ranked] = zscores(leniency[ranked])
+
+        pairs, residual = self.residuals()
+        residual_of = np.full(self.score.size, np.nan)
+        residual_of[pairs] = residual
+        # A pair is also scored against what the reviewer gives everyone else, so
+        # that a single harsh reviewer does not make the others look like colluders
+        others = ~self._is_self
+        given = np.bincount(self.reviewer[others], minlength=self.n)
+        given_total = np.bincount(self.reviewer[others], weights=self.score[others], minlength=self.n)
+        above_own = np.full(self.score.size, np.nan)
+        ranked_pairs = np.flatnonzero(others & (given[self.reviewer] > 1))
+        reviewer = self.reviewer[ranked_pairs]
+        above_own[ranked_pairs] = self.score[ranked_pairs] - \
+            (given_total[reviewer] - self.score[ranked_pairs]) / (given[reviewer] - 1)
+        forward, backward = self.mutual_pairs()
+        collusion = np.flatnonzero(
+            (residual_of[forward] > collusion_margin) & (residual_of[backward] > collusion_margin)
+            & (above_own[forward] > collusion_margin) & (above_own[backward] > collusion_margin))
+        correlation = None
+        if forward.size >= 3:
+            a, b = self.score[forward], self.score[backward]
+            if a.std() > 0 and b.std() > 0:
+                correlation = round(float(np.corrcoef(a, b)[0, 1]), 4)
+
+        self_pairs = np.flatnonzero(self._is_self)
+        self_student = self.reviewer[self_pairs]
+        has_others = count[self_student] > 0
+
+        def group_of(index: int) -> Any:
+            return self.groups[self.group_of[index]] if self.group_of[index] >= 0 else None
+
+        return {
+            "students": self.n,
+            "reviews": self.review_count,
+            "received": {
+                self.zids[i]: {"count": int(count[i]), "mean": round(float(mean[i]), 4), "group_z": round(float(z[i]), 4)}
+                for i in range(self.n)
+            },
+            "outliers": [self.zids[i] for i in np.flatnonzero(np.abs(z) > z_threshold)],
+            "reviewer_bias": {
+                self.zids[i]: {"reviews": int(rated[i]), "leniency": round(float(leniency[i]), 4),
+                               "z": round(float(leniency_z[i]), 4),
+                               "label": "lenient" if leniency_z[i] > bias_threshold
+                               else "severe" if leniency_z[i] < -bias_threshold else None}
+                for i in ranked
+            },
+            "reciprocity": {"mutual_pairs": int(forward.size), "correlation": correlation},
+            "collusion_pairs": [
+                {"group_id": group_of(self.reviewer[forward[k]]),
+                 "zids": [self.zids[self.reviewer[forward[k]]], self.zids[self.reviewee[forward[k]]]],
+                 "scores": [float(self.score[forward[k]]), float(self.score[backward[k]])],
+                 "margins": [round(float(residual_of[forward[k]]), 4), round(float(residual_of[backward[k]]), 4)]}
+                for k in collusion
+            ],
+            "self_inflation": {
+                self.zids[i]: {"self_score": float(self.score[p]), "others_mean": round(float(mean[i]), 4),
+                               "inflation": round(float(self.score[p] - mean[i]), 4)}
+                for p, i, ok in zip(self_pairs, self_student, has_others) if ok
+            },
+        }
@@ -0,0 +1,98 @@
+"""
+Start a service in production mode (gunicorn + gevent) or on the development server.
+
+Usage:
+    python serve.py channel                  # gunicorn, 1 gevent worker (Socket.IO)
+    python serve.py peer-review              # gunicorn, WEB_CONCURRENCY gevent workers
+    python serve.py peer-review --workers 8
+    python serve.py channel --dev            # Werkzeug development server
+    python serve.py channel-asgi             # ASGI build of the channel service on uvicorn
+
+Server settings come from gunicorn.conf.py and the environment (see README.md).
+The ASGI build reads the same environment variables.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+GUNICORN_CONFIG = os.path.join(SERVICE_DIR, "gunicorn.conf.py")
+
+SERVICES = {
+    # Socket.IO rooms and sessions live in one process, so the channel service
+    # always runs a single worker; run_cluster.py starts more processes
+    "channel": {"module": "channel_service", "port": 5002, "workers": 1},
+    "peer-review": {"module": "peer_review_service", "port": 5003, "workers": None},
+    "channel-asgi": {"module": "channel_service_asgi", "port": 5002, "workers": 1, "asgi": True},
+}
+
+
+def gunicorn_command(service: str, port: int, workers=None):
+    """Command line that serves `service` with gunicorn"""
+    settings = SERVICES[service]
+    command = [sys.executable, "-m", "gunicorn", "--config", GUNICORN_CONFIG, "--bind", f"0.0.0.0:{port}"]
+    workers = settings["workers"] or workers
+    if workers:
+        command += ["--workers", str(workers)]
+    command.append(f"{settings['module']}:app")
+    return command
+
+
+def uvicorn_command(service: str, port: int):
+    """Command line that serves an ASGI `service` with uvicorn, tuned like gunicorn.conf.py"""
+    settings = SERVICES[service]
+    command = [
+        sys.executable, "-m", "uvicorn", f"{settings['module']}:app",
+        "--host", "0.0.0.0", "--port", str(port),
+        "--workers", str(settings["workers"]),
+        "--timeout-keep-alive", os.getenv("KEEPALIVE_TIMEOUT", "75"),
+        "--timeout-graceful-shutdown", os.getenv("GRACEFUL_TIMEOUT", "30"),
+        "--limit-concurrency", os.getenv("WORKER_CONNECTIONS", "1000"),
+        "--backlog", os.getenv("SERVER_BACKLOG", "2048"),
+        "--log-level", os.getenv("LOG_LEVEL", "info"),
+    ]
+    return command
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a service in production or development mode")
+    parser.add_argument("service", choices=sorted(SERVICES))
+    parser.add_argument("--port", type=int, help="Defaults to PORT or the service's usual port")
+    parser.add_argument("--workers", type=int, help="Worker processes (peer-review only; defaults to WEB_CONCURRENCY)")
+    parser.add_argument("--dev", action="store_true", default=os.getenv("SERVER_MODE") == "dev",
+                        help="Use the Werkzeug development server (also SERVER_MODE=dev)")
+    args = parser.parse_args()
+
+    settings = SERVICES[args.service]
+    port = args.port or int(os.getenv("PORT", str(settings["port"])))
+    os.chdir(SERVICE_DIR)
+    if SERVICE_DIR not in sys.path:
+        sys.path.insert(0, SERVICE_DIR)
+
+    if settings.get("asgi"):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            sys.exit("uvicorn is required for the ASGI build (pip install -r requirements.txt)")
+        # uvicorn has no separate development mode; --dev turns on its reloader
+        command = uvicorn_command(args.service, port) + (["--reload"] if args.dev else [])
+        os.execv(command[0], command)
+
+    if args.dev:
+        importlib.import_module(settings["module"]).run_dev_server(port)
+        return
+
+    try:
+        import gunicorn  # noqa: F401
+        import gevent  # noqa: F401
+    except ImportError:
+        sys.exit("gunicorn and gevent are required for production mode "
+                 "(pip install -r requirements.txt), or run with --dev")
+    command = gunicorn_command(args.service, port, args.workers)
+    # gunicorn takes over this process, so SIGTERM goes straight to its arbiter
+    os.execv(command[0], command)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import asyncio
+import os
+import socket
+import struct
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+# Frames on the UNIX socket are a 4-byte big-endian length followed by the payload
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Optional[bytes]:
+    """Read one frame, or return None when the peer closed the connection"""
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes exceeds the limit")
+    return _recv_exactly(sock, size)
+
+
+class UnixSocketBroker:
+    """
+    Local pub/sub relay over a UNIX domain socket.
+
+    Every frame a connected worker publishes is forwarded to all the other
+    connected workers. Needs no external service; run one per host next to
+    the worker processes (run_cluster.py does this).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server: Optional[socket.socket] = None
+        self._clients: List[socket.socket] = []
+        self._send_locks: Dict[socket.socket, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.frames = 0
+
+    def start(self) -> "UnixSocketBroker":
+        """Bind the socket and accept workers on a background thread"""
+        if os.path.exists(self.path):
+            # Left over from a previous run that did not shut down cleanly
+            os.unlink(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(128)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients.append(client)
+                self._send_locks[client] = threading.Lock()
+            threading.Thread(target=self._client_loop, args=(client,), daemon=True).start()
+
+    def _client_loop(self, client: socket.socket) -> None:
+        try:
+            while True:
+                frame = recv_frame(client)
+                if frame is None:
+                    break
+                self._relay(client, frame)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._drop(client)
+
+    def _relay(self, sender: socket.socket, frame: bytes) -> None:
+        with self._lock:
+            targets = [(c, self._send_locks[c]) for c in self._clients if c is not sender]
+            self.frames += 1
+        for client, send_lock in targets:
+            try:
+                with send_lock:
+                    send_frame(client, frame)
+            except OSError:
+                self._drop(client)
+
+    def _drop(self, client: socket.socket) -> None:
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+                self._send_locks.pop(client, None)
+        try:
+            client.close()
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        self._closed = True
+        if self._server:
+            self._server.close()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            self._drop(client)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"workers": len(self._clients), "frames": self.frames}
+
+
+class RemoteEmitHookMixin:
+    """
+    Calls `on_remote_emit(event, data, room)` for every emit that arrives from
+    another worker, so per-process caches can follow broadcasts made elsewhere.
+    """
+
+    on_remote_emit: Optional[Callable] = None
+
+    def _handle_emit(self, message):
+        super()._handle_emit(message)
+        if self.on_remote_emit is None or message.get("host_id") == self.host_id:
+            return
+        data = message.get("data")
+        if isinstance(data, list) and len(data) == 1:
+            data = data[0]
+        try:
+            self.on_remote_emit(message.get("event"), data, message.get("room"))
+        except Exception:
+            traceback.print_exc()
+
+
+class UnixSocketManager(RemoteEmitHookMixin, socketio.PubSubManager):
+    """Socket.IO client manager that propagates broadcasts through a UnixSocketBroker"""
+
+    name = "unix"
+
+    def __init__(self, url: str, channel: str = "flask-socketio", write_only: bool = False,
+                 logger=None, json=None, reconnect_delay: float = 1.0):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = url[len("unix://"):]
+        self.reconnect_delay = reconnect_delay
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        with self._lock:
+            if self._sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+                self._sock = sock
+            return self._sock
+
+    def _reset(self, sock: Optional[socket.socket]) -> None:
+        with self._lock:
+            if sock is not None and self._sock is sock:
+                self._sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _publish(self, data) -> None:
+        payload = self.json.dumps(data).encode("utf-8")
+        for retries_left in (1, 0):
+            sock = None
+            try:
+                sock = self._connect()
+                with self._lock:
+                    send_frame(sock, payload)
+                return
+            except OSError as e:
+                self._reset(sock)
+                if not retries_left:
+                    self._get_logger().error(f"Cannot publish to {self.path}: {e}")
+
+    def _listen(self):
+        while True:
+            sock = None
+            try:
+                sock = self._connect()
+                frame = recv_frame(sock)
+            except (OSError, ValueError) as e:
+                self._get_logger().error(f"Broker connection lost ({e}), retrying")
+                frame = None
+            if frame is None:
+                self._reset(sock)
+                time.sleep(self.reconnect_delay)
+                continue
+            yield frame.decode("utf-8")
+
+
+class AsyncRemoteEmitHookMixin:
+    """RemoteEmitHookMixin for asyncio client managers; the hook stays a plain function"""
+
+    on_remote_emit: Optional[Callable] = None
+
+    async def _handle_emit(self, message):
+        await super()._handle_emit(message)
+        if self.on_remote_emit is None or message.get("host_id") == self.host_id:
+            return
+        data = message.get("data")
+        if isinstance(data, list) and len(data) == 1:
+            data = data[0]
+        try:
+            self.on_remote_emit(message.get("event"), data, message.get("room"))
+        except Exception:
+            traceback.print_exc()
+
+
+class AsyncUnixSocketManager(AsyncRemoteEmitHookMixin, AsyncPubSubManager):
+    """UnixSocketManager for socketio.AsyncServer, speaking the same frames to the same broker"""
+
+    name = "unix"
+
+    def __init__(self, url: str, channel: str = "flask-socketio", write_only: bool = False,
+                 logger=None, json=None, reconnect_delay: float = 1.0):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = url[len("unix://"):]
+        self.reconnect_delay = reconnect_delay
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _connect(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            return self._reader, self._writer
+
+    def _reset(self, writer: Optional[asyncio.StreamWriter]) -> None:
+        if writer is not None and self._writer is writer:
+            self._reader, self._writer = None, None
+        if writer is not None:
+            writer.close()
+
+    async def _publish(self, data) -> None:
+        payload = self.json.dumps(data).encode("utf-8")
+        for retries_left in (1, 0):
+            writer = None
+            try:
+                _, writer = await self._connect()
+                writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+                await writer.drain()
+                return
+            except OSError as e:
+                self._reset(writer)
+                if not retries_left:
+                    self._get_logger().error(f"Cannot publish to {self.path}: {e}")
+
+    async def _listen(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (size,) = FRAME_HEADER.unpack(header)
+                if size > MAX_FRAME_SIZE:
+                    raise ValueError(f"Frame of {size} bytes exceeds the limit")
+                frame = await reader.readexactly(size)
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                self._get_logger().error(f"Broker connection lost ({e}), retrying")
+                self._reset(writer)
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            yield frame.decode("utf-8")
+
+
+def create_async_client_manager(url: Optional[str], on_remote_emit: Optional[Callable] = None):
+    """
+    Build the cross-process client manager of a socketio.AsyncServer.
+
+    Supported URLs:
+        unix:///path/to/broker.sock  - local UnixSocketBroker, no external service
+        redis:// or rediss://        - Redis pub/sub (needs the redis package)
+        amqp://                      - RabbitMQ (needs aio_pika)
+
+    Uses the same channel as the Flask-SocketIO workers, so WSGI and ASGI
+    workers can share one queue.
+
+    Returns:
+        A client manager, or None for a single process without a queue
+    """
+    if not url:
+        return None
+    if url.startswith("unix://"):
+        manager = AsyncUnixSocketManager(url)
+    else:
+        if url.startswith(("redis://", "rediss://")):
+            base = socketio.AsyncRedisManager
+        elif url.startswith("amqp"):
+            base = socketio.AsyncAioPikaManager
+        else:
+            raise ValueError(f"Unsupported message queue for the ASGI server: {url}")
+        manager_class = type(f"Hooked{base.__name__}", (AsyncRemoteEmitHookMixin, base), {})
+        manager = manager_class(url, channel="flask-socketio")
+    manager.on_remote_emit = on_remote_emit
+    return manager
+
+
+def create_client_manager(url: Optional[str], on_remote_emit: Optional[Callable] = None):
+    """
+    Build the cross-process client manager for a message queue URL.
+
+    Supported URLs:
+        unix:///path/to/broker.sock  - local UnixSocketBroker, no external service
+        redis:// or rediss://        - Redis pub/sub (needs the redis package)
+        kafka://                     - Kafka (needs kafka-python)
+        zmq+tcp://                   - ZeroMQ (needs pyzmq)
+        anything else                - Kombu, e.g. amqp:// (needs kombu)
+
+    Returns:
+        A client manager, or None for a single process without a queue
+    """
+    if not url:
+        return None
+    if url.startswith("unix://"):
+        manager = UnixSocketManager(url)
+    else:
+        if url.startswith(("redis://", "rediss://")):
+            base = socketio.RedisManager
+        elif url.startswith("kafka://"):
+            base = socketio.KafkaManager
+        elif url.startswith("zmq"):
+            base = socketio.ZmqManager
+        else:
+            base = socketio.KombuManager
+        manager_class = type(f"Hooked{base.__name__}", (RemoteEmitHookMixin, base), {})
+        manager = manager_class(url, channel="flask-socketio")
+    manager.on_remote_emit = on_remote_emit
+    return manager
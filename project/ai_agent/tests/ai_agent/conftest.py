@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The services import their helper modules (message_buffer, ...) as top-level
+# modules, the same way they resolve when started from the ai_agent directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+# Keep the analysis job database of the peer review service out of the source tree
+os.environ.setdefault('ANALYSIS_JOB_DB', os.path.join(tempfile.mkdtemp(prefix='analysis-jobs-'), 'jobs.sqlite3'))
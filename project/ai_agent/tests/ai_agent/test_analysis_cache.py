@@ -0,0 +1,38 @@
+from ai_agent.analysis_cache import AnalysisCache, input_fingerprint
+
+
+def test_fingerprint_ignores_key_order_but_not_values():
+    a = input_fingerprint({'attendance': {'z1': {'attended': 2, 'total': 3}}, 'tasks': {}})
+    b = input_fingerprint({'tasks': {}, 'attendance': {'z1': {'total': 3, 'attended': 2}}})
+    c = input_fingerprint({'tasks': {}, 'attendance': {'z1': {'total': 3, 'attended': 3}}})
+
+    assert a == b != c
+
+
+def test_memory_then_stored_lookup():
+    stored = {('1', '2', 'abc'): 'from db'}
+    loads = []
+
+    def load(group_id, assignment_id, fingerprint):
+        loads.append(fingerprint)
+        return stored.get((group_id, assignment_id, fingerprint))
+
+    cache = AnalysisCache(load)
+    assert cache.get(1, 2, 'abc') == ('from db', 'database')
+    assert cache.get(1, 2, 'abc') == ('from db', 'memory')
+    assert cache.get(1, 2, 'other') == (None, None)
+    assert cache.get(1, 2, 'abc', refresh=True) == (None, None)
+    cache.set(1, 2, 'new', 'generated')
+    assert cache.get('1', '2', 'new') == ('generated', 'memory')
+    assert loads == ['abc', 'other']
+    assert cache.stats()['stored_hits'] == 1 and cache.stats()['bypassed'] == 1
+
+
+def test_failed_lookup_and_disabled_cache_are_misses(caplog):
+    def load(*args):
+        raise RuntimeError('column input_fingerprint does not exist')
+
+    assert AnalysisCache(load).get(1, 2, 'abc') == (None, None)
+    assert [(r.name, r.levelname) for r in caplog.records] == [('ai_agent.analysis_cache', 'ERROR')]
+    disabled = AnalysisCache(lambda *args: 'stored', max_entries=0)
+    assert disabled.get(1, 2, 'abc') == (None, None)
@@ -0,0 +1,65 @@
+import threading
+from ai_agent.assistant_worker import AssistantJobQueue
+
+def test_jobs_run_in_background():
+    handled = []
+    jobs = AssistantJobQueue(lambda job: handled.append(job['n']), workers=2, max_queue=10)
+    for n in range(5):
+        assert jobs.submit({'n': n})
+    jobs.join()
+
+    assert sorted(handled) == [0, 1, 2, 3, 4]
+    stats = jobs.stats()
+    assert stats['completed'] == 5
+    assert stats['queue_depth'] == 0
+    assert stats['in_flight'] == 0
+    jobs.shutdown()
+
+def test_full_queue_rejects_and_failures_are_counted():
+    release = threading.Event()
+
+    def handler(job):
+        release.wait(5)
+        if job.get('fail'):
+            raise RuntimeError('boom')
+
+    jobs = AssistantJobQueue(handler, workers=1, max_queue=1)
+    assert jobs.submit({'fail': True})
+    # Wait until the worker holds the first job so the queue slot is free again
+    while jobs.stats()['in_flight'] == 0:
+        pass
+    assert jobs.submit({})
+    assert not jobs.submit({})
+    release.set()
+    jobs.join()
+
+    stats = jobs.stats()
+    assert (stats['completed'], stats['failed'], stats['rejected']) == (1, 1, 1)
+    jobs.shutdown()
+
+def test_async_jobs_run_concurrently_on_the_loop():
+    import asyncio
+    from ai_agent.assistant_worker import AsyncAssistantJobQueue
+
+    async def scenario():
+        running = []
+        peak = [0]
+
+        async def handler(job):
+            running.append(job)
+            peak[0] = max(peak[0], len(running))
+            await asyncio.sleep(0.01)
+            running.remove(job)
+            if job.get('fail'):
+                raise RuntimeError('boom')
+
+        jobs = AsyncAssistantJobQueue(handler, workers=3, max_queue=3)
+        assert all(jobs.submit({'n': n, 'fail': n == 0}) for n in range(3))
+        await asyncio.sleep(0)
+        await jobs.join()
+        await jobs.shutdown()
+        return peak[0], jobs.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 3
+    assert (stats['completed'], stats['failed']) == (2, 1)
@@ -0,0 +1,51 @@
+import threading
+import time
+from ai_agent.broadcast import CoalescingBroadcaster
+
+def test_messages_within_window_are_sent_as_one_batch():
+    sent = []
+    done = threading.Event()
+
+    def emit(key, messages):
+        sent.append((key, [m['id'] for m in messages]))
+        if len(sent) == 2:
+            done.set()
+
+    broadcaster = CoalescingBroadcaster(emit, window=0.05)
+    for n in range(3):
+        broadcaster.publish('a', {'id': n})
+    broadcaster.publish('b', {'id': 9})
+
+    assert done.wait(5)
+    assert sorted(sent) == [('a', [0, 1, 2]), ('b', [9])]
+    assert broadcaster.stats()['batches'] == 2
+    broadcaster.close()
+
+def test_full_batch_is_sent_without_waiting():
+    sent = []
+    broadcaster = CoalescingBroadcaster(lambda key, messages: sent.append(len(messages)), window=60, max_batch=2)
+    broadcaster.publish('a', {'id': 1})
+    broadcaster.publish('a', {'id': 2})
+    broadcaster.publish('a', {'id': 3})
+
+    assert sent == [2]
+    broadcaster.close()
+    assert sent == [2, 1]
+
+def test_batch_after_a_full_one_waits_for_its_own_window():
+    sent = []
+    broadcaster = CoalescingBroadcaster(lambda key, messages: sent.append((time.monotonic(), len(messages))),
+                                        window=0.2, max_batch=2)
+    broadcaster.publish('a', {'id': 1})
+    time.sleep(0.1)
+    broadcaster.publish('a', {'id': 2})
+    started = time.monotonic()
+    broadcaster.publish('a', {'id': 3})
+    time.sleep(0.15)
+
+    # The full batch's deadline has passed, but the new batch's window has not
+    assert [size for _, size in sent] == [2]
+    time.sleep(0.2)
+    assert [size for _, size in sent] == [2, 1]
+    assert sent[1][0] - started >= 0.19
+    broadcaster.close()
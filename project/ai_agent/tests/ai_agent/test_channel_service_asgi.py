@@ -0,0 +1,119 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from ai_agent import channel_service_asgi
+from ai_agent.llm_gateway import LLMGateway, StubProvider
+
+@pytest.fixture(autouse=True)
+def clear_channel_cache():
+    channel_service_asgi.channel_cache.clear()
+    channel_service_asgi.channel_versions.clear()
+
+def _chainable_query(data, delay=0.0):
+    # Async query builder mock: filters chain, execute() is awaited
+    query = MagicMock()
+    for method in ('select', 'eq', 'gt', 'or_', 'order', 'limit', 'insert'):
+        getattr(query, method).return_value = query
+
+    async def execute():
+        await asyncio.sleep(delay)
+        return MagicMock(data=data)
+
+    query.execute = AsyncMock(side_effect=execute)
+    return query
+
+@pytest.fixture
+def mock_supabase(mocker):
+    mock_supabase = MagicMock()
+    mocker.patch('ai_agent.channel_service_asgi.supabase', mock_supabase)
+    return mock_supabase
+
+def request(method, url, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=channel_service_asgi.api)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+def test_get_channel_messages_paginated_with_etag(mock_supabase):
+    rows = [
+        {'id': 5, 'content': 'e', 'sent_at': '2025-04-01T10:05:00', 'sender_zid': 'z1234567', 'is_ai_response': False},
+        {'id': 4, 'content': 'd', 'sent_at': '2025-04-01T10:04:00', 'sender_zid': 'z1234567', 'is_ai_response': False},
+        {'id': 3, 'content': 'c', 'sent_at': '2025-04-01T10:03:00', 'sender_zid': 'z1234567', 'is_ai_response': False},
+    ]
+    query = _chainable_query(rows)
+    mock_supabase.table.return_value = query
+
+    response = request('GET', '/api/channels/1/messages?limit=2')
+    body = response.json()
+    assert response.status_code == 200
+    assert [m['id'] for m in body['data']] == [4, 5]
+    assert body['pagination']['has_more'] is True
+    query.limit.assert_called_with(3)
+
+    response = request('GET', '/api/channels/1/messages?limit=2',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+def test_assistant_message_is_queued(mock_supabase, mocker):
+    stored = {'id': 7, 'channel_id': '1', 'content': '@assistant hi', 'sender_zid': 'z1234567'}
+    mock_supabase.table.return_value = _chainable_query([stored | {'zid': 'z1234567'}])
+    mock_jobs = mocker.patch('ai_agent.channel_service_asgi.assistant_jobs')
+    mock_jobs.submit.return_value = True
+    mocker.patch('ai_agent.channel_service_asgi.sio.emit', AsyncMock())
+
+    response = request('POST', '/api/channels/1/messages', json={'sender_zid': 'z1234567', 'content': '@assistant hi'})
+    assert response.status_code == 202
+    assert response.json()['data']['ai_status'] == 'queued'
+    assert mock_jobs.submit.call_args.args[0]['content'] == '@assistant hi'
+
+def test_concurrent_requests_overlap_their_database_waits(mock_supabase):
+    mock_supabase.table.return_value = _chainable_query([{'channel_id': '1', 'zid': 'z1234567'}], delay=0.2)
+
+    async def fire():
+        transport = httpx.ASGITransport(app=channel_service_asgi.api)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(*[client.get('/api/channels/1/members') for _ in range(10)])
+
+    started = time.monotonic()
+    responses = asyncio.run(fire())
+    elapsed = time.monotonic() - started
+
+    assert all(r.status_code == 200 for r in responses)
+    # Ten 0.2 s queries one after another would take 2 s
+    assert elapsed < 1.0
+
+def test_assistant_uses_the_gateway_and_channel_summary(mocker):
+    gateway = LLMGateway(StubProvider())
+    mocker.patch.object(channel_service_asgi, 'llm', gateway)
+    open_stream = mocker.spy(gateway.provider, 'open_stream')
+    channel_service_asgi.assistant_cache.clear()
+    chunks = []
+
+    async def on_chunk(delta):
+        chunks.append(delta)
+
+    reply = asyncio.run(channel_service_asgi.process_ai_assistant_message(
+        '@assistant what is left?', [{'id': 1, 'sender_zid': 'z1', 'content': 'task 3 is done'}],
+        on_chunk=on_chunk, channel_id='9', summary='The team split the report into four tasks.'))
+
+    assert reply == ''.join(chunks) and reply.startswith('Stub reply')
+    assert gateway.stats()['classes']['interactive']['requests'] == 1
+    prompt = open_stream.call_args.args[0]
+    assert 'four tasks' in prompt[1]['content'] and prompt[-1]['content'] == 'what is left?'
+
+def test_remote_commit_bumps_the_channel_version(mock_supabase):
+    mock_supabase.table.return_value = _chainable_query([{'id': 1}])
+    channel_service_asgi.recent_messages.seed('47', [])
+    channel_service_asgi.handle_remote_emit('new_message', {'id': 'tmp-1', 'content': 'hi'}, 'channel_47')
+    etag = request('GET', '/api/channels/47/messages').headers['ETag']
+
+    channel_service_asgi.handle_remote_emit(
+        'message_committed', {'provisional_id': 'tmp-1', 'message': {'id': 12, 'content': 'hi'}}, 'channel_47')
+
+    assert channel_service_asgi.channel_versions.get('47') == '12'
+    assert channel_service_asgi.recent_messages.cached('47')[-1]['id'] == 12
+    assert request('GET', '/api/channels/47/messages', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,62 @@
+from ai_agent.channel_queries import build_assistant_messages
+from ai_agent.channel_summary import ChannelSummaries
+
+
+def run_now(target, *args):
+    target(*args)
+
+
+def make_summaries(store, messages, refresh_every=3):
+    def load_messages_after(channel_id, row):
+        last_id = row.get('last_message_id') or 0
+        return [m for m in messages if m['id'] > last_id]
+
+    def summarize(previous, new_messages):
+        return (previous or '') + ''.join(m['content'] for m in new_messages)
+
+    return ChannelSummaries(
+        lambda channel_id: store.get(channel_id),
+        lambda channel_id, row: store.__setitem__(channel_id, row),
+        load_messages_after,
+        summarize,
+        refresh_every=refresh_every,
+        spawn=run_now
+    )
+
+
+def test_summary_is_refreshed_every_k_messages():
+    store, messages = {}, []
+    summaries = make_summaries(store, messages)
+
+    for i, text in enumerate('abcde', start=1):
+        messages.append({'id': i, 'sent_at': f'2025-01-01T00:00:0{i}', 'content': text})
+        summaries.note_message(1)
+
+    assert store['1']['summary'] == 'abc'
+    assert store['1']['last_message_id'] == 3
+
+    messages.append({'id': 6, 'sent_at': '2025-01-01T00:00:06', 'content': 'f'})
+    summaries.note_message(1)
+
+    # Only the new messages were folded in
+    assert summaries.get(1) == 'abcdef'
+    assert store['1']['message_count'] == 6
+    assert summaries.stats()['refreshes'] == 2
+
+
+def test_channel_without_summary():
+    summaries = make_summaries({}, [])
+
+    assert summaries.get('9') is None
+
+
+def test_prompt_keeps_newest_messages_within_budget():
+    context = [{'sender_zid': 'z1', 'content': 'x' * 400} for _ in range(10)]
+    context[-1] = {'sender_zid': 'z1', 'content': 'latest'}
+
+    messages = build_assistant_messages('@assistant status?', context, summary='Team chose Flask.', token_budget=400)
+
+    assert messages[1]['content'].endswith('Team chose Flask.')
+    assert messages[-2]['content'] == 'latest'
+    # About 330 tokens are left after the prompt, summary and question: three long messages fit
+    assert sum(m['content'] == 'x' * 400 for m in messages) == 3
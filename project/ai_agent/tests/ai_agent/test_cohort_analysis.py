@@ -0,0 +1,119 @@
+import pytest
+
+from ai_agent.cohort_analysis import analyze_cohort, fetch_rows
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.bounds = None
+
+    def select(self, columns):
+        self.columns = columns.split(',')
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row[column] in values)
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def order(self, column):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        self.db.queries.append(self.table)
+        rows = [row for row in self.db.tables[self.table] if all(f(row) for f in self.filters)]
+        start, end = self.bounds
+        return type('Response', (), {'data': [{c: row.get(c) for c in self.columns} for row in rows[start:end + 1]]})
+
+
+class FakeSupabase:
+    def __init__(self, tables):
+        self.tables = tables
+        self.queries = []
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+@pytest.fixture
+def supabase():
+    return FakeSupabase({
+        'groups': [{'id': 1, 'course_code': 'COMP9900'}, {'id': 2, 'course_code': 'COMP9900'},
+                   {'id': 3, 'course_code': 'COMP9900'}, {'id': 4, 'course_code': 'COMP3900'}],
+        'group_members': [{'group_id': 1, 'member_zid': 'z1'}, {'group_id': 1, 'member_zid': 'z2'},
+                          {'group_id': 2, 'member_zid': 'z3'}, {'group_id': 4, 'member_zid': 'z9'}],
+        'peer_reviews': [{'group_id': 1, 'assignment_id': '7', 'reviewer_zid': 'z1', 'reviewee_zid': 'z2', 'score': 8},
+                         {'group_id': 1, 'assignment_id': '8', 'reviewer_zid': 'z1', 'reviewee_zid': 'z2', 'score': 2},
+                         {'group_id': 2, 'assignment_id': '7', 'reviewer_zid': 'z3', 'reviewee_zid': 'z3', 'score': 6}],
+        'peer_review_aggregates': [{'group_id': 1, 'assignment_id': '7', 'reviewee_zid': 'z2', 'review_count': 1,
+                                    'score_sum': 8.0, 'score_sumsq': 64.0, 'score_min': 8.0, 'score_max': 8.0},
+                                   {'group_id': 2, 'assignment_id': '7', 'reviewee_zid': 'z3', 'review_count': 1,
+                                    'score_sum': 6.0, 'score_sumsq': 36.0, 'score_min': 6.0, 'score_max': 6.0}],
+        'meetings': [{'id': 10, 'group_id': 1}, {'id': 11, 'group_id': 1}, {'id': 12, 'group_id': 2}],
+        'meeting_attendances': [{'meeting_id': 10, 'member_zid': 'z1'}, {'meeting_id': 11, 'member_zid': 'z1'},
+                                {'meeting_id': 10, 'member_zid': 'z2'}],
+        'tasks': [{'task_id': 20, 'group_id': 1, 'assignment_id': '7', 'description': 'abcd'}],
+        'task_assignees': [{'task_id': 20, 'zid': 'z2', 'is_completed': True}],
+        'channels': [{'id': 30, 'group_id': 1}, {'id': 31, 'group_id': 1}],
+        'channel_messages': [{'id': i, 'channel_id': 30, 'sender_zid': 'z1'} for i in range(5)]
+                            + [{'id': 99, 'channel_id': 31, 'sender_zid': 'z2'}],
+    })
+
+
+def test_fetch_rows_chunks_and_pages(supabase):
+    rows = fetch_rows(supabase, 'channel_messages', 'id', ['id'], 'channel_id', [30, 31, 32],
+                      chunk_size=2, page_size=2)
+
+    assert sorted(row['id'] for row in rows) == [0, 1, 2, 3, 4, 99]
+    # Chunk [30, 31]: pages of 2, 2, 2, 0 rows; chunk [32]: one empty page
+    assert len(supabase.queries) == 5
+
+
+@pytest.mark.parametrize('processes, use_aggregates', [(0, False), (0, True), (2, True)])
+def test_cohort_streams_each_group(supabase, processes, use_aggregates):
+    completed = []
+
+    def complete(group_id, assignment_id, attendance, tasks, channel, stats):
+        completed.append(group_id)
+        return {'attendance': attendance, 'tasks': tasks, 'channel_activity': channel,
+                'average_scores': {zid: stat['mean'] for zid, stat in stats.items()}}
+
+    events = list(analyze_cohort(supabase, 'COMP9900', '7', complete, processes=processes, llm_concurrency=2,
+                                 use_aggregates=use_aggregates))
+
+    assert events[0]['event'] == 'started' and events[0]['groups'] == 3
+    assert events[-1]['event'] == 'finished'
+    assert (events[-1]['succeeded'], events[-1]['failed']) == (2, 1)
+    assert [event['done'] for event in events[1:-1]] == [1, 2, 3]
+    by_group = {event['group_id']: event for event in events[1:-1]}
+    assert by_group[3]['event'] == 'group_failed'
+    group1 = by_group[1]['data']
+    assert group1['attendance']['z1'] == {'attended': 2, 'total': 2, 'attendance_rate': 1.0}
+    assert group1['tasks']['z2']['completed'] == 1
+    # Only the group's first channel counts
+    assert group1['channel_activity'] == {'z1': {'message_count': 5}, 'z2': {'message_count': 0}}
+    assert group1['average_scores'] == {'z1': 0.0, 'z2': 8.0}
+    assert sorted(completed) == [1, 2]
+    # One query per table, not per group
+    assert len(supabase.queries) == 9
+
+
+def test_failed_group_is_logged(supabase, caplog):
+    def complete(group_id, assignment_id, attendance, tasks, channel, stats):
+        raise RuntimeError('model down')
+
+    events = list(analyze_cohort(supabase, 'COMP9900', '7', complete, processes=0, llm_concurrency=1))
+
+    assert events[-1]['failed'] == 3
+    errors = [r for r in caplog.records if r.levelname == 'ERROR']
+    assert len(errors) == 2 and all(r.name == 'ai_agent.cohort_analysis' and r.exc_info for r in errors)
@@ -0,0 +1,36 @@
+import statistics
+
+from ai_agent.contribution_metrics import aggregate_reviews, review_stats
+
+
+def test_review_stats_from_aggregates_match_the_raw_reviews():
+    members = [{'zid': 'z1'}, {'zid': 'z2'}, {'zid': 'z3'}]
+    reviews = [{'reviewee_zid': 'z1', 'score': s} for s in (7, 9, 4.5, 8)] + [{'reviewee_zid': 'z2', 'score': 6}]
+
+    stats = review_stats(members, aggregate_reviews(reviews))
+
+    z1 = [7, 9, 4.5, 8]
+    assert stats['z1'] == {'count': 4, 'mean': statistics.mean(z1), 'stdev': round(statistics.stdev(z1), 4),
+                           'min': 4.5, 'max': 9.0}
+    assert stats['z2'] == {'count': 1, 'mean': 6.0, 'stdev': 0.0, 'min': 6.0, 'max': 6.0}
+    assert stats['z3'] == {'count': 0, 'mean': 0.0, 'stdev': 0.0, 'min': None, 'max': None}
+
+
+def test_reconcile_reports_only_differing_reviewees():
+    from ai_agent.reconcile_review_aggregates import find_drift
+
+    reviews = [{'group_id': 1, 'assignment_id': 2, 'reviewee_zid': 'z1', 'score': 8},
+               {'group_id': 1, 'assignment_id': 2, 'reviewee_zid': 'z2', 'score': 5}]
+    aggregates = [
+        {'group_id': 1, 'assignment_id': 2, 'reviewee_zid': 'z1', 'review_count': 1, 'score_sum': 8.0,
+         'score_sumsq': 64.0, 'score_min': 8.0, 'score_max': 8.0},
+        {'group_id': 1, 'assignment_id': 2, 'reviewee_zid': 'z2', 'review_count': 2, 'score_sum': 9.0,
+         'score_sumsq': 41.0, 'score_min': 4.0, 'score_max': 5.0},
+        {'group_id': 1, 'assignment_id': 2, 'reviewee_zid': 'z9', 'review_count': 1, 'score_sum': 1.0,
+         'score_sumsq': 1.0, 'score_min': 1.0, 'score_max': 1.0},
+    ]
+
+    drift = find_drift(reviews, aggregates)
+
+    assert [(zid, have is None, want is None) for _, _, zid, have, want in drift] == \
+        [('z2', False, False), ('z9', False, True)]
@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ai_agent.fanout import CollectorTimeout, run_collectors
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def slow(value, seconds):
+    def collector():
+        time.sleep(seconds)
+        return value
+    return collector
+
+
+def test_collectors_run_concurrently(executor):
+    started = time.monotonic()
+    results, timings = run_collectors({'a': slow(1, 0.2), 'b': slow(2, 0.2), 'c': slow(3, 0.2)}, executor, timeout=5)
+
+    assert results == {'a': 1, 'b': 2, 'c': 3}
+    assert time.monotonic() - started < 0.5
+    assert all(t['status'] == 'ok' and t['ms'] >= 190 for t in timings.values())
+
+
+def test_timed_out_collector_uses_its_fallback(executor):
+    results, timings = run_collectors({'fast': slow(1, 0), 'stuck': slow(2, 0.3)}, executor, timeout=5,
+                                      timeouts={'stuck': 0.1}, fallbacks={'stuck': lambda: 'empty'})
+
+    assert results == {'fast': 1, 'stuck': 'empty'}
+    assert timings['stuck']['status'] == 'timeout'
+
+
+def test_failure_without_fallback_is_raised(executor, caplog):
+    def broken():
+        raise RuntimeError('db down')
+
+    with pytest.raises(RuntimeError):
+        run_collectors({'ok': slow(1, 0), 'broken': broken}, executor, timeout=5)
+    assert [(r.name, r.levelname, r.exc_info is not None) for r in caplog.records] == [('ai_agent.fanout', 'ERROR', True)]
+    with pytest.raises(CollectorTimeout):
+        run_collectors({'stuck': slow(1, 0.3)}, executor, timeout=0.05)
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from ai_agent import http_pool
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        status = 503 if self.path == '/fail' else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    http_pool.host_stats.clear()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+
+def test_requests_reuse_pooled_connections(server):
+    client = httpx.Client(transport=http_pool.PooledTransport())
+    for _ in range(5):
+        client.get(f'{server}/')
+    client.get(f'{server}/fail')
+    client.close()
+
+    stats = http_pool.host_stats.snapshot()['127.0.0.1']
+    assert stats['requests'] == 6
+    assert stats['connections_opened'] == 1
+    assert stats['errors'] == 1
+    assert stats['reuse_ratio'] == pytest.approx(0.833, abs=0.001)
+
+def test_async_transport_records_the_same_stats(server):
+    async def fetch():
+        async with httpx.AsyncClient(transport=http_pool.AsyncPooledTransport()) as client:
+            for _ in range(3):
+                await client.get(f'{server}/')
+
+    asyncio.run(fetch())
+    stats = http_pool.host_stats.snapshot()['127.0.0.1']
+    assert (stats['requests'], stats['connections_opened']) == (3, 1)
+
+def test_shared_client_is_created_once():
+    assert http_pool.get_http_client() is http_pool.get_http_client()
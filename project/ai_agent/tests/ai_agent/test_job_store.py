@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+import pytest
+
+from ai_agent.job_store import FAILED, QUEUED, RUNNING, SUCCEEDED, JobRunner, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def test_in_flight_job_is_deduplicated(store):
+    job, created = store.create('analysis', {'group_id': '1'}, dedup_key='analysis:1')
+    again, created_again = store.create('analysis', {'group_id': '1'}, dedup_key='analysis:1')
+
+    assert created and not created_again
+    assert again['job_id'] == job['job_id']
+
+    # A finished job no longer blocks a new one
+    store.update(job['job_id'], status=SUCCEEDED, result={'ok': True})
+    new, created_new = store.create('analysis', {'group_id': '1'}, dedup_key='analysis:1')
+    assert created_new and new['job_id'] != job['job_id']
+    assert store.get(job['job_id'])['result'] == {'ok': True}
+
+
+def test_state_survives_a_new_store_on_the_same_file(store):
+    job, _ = store.create('analysis', {'group_id': '1'})
+    store.update(job['job_id'], progress=0.5, stage='collecting')
+
+    reopened = JobStore(store.path).get(job['job_id'])
+
+    assert reopened['status'] == QUEUED
+    assert (reopened['progress'], reopened['stage']) == (0.5, 'collecting')
+
+
+def test_recover_takes_over_jobs_with_expired_leases_once(store):
+    expired = JobStore(store.path, lease=-1)
+    dead, _ = expired.create('analysis', {}, dedup_key='a', owner='dead')
+    expired.claim(dead['job_id'], 'dead')
+    alive, _ = store.create('analysis', {}, dedup_key='b', owner='alive')
+
+    recovered = store.recover('new')
+
+    assert [job['job_id'] for job in recovered] == [dead['job_id']]
+    assert recovered[0]['status'] == QUEUED and recovered[0]['owner'] == 'new'
+    assert store.recover('other') == []
+    # Only the new owner may start it
+    assert not store.claim(dead['job_id'], 'dead')
+    assert store.claim(dead['job_id'], 'new')
+
+
+def test_renewed_lease_keeps_the_job(store):
+    short = JobStore(store.path, lease=0.05)
+    job, _ = short.create('analysis', {}, owner='busy')
+    short.claim(job['job_id'], 'busy')
+
+    assert store.renew('busy') == 1
+    time.sleep(0.1)
+
+    assert store.recover('new') == []
+    assert store.get(job['job_id'])['owner'] == 'busy'
+
+
+def test_runner_owner_is_unique_per_start(store):
+    first = JobRunner(store, {}, workers=1)
+    second = JobRunner(store, {}, workers=1)
+    first.close()
+    second.close()
+
+    assert first.owner != second.owner
+    assert first.owner.split(':')[1] == str(os.getpid())
+
+
+def test_runner_reports_progress_and_result(store):
+    release = threading.Event()
+    seen = []
+
+    def handler(params, progress):
+        progress(0.5, 'halfway')
+        seen.append(store.get(job['job_id']))
+        release.wait(5)
+        return {'sum': params['a'] + params['b']}
+
+    runner = JobRunner(store, {'add': handler}, workers=1)
+    job, created = runner.submit('add', {'a': 1, 'b': 2}, dedup_key='add')
+    duplicate, duplicate_created = runner.submit('add', {'a': 1, 'b': 2}, dedup_key='add')
+    release.set()
+    runner.join()
+
+    assert created and not duplicate_created and duplicate['job_id'] == job['job_id']
+    assert (seen[0]['status'], seen[0]['progress'], seen[0]['stage']) == (RUNNING, 0.5, 'halfway')
+    done = runner.get(job['job_id'])
+    assert (done['status'], done['progress'], done['result']) == (SUCCEEDED, 1.0, {'sum': 3})
+
+
+def test_runner_records_failures(store, caplog):
+    def handler(params, progress):
+        raise RuntimeError('boom')
+
+    runner = JobRunner(store, {'fail': handler}, workers=1)
+    job, _ = runner.submit('fail', {})
+    runner.join()
+
+    failed = runner.get(job['job_id'])
+    assert (failed['status'], failed['error']) == (FAILED, 'boom')
+    assert [(r.name, r.levelname, r.exc_info is not None) for r in caplog.records] == [('ai_agent.job_store', 'ERROR', True)]
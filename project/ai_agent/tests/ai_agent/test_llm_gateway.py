@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ai_agent.llm_gateway import (
+    BATCH, INTERACTIVE, LLMGateway, PriorityGate, StubProvider, TokenBucket, process_share,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimited(Exception):
+    pass
+
+
+class FlakyProvider(StubProvider):
+    """Fails with a retryable error the first `failures` calls"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def complete(self, messages, **options):
+        if self.failures:
+            self.failures -= 1
+            raise RateLimited()
+        return super().complete(messages, **options)
+
+    def is_retryable(self, error):
+        return isinstance(error, RateLimited)
+
+
+def test_token_bucket_makes_callers_wait_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    clock.now = 2.0
+    assert bucket.reserve(1) == 0
+
+
+def test_interactive_waiters_are_admitted_before_batch():
+    gate = PriorityGate(1)
+    gate.acquire(0)
+    admitted = []
+
+    def wait(priority, name):
+        gate.acquire(priority)
+        admitted.append(name)
+        gate.release()
+
+    threads = [threading.Thread(target=wait, args=(1, 'batch'))]
+    threads[0].start()
+    while gate.waiting < 1:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=wait, args=(0, 'interactive')))
+    threads[1].start()
+    while gate.waiting < 2:
+        time.sleep(0.001)
+    gate.release()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert admitted == ['interactive', 'batch']
+
+
+def test_requests_per_minute_are_enforced():
+    clock = FakeClock()
+    gateway = LLMGateway(StubProvider(), rpm=60, clock=clock, sleep=clock.sleep)
+    messages = [{'role': 'user', 'content': 'hi'}]
+
+    for _ in range(61):
+        gateway.complete(messages, priority=BATCH)
+
+    assert clock.now == pytest.approx(1.0)
+    assert gateway.stats()['classes']['batch']['throttled'] == 1
+
+
+def test_retryable_errors_back_off_and_retry():
+    clock = FakeClock()
+    gateway = LLMGateway(FlakyProvider(failures=2), clock=clock, sleep=clock.sleep)
+
+    reply = gateway.complete([{'role': 'user', 'content': 'hi'}])
+
+    assert reply.startswith('Stub reply')
+    # Backoff of 1s, then 2s
+    assert clock.now == pytest.approx(3.0)
+    assert gateway.stats()['classes']['interactive']['retries'] == 2
+
+
+def test_stub_stream_matches_completion_and_records_usage():
+    gateway = LLMGateway(StubProvider())
+    messages = [{'role': 'user', 'content': 'what does task 3 mean?'}]
+
+    streamed = ''.join(gateway.stream(messages, model='m'))
+
+    assert streamed == gateway.complete(messages, model='m')
+    stats = gateway.stats()['classes'][INTERACTIVE]
+    assert stats['requests'] == 2
+    assert stats['prompt_tokens'] > 0 and stats['completion_tokens'] > 0
+    assert gateway.stats()['in_flight'] == 0
+
+
+def test_async_entry_points_share_the_gateway():
+    gateway = LLMGateway(StubProvider())
+    messages = [{'role': 'user', 'content': 'what does task 3 mean?'}]
+
+    async def run():
+        streamed = [delta async for delta in gateway.stream_async(messages, priority=BATCH)]
+        return ''.join(streamed), await gateway.complete_async(messages, priority=BATCH)
+
+    streamed, completed = asyncio.run(run())
+
+    assert streamed == completed
+    assert gateway.stats()['classes'][BATCH]['requests'] == 2
+    assert gateway.stats()['in_flight'] == 0
+
+
+def test_budgets_are_split_between_processes():
+    assert process_share(500, 9) == 55
+    assert process_share(200000, 4) == 50000
+    assert process_share(0, 4) == 0
+    assert process_share(5, 9) == 1
+
+
+def test_retries_reserve_the_budget_once_and_failures_refund_it():
+    clock = FakeClock()
+    # The clock stands still, so the bucket does not refill
+    gateway = LLMGateway(FlakyProvider(failures=4), tpm=10000, rpm=100, max_retries=3,
+                         clock=clock, sleep=lambda seconds: None)
+    messages = [{'role': 'user', 'content': 'hi'}]
+
+    with pytest.raises(RateLimited):
+        gateway.complete(messages, max_tokens=1000)
+
+    # Four attempts, one request reserved, no tokens used: the reservation is back
+    stats = gateway.stats()
+    assert stats['classes']['interactive']['retries'] == 3
+    assert stats['requests_available'] == 99
+    assert stats['tokens_available'] == 10000
@@ -0,0 +1,35 @@
+from unittest.mock import MagicMock
+from ai_agent.message_buffer import RecentMessageBuffer
+
+def test_backfills_once_and_keeps_latest():
+    loader = MagicMock(return_value=[{'id': 1}, {'id': 2}])
+    buffer = RecentMessageBuffer(size=3, loader=loader)
+
+    assert buffer.get('c1') == [{'id': 1}, {'id': 2}]
+    buffer.append('c1', {'id': 3})
+    buffer.append('c1', {'id': 4})
+    # Duplicate broadcasts of the same row are ignored
+    buffer.append('c1', {'id': 4})
+
+    assert buffer.get('c1') == [{'id': 2}, {'id': 3}, {'id': 4}]
+    assert buffer.get('c1', 2) == [{'id': 3}, {'id': 4}]
+    loader.assert_called_once_with('c1', 3)
+
+def test_append_to_cold_channel_is_ignored():
+    buffer = RecentMessageBuffer(size=3, loader=lambda channel_id, limit: [])
+    buffer.append('c1', {'id': 1})
+    assert buffer.stats()['channels'] == 0
+
+def test_evicts_least_recently_used_channel():
+    loader = MagicMock(return_value=[])
+    buffer = RecentMessageBuffer(size=3, max_channels=2, loader=loader)
+    buffer.get('c1')
+    buffer.get('c2')
+    buffer.get('c1')
+    buffer.get('c3')
+
+    assert buffer.stats()['channels'] == 2
+    buffer.get('c1')
+    buffer.get('c2')
+    # c2 was evicted and has to be loaded again, c1 was not
+    assert [call.args[0] for call in loader.call_args_list] == ['c1', 'c2', 'c3', 'c2']
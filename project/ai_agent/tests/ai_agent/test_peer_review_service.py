@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from ai_agent import peer_review_service
+
+
+@pytest.fixture(autouse=True)
+def clear_analysis_cache():
+    peer_review_service.analysis_cache.clear()
+
+
+@pytest.fixture
+def client():
+    peer_review_service.app.config['TESTING'] = True
+    with peer_review_service.app.test_client() as client:
+        yield client
+
+
+def test_analyze_collects_data_concurrently(client, mocker):
+    prs = peer_review_service.prs
+    members = MagicMock(data=[{'member_zid': 'z1111111'}, {'member_zid': 'z2222222'}])
+    aggregates = [{'reviewee_zid': 'z2222222', 'review_count': 2, 'score_sum': 14.0, 'score_sumsq': 100.0,
+                   'score_min': 6.0, 'score_max': 8.0}]
+
+    def delayed(value):
+        def collect(*args):
+            time.sleep(0.2)
+            return value
+        return collect
+
+    pairs = [{'reviewer_zid': 'z1111111', 'reviewee_zid': 'z2222222', 'score': 8},
+             {'reviewer_zid': 'z2222222', 'reviewee_zid': 'z2222222', 'score': 9}]
+    tables = {name: MagicMock() for name in ('group_members', 'peer_review_aggregates', 'peer_reviews',
+                                             'contribution_analyses')}
+    tables['contribution_analyses'].select.return_value.eq.return_value.eq.return_value.eq.return_value \
+        .order.return_value.limit.return_value.execute.return_value = MagicMock(data=[])
+    tables['group_members'].select.return_value.eq.return_value.execute.return_value = members
+    for name, rows in (('peer_review_aggregates', aggregates), ('peer_reviews', pairs)):
+        tables[name].select.return_value.eq.return_value.eq.return_value.execute.side_effect = \
+            lambda rows=rows: (time.sleep(0.2), MagicMock(data=rows))[1]
+    supabase = MagicMock()
+    supabase.table.side_effect = lambda name: tables.setdefault(name, MagicMock())
+    mocker.patch.object(prs, 'supabase', supabase)
+    mocker.patch.object(prs, '_get_meeting_attendance', delayed({}))
+    mocker.patch.object(prs, '_get_task_completion', delayed({}))
+    mocker.patch.object(prs, '_get_channel_activity', delayed({}))
+    mocker.patch.object(prs, '_ai_analyze_contributions', return_value='Summary: fine')
+
+    response = client.post('/api/peer-reviews/analyze',
+                           json={'group_id': '1', 'assignment_id': '2', 'review_patterns': True})
+
+    data = response.get_json()['data']
+    timings = data['timings']
+    assert set(timings['collectors']) == {'attendance', 'tasks', 'channel_activity', 'reviews', 'review_patterns'}
+    # Five 200 ms collectors overlap instead of adding up
+    assert timings['total_ms'] < 600
+    assert data['analysis']['average_scores'] == {'z1111111': 0.0, 'z2222222': 7.0}
+    assert data['analysis']['review_stats']['z2222222'] == {'count': 2, 'mean': 7.0, 'stdev': 1.4142,
+                                                             'min': 6.0, 'max': 8.0}
+    supabase.table.assert_any_call('peer_review_aggregates')
+    assert data['analysis']['weighted_scores'] == {'z1111111': 0.0, 'z2222222': 8.0}
+    assert data['analysis']['review_patterns']['self_inflation'] == {
+        'z2222222': {'self_score': 9.0, 'others_mean': 8.0, 'inflation': 1.0}}
+
+    # By default only the aggregates are read, not every review
+    peer_review_service.analysis_cache.clear()
+    supabase.table.reset_mock()
+    data = client.post('/api/peer-reviews/analyze', json={'group_id': '1', 'assignment_id': '2'}).get_json()['data']
+    assert 'review_patterns' not in data['timings']['collectors']
+    assert 'weighted_scores' not in data['analysis'] and 'review_patterns' not in data['analysis']
+    assert 'peer_reviews' not in [call.args[0] for call in supabase.table.call_args_list]
+
+
+def test_analysis_job_runs_in_background(client, mocker):
+    release = threading.Event()
+
+    def analysis(group_id, assignment_id, progress, refresh=False, review_patterns=False):
+        progress(0.4, 'analyzing')
+        release.wait(5)
+        return {'analysis': {'average_scores': {'z1111111': 7.5}}}
+
+    mocker.patch.object(peer_review_service, 'run_contribution_analysis', side_effect=analysis)
+
+    first = client.post('/api/peer-reviews/analyze/jobs', json={'group_id': '7', 'assignment_id': '3'})
+    second = client.post('/api/peer-reviews/analyze/jobs', json={'group_id': '7', 'assignment_id': '3'})
+
+    assert first.status_code == second.status_code == 202
+    job_id = first.get_json()['data']['job_id']
+    assert second.get_json()['data']['job_id'] == job_id
+    assert second.get_json()['data']['deduplicated'] is True
+    assert first.headers['Location'].endswith(job_id)
+
+    release.set()
+    peer_review_service.analysis_jobs.join()
+    job = client.get(f'/api/peer-reviews/analyze/jobs/{job_id}').get_json()['data']
+    assert job['status'] == 'succeeded'
+    assert job['result'] == {'analysis': {'average_scores': {'z1111111': 7.5}}}
+    assert peer_review_service.run_contribution_analysis.call_count == 1
+
+    assert client.get('/api/peer-reviews/analyze/jobs/missing').status_code == 404
+
+
+def test_cohort_analysis_streams_json_lines(client, mocker):
+    events = [{'event': 'started', 'groups': 1}, {'event': 'group', 'group_id': 1}, {'event': 'finished'}]
+    mocker.patch.object(peer_review_service, 'analyze_cohort', return_value=iter(events))
+
+    response = client.post('/api/peer-reviews/analyze/cohort', json={'course_code': 'COMP9900', 'assignment_id': '1'})
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == events
+    assert client.post('/api/peer-reviews/analyze/cohort', json={'course_code': 'COMP9900'}).status_code == 400
+
+
+def test_course_analytics_uses_the_score_matrix(client, mocker):
+    reviews = [{'group_id': 1, 'reviewer_zid': 'z1', 'reviewee_zid': 'z2', 'score': 6},
+               {'group_id': 1, 'reviewer_zid': 'z2', 'reviewee_zid': 'z1', 'score': 8}]
+    mocker.patch.object(peer_review_service, 'fetch_course_reviews', return_value=(reviews, {'z3': 1}))
+
+    response = client.get('/api/peer-reviews/analytics/course/COMP9900/assignment/1')
+
+    data = response.get_json()['data']
+    assert data['students'] == 3 and data['reviews'] == 2
+    assert data['received']['z1']['mean'] == 8.0
+    assert data['reciprocity']['mutual_pairs'] == 1
+    assert client.get('/api/peer-reviews/analytics/course/COMP9900/assignment/1?z_threshold=x').status_code == 400
+
+
+def test_course_analytics_reports_bad_review_rows_as_server_errors(client, mocker):
+    reviews = [{'group_id': 1, 'reviewer_zid': 'z1', 'reviewee_zid': 'z2', 'score': 'n/a'}]
+    mocker.patch.object(peer_review_service, 'fetch_course_reviews', return_value=(reviews, {}))
+
+    response = client.get('/api/peer-reviews/analytics/course/COMP9900/assignment/1')
+
+    assert response.status_code == 500
+
+
+def test_unchanged_inputs_reuse_the_stored_analysis(client, mocker):
+    prs = peer_review_service.prs
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.execute.return_value = \
+        MagicMock(data=[{'member_zid': 'z1111111'}])
+    stored = supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.eq.return_value \
+        .order.return_value.limit.return_value.execute
+    stored.return_value = MagicMock(data=[])
+    mocker.patch.object(prs, 'supabase', supabase)
+    mocker.patch.object(prs, '_get_meeting_attendance', return_value={})
+    mocker.patch.object(prs, '_get_task_completion', return_value={})
+    mocker.patch.object(prs, '_get_channel_activity', return_value={})
+    mocker.patch.object(prs, '_get_review_aggregates', return_value=[])
+    ai = mocker.patch.object(prs, '_ai_analyze_contributions', return_value='Summary: fine')
+    save = mocker.patch.object(prs, '_save_analysis_result')
+    body = {'group_id': '1', 'assignment_id': '2'}
+
+    first = client.post('/api/peer-reviews/analyze', json=body).get_json()['data']
+    second = client.post('/api/peer-reviews/analyze', json=body).get_json()['data']
+
+    assert (first['cache']['hit'], second['cache']['source']) == (False, 'memory')
+    assert second['full_ai_analysis'] == 'Summary: fine'
+    assert ai.call_count == save.call_count == 1
+    assert save.call_args.kwargs['fingerprint'] == first['cache']['fingerprint']
+
+    # Another worker process finds it among the saved analyses
+    peer_review_service.analysis_cache.clear()
+    stored.return_value = MagicMock(data=[{'ai_analysis': 'Summary: fine'}])
+    assert client.post('/api/peer-reviews/analyze', json=body).get_json()['data']['cache']['source'] == 'database'
+
+    # A changed input is a different fingerprint, refresh skips the cache
+    stored.return_value = MagicMock(data=[])
+    prs._get_channel_activity.return_value = {'z1111111': {'message_count': 3}}
+    changed = client.post('/api/peer-reviews/analyze', json=body).get_json()['data']
+    refreshed = client.post('/api/peer-reviews/analyze', json={**body, 'refresh': True}).get_json()['data']
+    assert changed['cache']['hit'] is False and changed['cache']['fingerprint'] != first['cache']['fingerprint']
+    assert refreshed['cache']['hit'] is False
+    assert ai.call_count == 3
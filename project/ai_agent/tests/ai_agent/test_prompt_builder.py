@@ -0,0 +1,48 @@
+from ai_agent.prompt_builder import PromptBuilder, count_message_tokens, count_tokens, truncate_to_tokens
+
+
+def test_truncation_respects_token_count():
+    text = 'The quick brown fox jumps over the lazy dog. ' * 50
+
+    cut = truncate_to_tokens(text, 30)
+
+    assert text.startswith(cut)
+    assert count_tokens(cut) <= 30 < count_tokens(text)
+
+
+def test_least_important_section_is_truncated_first():
+    builder = PromptBuilder(200)
+    builder.add('You are a helpful teaching assistant.', role='system', required=True)
+    builder.add('Attendance: ' + 'present ' * 50, truncatable=True, priority=1, name='attendance')
+    builder.add('Activity: ' + 'message ' * 500, truncatable=True, priority=2, join=True, name='activity')
+
+    prompt = builder.build()
+
+    assert prompt.tokens <= 200
+    assert prompt.tokens == count_message_tokens(prompt.messages)
+    assert prompt.truncated == ['activity']
+    assert 'present ' * 50 in prompt.messages[1]['content']
+
+
+def test_droppable_sections_go_oldest_first():
+    builder = PromptBuilder(40)
+    builder.add('system', role='system', required=True)
+    for i in range(5):
+        builder.add(f'message {i} ' + 'word ' * 5, priority=2, name=f'context {i}')
+    builder.add('question?', required=True)
+
+    prompt = builder.build()
+
+    assert prompt.dropped == ['context 0', 'context 1', 'context 2']
+    assert prompt.messages[-1]['content'] == 'question?'
+
+
+def test_required_truncatable_section_is_shortened_not_dropped():
+    builder = PromptBuilder(100)
+    builder.add('Generate an agenda from this document:', required=True)
+    builder.add('lorem ipsum ' * 1000, join=True, truncatable=True, required=True, name='document')
+
+    prompt = builder.build()
+
+    assert prompt.truncated == ['document'] and not prompt.dropped
+    assert prompt.tokens <= 100
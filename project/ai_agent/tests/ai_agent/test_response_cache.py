@@ -0,0 +1,43 @@
+from ai_agent.response_cache import AssistantResponseCache, context_hash, normalize_question
+
+
+def test_questions_are_normalised():
+    assert normalize_question('@Assistant  What does   Task 3 mean?? ') == 'what does task 3 mean'
+
+
+def test_assistant_exchanges_do_not_change_the_context_hash():
+    discussion = [{'sender_zid': 'z1', 'content': 'starting task 3'}]
+    answered = discussion + [
+        {'sender_zid': 'z1', 'content': '@assistant what does task 3 mean?'},
+        {'sender_zid': 'AI_ASSISTANT', 'content': 'It means...'},
+    ]
+
+    assert context_hash(answered) == context_hash(discussion)
+    assert context_hash(discussion + [{'sender_zid': 'z2', 'content': 'new topic'}]) != context_hash(discussion)
+
+
+def test_evicted_channel_is_not_served():
+    cache = AssistantResponseCache()
+    key = cache.key('1', '@assistant hi', [])
+    cache.set(key, 'hello')
+    assert cache.get(cache.key('1', '@assistant HI', [])) == 'hello'
+
+    cache.evict_channel('1')
+    assert cache.get(cache.key('1', '@assistant hi', [])) is None
+    assert cache.stats()['hits'] == 1
+
+
+def test_bypass_prefix_is_stripped():
+    cache = AssistantResponseCache(bypass_prefix='!fresh')
+
+    assert cache.strip_bypass('@assistant !fresh due date?') == ('@assistant due date?', True)
+    assert cache.strip_bypass('@assistant due date?') == ('@assistant due date?', False)
+    assert cache.stats()['bypassed'] == 1
+
+
+def test_zero_size_disables_cache():
+    cache = AssistantResponseCache(max_entries=0)
+    key = cache.key('1', 'hi', [])
+    cache.set(key, 'hello')
+
+    assert cache.get(key) is None
@@ -0,0 +1,79 @@
+import statistics
+
+import numpy as np
+import pytest
+
+from ai_agent.score_matrix import ScoreMatrix, score_outliers, zscores
+
+
+def review(reviewer, reviewee, score, group_id=1):
+    return {'reviewer_zid': reviewer, 'reviewee_zid': reviewee, 'score': score, 'group_id': group_id}
+
+
+def test_score_outliers_match_the_statistics_module():
+    scores = {'a': 2.0, 'b': 7.0, 'c': 7.5, 'd': 8.0}
+    mean, std = statistics.mean(scores.values()), statistics.stdev(scores.values())
+
+    assert score_outliers(scores) == [zid for zid, s in scores.items() if abs(s - mean) / std > 1.0]
+    assert score_outliers({'a': 5.0, 'b': 5.0}) == []
+    assert zscores(np.array([3.0])).tolist() == [0.0]
+
+
+def test_dense_and_sparse_matrices_average_repeated_reviews():
+    matrix = ScoreMatrix([review('a', 'b', 6), review('a', 'b', 8), review('b', 'a', 5)])
+
+    dense = matrix.to_matrix(dense=True)
+    assert dense[0, 1] == 7.0 and dense[1, 0] == 5.0 and np.isnan(dense[0, 0])
+    pytest.importorskip('scipy')
+    assert matrix.to_matrix(dense=False).toarray().tolist() == [[0.0, 7.0], [5.0, 0.0]]
+
+
+def test_analyze_finds_bias_collusion_and_self_inflation():
+    reviews = [
+        # Group 1: a and b score each other far above what c and d give them
+        review('a', 'b', 10), review('b', 'a', 10),
+        review('c', 'a', 5), review('d', 'a', 6), review('c', 'b', 5), review('d', 'b', 4),
+        review('a', 'c', 6), review('b', 'c', 6), review('a', 'd', 6), review('b', 'd', 6),
+        review('c', 'd', 6), review('d', 'c', 6), review('c', 'c', 9),
+        # Group 2: e is much harsher than f and g
+        review('e', 'f', 2, 2), review('g', 'f', 8, 2), review('e', 'g', 2, 2), review('f', 'g', 8, 2),
+        review('f', 'e', 7, 2), review('g', 'e', 7, 2),
+    ]
+
+    result = ScoreMatrix(reviews, {'h': 2}).analyze(bias_threshold=1.0)
+
+    assert result['students'] == 8 and result['reviews'] == len(reviews)
+    assert [pair['zids'] for pair in result['collusion_pairs']] == [['a', 'b']]
+    assert result['collusion_pairs'][0]['group_id'] == 1
+    assert result['reviewer_bias']['e']['label'] == 'severe'
+    assert result['reviewer_bias']['e']['leniency'] == -6.0
+    assert result['self_inflation'] == {'c': {'self_score': 9.0, 'others_mean': 6.0, 'inflation': 3.0}}
+    # h has no reviews, so within group 2 their mean of 0 is the outlier
+    assert result['received']['h'] == {'count': 0, 'mean': 0.0, 'group_z': -1.4233}
+    assert 'h' in result['outliers']
+    assert result['reciprocity']['mutual_pairs'] == 9
+
+
+def test_reliability_discounts_a_hostile_reviewer():
+    true = {'a': 8.0, 'b': 6.0, 'c': 7.0, 'd': 9.0}
+    reviews = [review(r, e, 1.0 if r == 'd' else s) for r in true for e, s in true.items() if r != e]
+
+    result = ScoreMatrix(reviews).reliability()
+
+    assert result['converged']
+    weights = result['reviewer_weights']
+    assert weights['d'] < 0.5 < min(weights['a'], weights['b'], weights['c'])
+    plain = ScoreMatrix(reviews).analyze()['received']
+    for zid in 'abc':
+        # Much closer to the honest score than the plain mean that counts d's 1s
+        assert abs(result['weighted_scores'][zid] - true[zid]) < abs(plain[zid]['mean'] - true[zid]) / 2
+
+
+def test_reliability_without_scipy_gives_the_same_result(monkeypatch):
+    from ai_agent import score_matrix
+
+    reviews = [review(r, e, (ord(r) * 7 + ord(e) * 3) % 10) for r in 'abcde' for e in 'abcde' if r != e]
+    with_scipy = ScoreMatrix(reviews).reliability()
+    monkeypatch.setattr(score_matrix, 'sp', None)
+
+    assert ScoreMatrix(reviews).reliability() == with_scipy
@@ -0,0 +1,12 @@
+from ai_agent.serve import gunicorn_command
+
+def test_channel_service_runs_a_single_worker():
+    command = gunicorn_command('channel', 5002, workers=8)
+    assert command[-1] == 'channel_service:app'
+    assert command[command.index('--workers') + 1] == '1'
+    assert command[command.index('--bind') + 1] == '0.0.0.0:5002'
+
+def test_peer_review_workers_default_to_the_config():
+    assert '--workers' not in gunicorn_command('peer-review', 5003)
+    command = gunicorn_command('peer-review', 5003, workers=4)
+    assert command[command.index('--workers') + 1] == '4'
@@ -0,0 +1,59 @@
+import socket
+import time
+
+from ai_agent.socketio_backend import (
+    RemoteEmitHookMixin, UnixSocketBroker, create_client_manager, recv_frame, send_frame,
+)
+
+def connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    sock.connect(path)
+    return sock
+
+def test_broker_relays_frames_to_other_workers_only(tmp_path):
+    broker = UnixSocketBroker(str(tmp_path / 'broker.sock')).start()
+    try:
+        first = connect(broker.path)
+        second = connect(broker.path)
+        # connect() returns before the broker has registered the worker
+        deadline = time.monotonic() + 5
+        while broker.stats()['workers'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        send_frame(first, b'{"event": "new_message"}')
+
+        assert recv_frame(second) == b'{"event": "new_message"}'
+        first.settimeout(0.2)
+        try:
+            first.recv(1)
+            echoed = True
+        except socket.timeout:
+            echoed = False
+        assert not echoed
+        assert broker.stats()['frames'] == 1
+    finally:
+        broker.close()
+
+class RecordingManager:
+    host_id = 'this-worker'
+
+    def __init__(self):
+        self.handled = []
+
+    def _handle_emit(self, message):
+        self.handled.append(message)
+
+class HookedManager(RemoteEmitHookMixin, RecordingManager):
+    pass
+
+def test_only_emits_from_other_workers_reach_the_hook():
+    calls = []
+    manager = HookedManager()
+    manager.on_remote_emit = lambda *args: calls.append(args)
+
+    manager._handle_emit({'event': 'new_message', 'data': [{'id': 1}], 'room': 'c1', 'host_id': 'other-worker'})
+    manager._handle_emit({'event': 'new_message', 'data': [{'id': 2}], 'room': 'c1', 'host_id': 'this-worker'})
+
+    assert len(manager.handled) == 2
+    assert calls == [('new_message', {'id': 1}, 'c1')]
+    assert create_client_manager(None) is None
@@ -0,0 +1,38 @@
+from ai_agent.ttl_cache import TTLCache, MISSING
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_and_are_counted():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set('a', 1)
+
+    assert cache.get('a') == 1
+    clock.now = 11
+    assert cache.get('a') is MISSING
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+def test_get_or_load_calls_loader_once():
+    cache = TTLCache()
+    calls = []
+    loader = lambda: calls.append(1) or 'value'
+
+    assert cache.get_or_load('k', loader) == 'value'
+    assert cache.get_or_load('k', loader) == 'value'
+    assert len(calls) == 1
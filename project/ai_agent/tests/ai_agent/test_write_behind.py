@@ -0,0 +1,115 @@
+import threading
+from ai_agent.write_behind import MessageWriteBehind, is_provisional_id
+
+def _insert_with_ids(batches):
+    def insert_rows(rows):
+        batches.append(rows)
+        start = sum(len(b) for b in batches[:-1])
+        return [{**row, 'id': start + i + 1} for i, row in enumerate(rows)]
+    return insert_rows
+
+def test_batch_is_committed_when_full():
+    batches = []
+    committed = {}
+    done = threading.Event()
+
+    def on_commit(provisional_id, stored):
+        committed[provisional_id] = stored['id']
+        if len(committed) == 3:
+            done.set()
+
+    writer = MessageWriteBehind(_insert_with_ids(batches), on_commit=on_commit, max_batch=3, flush_interval=10)
+    provisional = [writer.add({'content': str(n)}) for n in range(3)]
+
+    assert all(is_provisional_id(m['id']) and m['provisional'] for m in provisional)
+    assert done.wait(5)
+    assert len(batches) == 1
+    assert [committed[m['id']] for m in provisional] == [1, 2, 3]
+    writer.close()
+
+def test_close_flushes_pending_rows():
+    batches = []
+    writer = MessageWriteBehind(_insert_with_ids(batches), max_batch=100, flush_interval=60)
+    writer.add({'content': 'a'})
+    writer.add({'content': 'b'})
+    writer.close()
+
+    assert [row['content'] for batch in batches for row in batch] == ['a', 'b']
+    assert writer.stats()['pending'] == 0
+
+def test_failed_batch_is_retried():
+    calls = []
+
+    def flaky_insert(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise RuntimeError('connection reset')
+        return [{**row, 'id': 1} for row in rows]
+
+    writer = MessageWriteBehind(flaky_insert, max_batch=100, flush_interval=60, retry_delay=0)
+    writer.add({'content': 'a'})
+    assert writer.flush() == 0
+    assert writer.flush() == 1
+    assert writer.stats()['failed_batches'] == 1
+    writer.close()
+
+def test_bad_row_only_fails_itself():
+    committed, dropped = [], []
+
+    def insert(rows):
+        if any(row['content'] == 'bad' for row in rows):
+            raise RuntimeError('violates check constraint')
+        return [{**row, 'id': row['content']} for row in rows]
+
+    writer = MessageWriteBehind(insert, on_commit=lambda pid, stored: committed.append(stored['id']),
+                                on_drop=lambda pid, row: dropped.append(pid),
+                                max_batch=100, flush_interval=60, max_attempts=2, retry_delay=0)
+    rows = [writer.add({'content': content}) for content in ('a', 'bad', 'b')]
+
+    assert writer.flush() == 2
+    assert committed == ['a', 'b'] and dropped == []
+    assert writer.flush() == 0
+    assert dropped == [rows[1]['id']]
+    assert writer.stats()['dropped'] == 1 and writer.stats()['pending'] == 0
+    writer.close()
+
+def test_failed_rows_back_off_before_retrying(mocker):
+    clock = mocker.patch('ai_agent.write_behind.time.monotonic', return_value=100.0)
+    calls = []
+
+    def insert(rows):
+        calls.append(len(rows))
+        raise RuntimeError('connection refused')
+
+    writer = MessageWriteBehind(insert, max_batch=100, flush_interval=60, max_attempts=3, retry_delay=1)
+    writer.add({'content': 'a'})
+    writer.flush()
+    assert writer.flush() == 0 and calls == [1]
+
+    clock.return_value = 101.0
+    writer.flush()
+    clock.return_value = 102.5
+    writer.flush()
+    assert calls == [1, 1]
+    clock.return_value = 103.0
+    writer.flush()
+    assert calls == [1, 1, 1] and writer.stats()['dropped'] == 1
+
+def test_rows_missing_from_the_insert_result_are_retried_then_dropped():
+    committed, dropped = [], []
+
+    def insert(rows):
+        # Returns the first row only, as if the others were filtered out
+        return [{**rows[0], 'id': rows[0]['content']}] if rows[0]['content'] == 'a' else []
+
+    writer = MessageWriteBehind(insert, on_commit=lambda pid, stored: committed.append(stored['id']),
+                                on_drop=lambda pid, row: dropped.append(row['content']),
+                                max_batch=100, flush_interval=60, max_attempts=2, retry_delay=0)
+    for content in ('a', 'b', 'c'):
+        writer.add({'content': content})
+
+    assert writer.flush() == 1
+    assert committed == ['a'] and writer.stats()['pending'] == 2
+    assert writer.flush() == 0
+    assert dropped == ['b', 'c'] and writer.stats()['pending'] == 0
+    writer.close()
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# Returned by TTLCache.get when the key is missing or expired
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe key/value cache with a time-to-live and LRU eviction.
+
+    Entries expire `ttl` seconds after they were set. When more than
+    `max_entries` keys are held, the least recently used one is dropped.
+    Hits, misses and evictions are counted for sizing.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            ttl: Seconds an entry stays valid
+            max_entries: Number of entries kept before LRU eviction
+            clock: Time source, replaceable in tests
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        # key -> (expires_at, value)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Get a value, or `default` if the key is missing or has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, optionally with its own time-to-live"""
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Get a value, calling `loader` and caching its result on a miss"""
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Like get_or_load(), for a coroutine loader"""
+        value = self.get(key)
+        if value is MISSING:
+            value = await loader()
+            self.set(key, value)
+        return value
+
+    def update(self, key: Hashable, func: Callable[[Any], Any]) -> None:
+        """Apply `func` to a cached value in place, keeping its expiry; missing keys are left alone"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], func(entry[1]))
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
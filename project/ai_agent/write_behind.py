@@ -0,0 +1,221 @@
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROVISIONAL_ID_PREFIX = "tmp-"
+
+
+def is_provisional_id(message_id) -> bool:
+    """True for IDs handed out before the row has been committed"""
+    return isinstance(message_id, str) and message_id.startswith(PROVISIONAL_ID_PREFIX)
+
+
+def _spawn_thread(target: Callable, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+class MessageWriteBehind:
+    """
+    Write-behind buffer that group-commits rows with bulk inserts.
+
+    add() returns the row at once with a provisional ID. Pending rows are
+    written in one insert when `max_batch` rows are waiting or
+    `flush_interval` seconds have passed, whichever comes first. After each
+    commit `on_commit(provisional_id, stored_row)` is called for every row so
+    the caller can reconcile the real ID. When a bulk insert fails, its rows
+    are inserted one at a time so a bad row only fails itself; rows that
+    still fail are retried with exponential backoff and, after
+    `max_attempts`, given to `on_drop(provisional_id, row)`. close() flushes
+    whatever is left.
+    """
+
+    def __init__(self, insert_rows: Callable[[List[dict]], List[dict]],
+                 on_commit: Optional[Callable[[str, dict], None]] = None,
+                 max_batch: int = 50, flush_interval: float = 0.05, max_attempts: int = 5,
+                 retry_delay: float = 0.5, on_drop: Optional[Callable[[str, dict], None]] = None,
+                 spawn: Optional[Callable] = None):
+        """
+        Args:
+            insert_rows: Function inserting a list of rows in one call and returning
+                the stored rows in the same order
+            on_commit: Function called with (provisional_id, stored_row) after a commit
+            max_batch: Number of pending rows that triggers an immediate flush
+            flush_interval: Longest time in seconds a row waits before being flushed
+            max_attempts: Number of times a row is tried before it is dropped
+            retry_delay: Seconds before the first retry of a failed row, doubled on
+                every further attempt
+            on_drop: Function called with (provisional_id, row) for every dropped row
+            spawn: Function (target, *args) that starts a background task.
+                Defaults to a daemon thread
+        """
+        self.insert_rows = insert_rows
+        self.on_commit = on_commit
+        self.on_drop = on_drop
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._spawn = spawn or _spawn_thread
+        # Pending entries are (provisional_id, row, attempts, monotonic time of the next attempt)
+        self._pending: List[Tuple[str, dict, int, float]] = []
+        self._condition = threading.Condition()
+        # Serialises flushes so batches are committed in order
+        self._flush_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._committed = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._failed_rows = 0
+        self._dropped = 0
+
+    def _ensure_started(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        self._spawn(self._run)
+
+    def add(self, row: dict) -> dict:
+        """
+        Queue a row for insertion.
+
+        Returns:
+            Copy of the row with a provisional "id" and "provisional": True
+        """
+        provisional_id = f"{PROVISIONAL_ID_PREFIX}{uuid.uuid4()}"
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            self._ensure_started()
+            self._pending.append((provisional_id, dict(row), 0, 0.0))
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify()
+        return {**row, "id": provisional_id, "provisional": True}
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._pending and not self._closed:
+                    # Sleep until the first row of the next batch arrives
+                    self._condition.wait()
+                if self._closed:
+                    # close() flushes the rest in the caller
+                    return
+                if len(self._pending) < self.max_batch:
+                    # Give the batch up to flush_interval to fill up; rows waiting
+                    # for a retry are skipped by flush() until they are due
+                    self._condition.wait(self.flush_interval)
+            self.flush()
+
+    def _insert_one_by_one(self, batch):
+        """Insert the rows of a failed batch separately; returns (committed pairs, failed entries)"""
+        if len(batch) == 1:
+            return [], batch
+        committed, failed = [], []
+        for entry in batch:
+            try:
+                stored = self.insert_rows([entry[1]]) or []
+            except Exception as e:
+                print(f"Error committing buffered message {entry[0]}: {str(e)}")
+                failed.append(entry)
+                continue
+            if stored:
+                committed.append((entry, stored[0]))
+            else:
+                failed.append(entry)
+        return committed, failed
+
+    def flush(self) -> int:
+        """
+        Commit the pending rows that are not waiting for a retry.
+
+        Returns:
+            Number of rows committed
+        """
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._condition:
+                batch = [entry for entry in self._pending if entry[3] <= now]
+                if not batch:
+                    return 0
+                self._pending = [entry for entry in self._pending if entry[3] > now]
+            try:
+                stored_rows = self.insert_rows([entry[1] for entry in batch]) or []
+                # Rows the insert did not return are retried like failed ones
+                committed, failed = list(zip(batch, stored_rows)), batch[len(stored_rows):]
+            except Exception as e:
+                print(f"Error committing {len(batch)} buffered messages: {str(e)}")
+                traceback.print_exc()
+                with self._condition:
+                    self._failed_batches += 1
+                committed, failed = self._insert_one_by_one(batch)
+
+            retry, dropped = [], []
+            for provisional_id, row, attempts, _ in failed:
+                if attempts + 1 < self.max_attempts:
+                    retry_at = time.monotonic() + self.retry_delay * 2 ** attempts
+                    retry.append((provisional_id, row, attempts + 1, retry_at))
+                else:
+                    dropped.append((provisional_id, row))
+            with self._condition:
+                if committed:
+                    self._batches += 1
+                self._committed += len(committed)
+                self._failed_rows += len(failed)
+                self._dropped += len(dropped)
+                # Failed rows go back in front so the order is kept
+                self._pending = retry + self._pending
+
+            if self.on_commit:
+                for (provisional_id, _, _, _), stored in committed:
+                    try:
+                        self.on_commit(provisional_id, stored)
+                    except Exception as e:
+                        print(f"Error reconciling message {provisional_id}: {str(e)}")
+                        traceback.print_exc()
+            for provisional_id, row in dropped:
+                print(f"Dropped buffered message {provisional_id} after {self.max_attempts} attempts")
+                if self.on_drop:
+                    try:
+                        self.on_drop(provisional_id, row)
+                    except Exception as e:
+                        print(f"Error reporting dropped message {provisional_id}: {str(e)}")
+                        traceback.print_exc()
+            return len(committed)
+
+    def close(self) -> None:
+        """Stop accepting rows and flush everything that is still pending"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        # Flush in the caller so shutdown does not depend on the background task;
+        # every row is tried until it is committed or dropped
+        while True:
+            with self._condition:
+                if not self._pending:
+                    return
+                wait = min(entry[3] for entry in self._pending) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.flush()
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        """Pending rows and commit counters"""
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "committed": self._committed,
+                "batches": self._batches,
+                "failed_batches": self._failed_batches,
+                "failed_rows": self._failed_rows,
+                "dropped": self._dropped,
+                "max_batch": self.max_batch,
+            }
@@ -0,0 +1,91 @@
+-- Supabase objects used by the channel service (ai_agent/channel_service.py)
+
+-- Keyset pagination of channel history walks (channel_id, sent_at, id)
+CREATE INDEX IF NOT EXISTS idx_channel_messages_channel_sent
+    ON channel_messages(channel_id, sent_at DESC, id DESC);
+
+-- Channel listing for a user embeds channel_members with an inner join
+CREATE INDEX IF NOT EXISTS idx_channel_members_zid
+    ON channel_members(zid, channel_id);
+
+-- updated_at backs the updated_since filter of GET /api/channels.
+-- It moves when a channel changes and when a member joins or leaves it,
+-- so a user's sidebar also picks up channels they were just added to.
+ALTER TABLE channels ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_channels_updated_at ON channels(updated_at);
+
+CREATE OR REPLACE FUNCTION touch_channel_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_channels_updated_at ON channels;
+CREATE TRIGGER trg_channels_updated_at
+    BEFORE UPDATE ON channels
+    FOR EACH ROW EXECUTE FUNCTION touch_channel_updated_at();
+
+CREATE OR REPLACE FUNCTION touch_channel_on_membership() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE channels SET updated_at = CURRENT_TIMESTAMP
+    WHERE id = COALESCE(NEW.channel_id, OLD.channel_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_channel_members_touch ON channel_members;
+CREATE TRIGGER trg_channel_members_touch
+    AFTER INSERT OR DELETE ON channel_members
+    FOR EACH ROW EXECUTE FUNCTION touch_channel_on_membership();
+
+-- Tombstones for the updated_since sync of GET /api/channels: a row per
+-- member who left a channel (zid set) and per deleted channel (zid NULL).
+-- Rejoining removes the member's tombstone. Rows may be purged once they are
+-- older than any client's last sync; a client offline for longer than that
+-- has to refresh its full channel list.
+CREATE TABLE IF NOT EXISTS channel_removals (
+    channel_id INTEGER NOT NULL,
+    zid VARCHAR(8),
+    removed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_channel_removals_zid ON channel_removals(zid, removed_at);
+
+CREATE OR REPLACE FUNCTION track_channel_removals() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'channels' THEN
+        DELETE FROM channel_removals WHERE channel_id = OLD.id AND zid IS NULL;
+        INSERT INTO channel_removals (channel_id, zid) VALUES (OLD.id, NULL);
+        RETURN NULL;
+    END IF;
+    DELETE FROM channel_removals
+    WHERE channel_id = COALESCE(NEW.channel_id, OLD.channel_id) AND zid = COALESCE(NEW.zid, OLD.zid);
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO channel_removals (channel_id, zid) VALUES (OLD.channel_id, OLD.zid);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_channel_members_removals ON channel_members;
+CREATE TRIGGER trg_channel_members_removals
+    AFTER INSERT OR DELETE ON channel_members
+    FOR EACH ROW EXECUTE FUNCTION track_channel_removals();
+
+DROP TRIGGER IF EXISTS trg_channels_removals ON channels;
+CREATE TRIGGER trg_channels_removals
+    AFTER DELETE ON channels
+    FOR EACH ROW EXECUTE FUNCTION track_channel_removals();
+
+-- Rolling summary of each channel's discussion, used as AI assistant context.
+-- Refreshed every CHANNEL_SUMMARY_EVERY messages. It lives in its own table,
+-- so refreshing it does not move channels.updated_at.
+CREATE TABLE IF NOT EXISTS channel_summaries (
+    channel_id INTEGER PRIMARY KEY REFERENCES channels(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL,
+    -- (sent_at, id) key of the last message folded into the summary
+    last_message_id INTEGER,
+    last_sent_at TIMESTAMP WITH TIME ZONE,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
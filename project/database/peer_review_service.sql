@@ -0,0 +1,99 @@
+-- Supabase objects used by the peer review service (ai_agent/peer_review_service.py)
+
+-- Running score aggregates per reviewee, so an analysis reads one row per
+-- member instead of every review of the group. Kept up to date by the
+-- trigger below; rebuild_peer_review_aggregates() recomputes them.
+CREATE TABLE IF NOT EXISTS peer_review_aggregates (
+    group_id INTEGER NOT NULL,
+    assignment_id INTEGER NOT NULL,
+    reviewee_zid VARCHAR(8) NOT NULL,
+    review_count INTEGER NOT NULL DEFAULT 0,
+    score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    score_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    score_min DOUBLE PRECISION,
+    score_max DOUBLE PRECISION,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (group_id, assignment_id, reviewee_zid)
+);
+
+CREATE INDEX IF NOT EXISTS idx_peer_reviews_group_assignment_reviewee
+    ON peer_reviews(group_id, assignment_id, reviewee_zid);
+
+-- Recompute the aggregates of one reviewee from its reviews
+CREATE OR REPLACE FUNCTION refresh_peer_review_aggregate(p_group_id INTEGER, p_assignment_id INTEGER,
+                                                         p_reviewee_zid VARCHAR) RETURNS VOID AS $$
+BEGIN
+    DELETE FROM peer_review_aggregates
+    WHERE group_id = p_group_id AND assignment_id = p_assignment_id AND reviewee_zid = p_reviewee_zid;
+    INSERT INTO peer_review_aggregates
+        (group_id, assignment_id, reviewee_zid, review_count, score_sum, score_sumsq, score_min, score_max)
+    SELECT group_id, assignment_id, reviewee_zid, COUNT(*), SUM(score), SUM(score * score), MIN(score), MAX(score)
+    FROM peer_reviews
+    WHERE group_id = p_group_id AND assignment_id = p_assignment_id AND reviewee_zid = p_reviewee_zid
+    GROUP BY group_id, assignment_id, reviewee_zid;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A new review is added to the running totals in O(1). Min and max cannot be
+-- taken back, so an edited or deleted review recomputes its reviewee's row.
+CREATE OR REPLACE FUNCTION track_peer_review_aggregates() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO peer_review_aggregates AS a
+            (group_id, assignment_id, reviewee_zid, review_count, score_sum, score_sumsq, score_min, score_max)
+        VALUES (NEW.group_id, NEW.assignment_id, NEW.reviewee_zid, 1, NEW.score, NEW.score * NEW.score,
+                NEW.score, NEW.score)
+        ON CONFLICT (group_id, assignment_id, reviewee_zid) DO UPDATE SET
+            review_count = a.review_count + 1,
+            score_sum = a.score_sum + EXCLUDED.score_sum,
+            score_sumsq = a.score_sumsq + EXCLUDED.score_sumsq,
+            score_min = LEAST(a.score_min, EXCLUDED.score_min),
+            score_max = GREATEST(a.score_max, EXCLUDED.score_max),
+            updated_at = CURRENT_TIMESTAMP;
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_peer_review_aggregate(OLD.group_id, OLD.assignment_id, OLD.reviewee_zid);
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_peer_review_aggregate(NEW.group_id, NEW.assignment_id, NEW.reviewee_zid);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_peer_reviews_aggregates ON peer_reviews;
+CREATE TRIGGER trg_peer_reviews_aggregates
+    AFTER INSERT OR UPDATE OR DELETE ON peer_reviews
+    FOR EACH ROW EXECUTE FUNCTION track_peer_review_aggregates();
+
+-- Rebuild the aggregates from peer_reviews, for one group and/or assignment
+-- or (both NULL) for all of them. Returns the number of rows written.
+-- Used by reconcile_review_aggregates.py.
+CREATE OR REPLACE FUNCTION rebuild_peer_review_aggregates(p_group_id INTEGER DEFAULT NULL,
+                                                          p_assignment_id INTEGER DEFAULT NULL) RETURNS INTEGER AS $$
+DECLARE
+    written INTEGER;
+BEGIN
+    -- Block new reviews until the rebuild commits, so none is counted twice or lost
+    LOCK TABLE peer_reviews IN SHARE MODE;
+    DELETE FROM peer_review_aggregates
+    WHERE (p_group_id IS NULL OR group_id = p_group_id)
+      AND (p_assignment_id IS NULL OR assignment_id = p_assignment_id);
+    INSERT INTO peer_review_aggregates
+        (group_id, assignment_id, reviewee_zid, review_count, score_sum, score_sumsq, score_min, score_max)
+    SELECT group_id, assignment_id, reviewee_zid, COUNT(*), SUM(score), SUM(score * score), MIN(score), MAX(score)
+    FROM peer_reviews
+    WHERE (p_group_id IS NULL OR group_id = p_group_id)
+      AND (p_assignment_id IS NULL OR assignment_id = p_assignment_id)
+    GROUP BY group_id, assignment_id, reviewee_zid;
+    GET DIAGNOSTICS written = ROW_COUNT;
+    RETURN written;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Analyses are reused while their inputs are unchanged: input_fingerprint is a
+-- hash of everything the AI analysis was made from (NULL when the AI call
+-- failed), ai_analysis the model's full answer.
+ALTER TABLE contribution_analyses ADD COLUMN IF NOT EXISTS ai_analysis TEXT;
+ALTER TABLE contribution_analyses ADD COLUMN IF NOT EXISTS input_fingerprint VARCHAR(64);
+CREATE INDEX IF NOT EXISTS idx_contribution_analyses_fingerprint
+    ON contribution_analyses(group_id, assignment_id, input_fingerprint, created_at DESC);